@@ -5,6 +5,8 @@ from typing import List, Dict, Any
 from django.core.files.base import ContentFile
 from django.core.files.storage import default_storage
 from django.contrib.auth.models import User
+from django.db.models import Count, IntegerField, OuterRef, Prefetch, Subquery
+from django.db.models.functions import Coalesce
 
 from rest_framework import serializers
 
@@ -54,6 +56,8 @@ class SubjectSerializer(serializers.Serializer):
     tests_count = serializers.SerializerMethodField()
 
     def get_tests_count(self, subject):
+        if hasattr(subject, "tests_count"):
+            return subject.tests_count
         return subject.tests.count()
 
     def create(self, validated_data):
@@ -84,7 +88,48 @@ class TestSerializer(serializers.Serializer):
     subject_id = serializers.IntegerField(write_only=True)
     author_id = serializers.IntegerField(write_only=True)
 
+    @staticmethod
+    def prefetch(tests):
+        """
+        Load everything serialized tests need along with tests, so listing
+        costs a constant number of queries instead of several per test
+
+        :param tests: queryset of <Test>
+        :return: queryset with questions number, subjects with tests number,
+        authors and running testing results with lecturers who launched them
+        """
+        questions_num = (
+            Question.objects.filter(test=OuterRef("pk"))
+            .order_by()
+            .values("test")
+            .annotate(count=Count("id"))
+            .values("count")
+        )
+        return (
+            tests.select_related("author")
+            .annotate(
+                questions_count=Coalesce(
+                    Subquery(questions_num, output_field=IntegerField()), 0
+                )
+            )
+            .prefetch_related(
+                Prefetch(
+                    "subject",
+                    queryset=Subject.objects.annotate(tests_count=Count("tests")),
+                ),
+                Prefetch(
+                    "testing_results",
+                    queryset=TestResult.objects.filter(is_running=True)
+                    .select_related("launched_lecturer")
+                    .order_by("id"),
+                    to_attr="running_results",
+                ),
+            )
+        )
+
     def get_questions_num(self, test) -> int:
+        if hasattr(test, "questions_count"):
+            return test.questions_count
         return test.questions.count()
 
     def create(self, validated_data):
@@ -109,9 +154,12 @@ class TestSerializer(serializers.Serializer):
 
     def to_representation(self, test):
         representation = super().to_representation(test)
-        test_results = TestResult.objects.filter(
-            is_running=True, test__id=test.id
-        ).first()
+        if hasattr(test, "running_results"):
+            test_results = next(iter(test.running_results), None)
+        else:
+            test_results = TestResult.objects.filter(
+                is_running=True, test__id=test.id
+            ).first()
         if test_results:
             representation["launched_lecturer"] = {
                 "id": test_results.launched_lecturer.id,
@@ -185,6 +233,8 @@ class QuestionSerializer(serializers.Serializer):
 
     def update(self, instance, validated_data):
         instance.formulation = validated_data.get("formulation", instance.formulation)
+        if "test_id" in validated_data:
+            instance.test = Test.objects.get(id=validated_data["test_id"])
         options = validated_data.get("options")
         if options:
             for option in options:
@@ -24,10 +24,17 @@ urlpatterns = [
     ),
     path("tests_results/", views.TestsResultAPI.as_view(), name="tests_results_api"),
     path("user_results/", views.UserResultAPI.as_view(), name="user_results_api"),
+    path("user_results/regrade", views.RegradeAPI.as_view(), name="regrade_api"),
     path("running_tests/", views.RunningTestAPI.as_view(), name="get_running_tests"),
+    path(
+        "running_tests/<int:testing_result_id>/aggregates",
+        views.RunningTestAggregatesAPI.as_view(),
+        name="running_test_aggregates",
+    ),
     path(
         "analysis/questions",
         views.QuestionAnalysisAPI.as_view(),
         name="question_analysis_api",
     ),
+    path("metrics/", views.MetricsAPI.as_view(), name="metrics_api"),
 ]
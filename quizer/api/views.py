@@ -1,9 +1,19 @@
+from django.conf import settings
+from django.db import transaction
+from django.db.models import Count
 from rest_framework.generics import get_object_or_404
+from rest_framework import status
 from rest_framework.permissions import IsAuthenticated
 from rest_framework.response import Response
 from rest_framework.views import APIView
 
-from main import utils
+from main import events, utils
+from main.aggregates import aggregates_cache
+from main.grading import regrade_results
+from main.metrics import metrics
+from main.middleware import exam_admission
+from main.pool import questions_pool
+from main.variants import generate_variants, invalidate_variants
 from main.models import (
     Profile,
     Subject,
@@ -45,7 +55,9 @@ class SubjectAPI(APIView):
     permission_classes = [IsAuthenticated, IsLecturer]
 
     def get(self, _):
-        serializer = SubjectSerializer(Subject.objects.all(), many=True)
+        serializer = SubjectSerializer(
+            Subject.objects.annotate(tests_count=Count("tests")), many=True
+        )
         return Response({"subjects": serializer.data})
 
     def post(self, request):
@@ -106,7 +118,7 @@ class TestAPI(APIView):
         if subject_id:
             tests = tests.filter(subject__id=subject_id)
 
-        serializer = TestSerializer(tests, many=True)
+        serializer = TestSerializer(TestSerializer.prefetch(tests), many=True)
         return Response({"tests": serializer.data})
 
     def post(self, request):
@@ -133,6 +145,8 @@ class TestAPI(APIView):
         )
         if serializer.is_valid(raise_exception=True):
             updated_test = serializer.save()
+        invalidate_variants(updated_test.id)
+        questions_pool.invalidate(updated_test.id)
         logger.info(
             "test %s for subject %s was updated by %s",
             updated_test.name,
@@ -158,7 +172,9 @@ class TestAPI(APIView):
             test.subject.name,
             request.user.username,
         )
+        test_id = test.id
         test.delete()
+        questions_pool.invalidate(test_id)
         return Response({"success": message})
 
 
@@ -175,19 +191,42 @@ class LaunchTestAPI(APIView):
                     % (test.name, test.tasks_num),
                 }
             )
-        TestResult.objects.create(
-            test=test,
-            launched_lecturer=request.user,
-            subject=test.subject,
-            is_running=True,
-            comment=request.data.get("comment", ""),
-        )
+        try:
+            variants_num = int(
+                request.data.get("variants_num", settings.TEST_VARIANTS_NUM)
+            )
+        except (TypeError, ValueError):
+            variants_num = -1
+        if not 0 <= variants_num <= settings.TEST_VARIANTS_MAX_NUM:
+            return Response(
+                {
+                    "ok": False,
+                    "message": "Число вариантов должно быть от 0 до %d."
+                    % settings.TEST_VARIANTS_MAX_NUM,
+                },
+                status=status.HTTP_400_BAD_REQUEST,
+            )
+        with transaction.atomic():
+            testing_result = TestResult.objects.create(
+                test=test,
+                launched_lecturer=request.user,
+                subject=test.subject,
+                is_running=True,
+                comment=request.data.get("comment", ""),
+            )
+            generate_variants(testing_result, test, variants_num)
         logger.info(
             "test %s for subject %s was launched by %s",
             test.name,
             test.subject.name,
             request.user.username,
         )
+        events.emit(
+            events.TEST_LAUNCHED,
+            test.id,
+            testing_result,
+            {"testing_result": events.get_testing_result_row(testing_result)},
+        )
         message = "Тест '%s' запущен. Состояние его прохождения можно отследить во вкладке 'Запущенные тесты'."
         return Response({"ok": True, "message": message % test.name})
 
@@ -208,6 +247,8 @@ class QuestionAPI(APIView):
                 questions = utils.load_questions_list(request, test_id)
                 for question in questions:
                     serializer.create(question)
+                invalidate_variants(test_id)
+                questions_pool.invalidate(test_id)
                 message = "Вопросы к тесту в количестве %d успешно добавлены." % len(
                     questions
                 )
@@ -218,6 +259,8 @@ class QuestionAPI(APIView):
                 )
                 return Response({"success": message})
             question = serializer.create_from_request(request)
+            invalidate_variants(question.test_id)
+            questions_pool.invalidate(question.test_id)
             message = "Вопрос '%s' к тесту '%s' успешно добавлен."
             logger.info(
                 "question %s for test %s, subject %s was loaded by %s",
@@ -254,11 +297,16 @@ class QuestionAPI(APIView):
 
     def put(self, request, test_id, question_id):
         question = get_object_or_404(Question.objects.all(), id=question_id)
+        old_test_id = question.test_id
         serializer = QuestionSerializer(
             instance=question, data=request.data, partial=True
         )
         if serializer.is_valid(raise_exception=True):
             updated_question = serializer.save()
+        # Question may be moved to another test
+        for changed_test_id in {old_test_id, updated_question.test_id}:
+            invalidate_variants(changed_test_id)
+            questions_pool.invalidate(changed_test_id)
         message = "Вопрос '%s' по тесту '%s' был успешно отредактирован."
         logger.info(
             "question %s for test %s, subject %s was updated by %s",
@@ -288,6 +336,8 @@ class QuestionAPI(APIView):
             request.user.username,
         )
         question.delete()
+        invalidate_variants(question.test_id)
+        questions_pool.invalidate(question.test_id)
         return Response({"success": message})
 
 
@@ -363,6 +413,13 @@ class RunningTestAPI(APIView):
         return Response({"tests": serializer.data})
 
 
+class RunningTestAggregatesAPI(APIView):
+    permission_classes = [IsAuthenticated, IsLecturer]
+
+    def get(self, _, testing_result_id):
+        return Response(aggregates_cache.get(testing_result_id))
+
+
 class QuestionAnalysisAPI(APIView):
     permission_classes = [IsAuthenticated, IsLecturer]
 
@@ -397,3 +454,44 @@ class QuestionAnalysisAPI(APIView):
                     stats[q_id]["false"] += 1
 
         return Response({"stats": stats})
+
+
+class MetricsAPI(APIView):
+    permission_classes = [IsAuthenticated, IsLecturer]
+
+    def get(self, _):
+        return Response(
+            {
+                "metrics": metrics.snapshot(),
+                "questions_pool": questions_pool.stats(),
+                "admission": exam_admission.stats(),
+            }
+        )
+
+
+class RegradeAPI(APIView):
+    permission_classes = [IsAuthenticated, IsLecturer]
+
+    def post(self, request):
+        test_id = request.data.get("test_id")
+        subject_id = request.data.get("subject_id")
+        if test_id is None and subject_id is None:
+            return Response(
+                {"ok": False, "message": "Не указан тест или предмет."},
+                status=status.HTTP_400_BAD_REQUEST,
+            )
+        try:
+            test_ids = [int(test_id)] if test_id is not None else None
+            subject_id = int(subject_id) if subject_id is not None else None
+        except (TypeError, ValueError):
+            return Response(
+                {"ok": False, "message": "Некорректный id теста или предмета."},
+                status=status.HTTP_400_BAD_REQUEST,
+            )
+        report = regrade_results(test_ids=test_ids, subject_id=subject_id)
+        logger.info(
+            "%d results were re-graded by %s",
+            report["processed"],
+            request.user.username,
+        )
+        return Response({"ok": True, **report})
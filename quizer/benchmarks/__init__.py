@@ -0,0 +1,73 @@
+"""
+Benchmarks of quizer hot paths
+
+Run from 'quizer' directory, i.e.: python -m benchmarks.sampling
+"""
+import os
+import resource
+import statistics
+import time
+from contextlib import contextmanager
+from typing import Callable, Dict, List
+
+import django
+
+
+def setup() -> None:
+    os.environ.setdefault("DJANGO_SETTINGS_MODULE", "quizer.settings")
+    django.setup()
+
+
+@contextmanager
+def test_database():
+    """
+    Run benchmark on temporary database, the same as used by tests
+    """
+    from django.db import connection  # pylint: disable=import-outside-toplevel
+
+    old_name = connection.settings_dict["NAME"]
+    connection.creation.create_test_db(verbosity=0, autoclobber=True)
+    try:
+        yield
+    finally:
+        connection.creation.destroy_test_db(old_name, verbosity=0)
+
+
+def rss() -> int:
+    """
+    Resident set size of process in bytes
+    """
+    try:
+        with open("/proc/self/statm") as statm:
+            return int(statm.read().split()[1]) * os.sysconf("SC_PAGE_SIZE")
+    except OSError:
+        return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * 1024
+
+
+def percentiles(samples: List[float]) -> Dict[str, float]:
+    """
+    Summary of samples in milliseconds
+    """
+    samples = sorted(samples)
+
+    def percentile(value: float) -> float:
+        return samples[min(len(samples) - 1, int(len(samples) * value))] * 1000
+
+    return {
+        "mean": statistics.mean(samples) * 1000,
+        "p50": percentile(0.5),
+        "p95": percentile(0.95),
+        "p99": percentile(0.99),
+    }
+
+
+def measure(func: Callable[[], None], repeat: int) -> Dict[str, float]:
+    """
+    Run function 'repeat' times and return timings summary in milliseconds
+    """
+    samples = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        func()
+        samples.append(time.perf_counter() - start)
+    return percentiles(samples)
@@ -0,0 +1,104 @@
+"""
+Size of saved results and grading time of test forms with answers encoded by
+options texts versus options indices
+
+Usage: python -m benchmarks.answers [--tasks-num 10 30] [--option-length 60]
+"""
+import argparse
+import json
+import random
+
+from . import measure, setup, test_database
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--tasks-num", type=int, nargs="+", default=[10, 30])
+    parser.add_argument("--options-num", type=int, default=4)
+    parser.add_argument("--option-length", type=int, default=60)
+    parser.add_argument("--results", type=int, default=10000)
+    parser.add_argument("--repeat", type=int, default=1000)
+    args = parser.parse_args()
+
+    setup()
+    # pylint: disable=import-outside-toplevel
+    from django.contrib.auth.models import User
+    from main.grading import grade_session
+    from main.models import Subject, Test, Question, RunningTestsAnswers
+    from main.utils import grade_answers
+    from main.variants import get_right_answers, make_variant
+
+    with test_database():
+        user = User.objects.create_user(username="benchmark")
+        subject = Subject.objects.create(name="benchmark")
+        print(
+            f"{'tasks':>6} {'text, B':>8} {'index, B':>9} {'table, MB':>16} "
+            f"{'text grade, ms':>15} {'index grade, ms':>16}"
+        )
+        rng = random.Random(0)
+        for tasks_num in args.tasks_num:
+            test = Test.objects.create(
+                subject=subject, author=user, name="benchmark", tasks_num=tasks_num
+            )
+            Question.objects.bulk_create(
+                Question(
+                    formulation=f"Question {i}",
+                    multiselect=i % 2 == 1,
+                    tasks_num=args.options_num,
+                    type=Question.Type.REGULAR,
+                    test=test,
+                    options=[
+                        {
+                            "option": f"Option {j} ".ljust(args.option_length, "x"),
+                            "is_true": j == 0 or (i % 2 == 1 and j == 1),
+                            "num": None,
+                        }
+                        for j in range(args.options_num)
+                    ],
+                )
+                for i in range(tasks_num)
+            )
+            variant = make_variant(test, seed=0)
+            session = RunningTestsAnswers(
+                test=test,
+                user=user,
+                test_duration=test.duration,
+                seed=variant.seed,
+                layout=variant.layout,
+            )
+
+            text_form = {"time": ["10"]}
+            index_form = {"time": ["10"]}
+            for num, (question, _) in enumerate(variant.questions, start=1):
+                selected = rng.sample(range(args.options_num), 1 + question.multiselect)
+                if question.multiselect:
+                    for idx in selected:
+                        text_form[f"{num}_{question.options[idx]['option']}"] = ["on"]
+                        index_form[f"{num}_{idx}"] = ["on"]
+                else:
+                    text_form[str(num)] = [question.options[selected[0]]["option"]]
+                    index_form[str(num)] = [str(selected[0])]
+
+            def grade_texts():
+                return grade_answers(
+                    text_form, get_right_answers(session), session.test_duration
+                )
+
+            text_size = len(json.dumps(grade_texts()))
+            index_size = len(json.dumps(grade_session(index_form, session)))
+            text_time = measure(grade_texts, args.repeat)
+            index_time = measure(
+                lambda: grade_session(index_form, session), args.repeat
+            )
+            table = (
+                f"{text_size * args.results / 2 ** 20:.1f} -> "
+                f"{index_size * args.results / 2 ** 20:.1f}"
+            )
+            print(
+                f"{tasks_num:>6} {text_size:>8} {index_size:>9} {table:>16} "
+                f"{text_time['mean']:>15.3f} {index_time['mean']:>16.3f}"
+            )
+
+
+if __name__ == "__main__":
+    main()
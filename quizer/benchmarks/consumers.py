@@ -0,0 +1,75 @@
+"""
+Memory per open websocket and latency of event delivery to all sockets of
+running tests consumer, sockets are connected in process
+
+Usage: python -m benchmarks.consumers [--connections 100 1000] [--events 20]
+"""
+import argparse
+import asyncio
+import gc
+import time
+
+from . import percentiles, rss, setup, test_database
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--connections", type=int, nargs="+", default=[100, 1000])
+    parser.add_argument("--events", type=int, default=20)
+    args = parser.parse_args()
+
+    setup()
+    # pylint: disable=import-outside-toplevel
+    from channels.layers import get_channel_layer
+    from channels.testing import WebsocketCommunicator
+    from django.contrib.auth.models import User
+    from main.consumers import STUDENTS_GROUP, RunningTestsConsumer
+
+    async def run(user, connections: int):
+        layer = get_channel_layer()
+        application = RunningTestsConsumer.as_asgi()
+        gc.collect()
+        rss_before = rss()
+        sockets = []
+        for _ in range(connections):
+            communicator = WebsocketCommunicator(application, "/available_tests/")
+            communicator.scope["user"] = user
+            await communicator.connect()
+            await communicator.receive_json_from()
+            sockets.append(communicator)
+        gc.collect()
+        per_connection = (rss() - rss_before) / connections
+
+        async def receive(communicator):
+            message = await communicator.receive_json_from(timeout=60)
+            return time.perf_counter() - message["sent"]
+
+        latencies = []
+        for _ in range(args.events):
+            await layer.group_send(
+                STUDENTS_GROUP,
+                {"type": "event", "event": "benchmark", "sent": time.perf_counter()},
+            )
+            latencies += await asyncio.gather(*map(receive, sockets))
+        for communicator in sockets:
+            await communicator.disconnect()
+        await layer.flush()
+        return per_connection, latencies
+
+    with test_database():
+        user = User.objects.create_user(username="benchmark")
+        print(
+            f"{'connections':>12} {'RSS/conn, KB':>13} {'p50, ms':>8} "
+            f"{'p95, ms':>8} {'p99, ms':>8}"
+        )
+        for connections in args.connections:
+            per_connection, latencies = asyncio.run(run(user, connections))
+            summary = percentiles(latencies)
+            print(
+                f"{connections:>12} {per_connection / 1024:>13.1f} "
+                f"{summary['p50']:>8.1f} {summary['p95']:>8.1f} {summary['p99']:>8.1f}"
+            )
+
+
+if __name__ == "__main__":
+    main()
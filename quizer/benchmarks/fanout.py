@@ -0,0 +1,93 @@
+"""
+Fan-out of running tests events to sockets subscribed to one common group
+versus groups of lecturers, running tests and students
+
+Sockets are split between students passing running tests, students choosing
+a test and lecturers watching their running tests. Events are mostly
+submissions of tests, launches and stops are rare.
+
+Usage: python -m benchmarks.fanout [--sockets 1000] [--tests 1 10 50]
+"""
+import argparse
+import asyncio
+import random
+import time
+
+from . import setup
+
+COMMON_GROUP = "running_tests"
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--sockets", type=int, default=1000)
+    parser.add_argument("--tests", type=int, nargs="+", default=[1, 10, 50])
+    parser.add_argument("--events", type=int, default=1000)
+    parser.add_argument("--choosing", type=float, default=0.1)
+    parser.add_argument("--lecturers", type=float, default=0.02)
+    args = parser.parse_args()
+
+    setup()
+    # pylint: disable=import-outside-toplevel
+    from channels.layers import InMemoryChannelLayer
+    from main import events
+    from main.consumers import STUDENTS_GROUP, lecturer_group, testing_result_group
+
+    def subscriptions(tests_num: int, rng: random.Random):
+        """
+        Groups of every socket, tests are launched by different lecturers
+        """
+        lecturers_num = max(1, int(args.sockets * args.lecturers))
+        choosing_num = int(args.sockets * args.choosing)
+        for idx in range(lecturers_num):
+            yield lecturer_group(idx % tests_num)
+        for _ in range(choosing_num):
+            yield STUDENTS_GROUP
+        for _ in range(args.sockets - lecturers_num - choosing_num):
+            yield testing_result_group(rng.randrange(tests_num))
+
+    def make_events(tests_num: int, rng: random.Random):
+        kinds = [events.TEST_PASSED] * 98 + [events.TEST_LAUNCHED, events.TEST_STOPPED]
+        for _ in range(args.events):
+            test_id = rng.randrange(tests_num)
+            yield {
+                "event": rng.choice(kinds),
+                "test_id": test_id,
+                "testing_result_id": test_id,
+                "lecturer_id": test_id,
+            }
+
+    async def send(groups, sent_events, routed: bool):
+        layer = InMemoryChannelLayer(capacity=len(sent_events) + 1)
+        for group in groups:
+            channel = await layer.new_channel()
+            await layer.group_add(COMMON_GROUP, channel)
+            await layer.group_add(group, channel)
+        start = time.perf_counter()
+        for event in sent_events:
+            message = {"type": "event", **event}
+            for group in events.get_groups(event) if routed else [COMMON_GROUP]:
+                await layer.group_send(group, message)
+        elapsed = time.perf_counter() - start
+        delivered = sum(queue.qsize() for queue in layer.channels.values())
+        await layer.flush()
+        return delivered, elapsed
+
+    print(
+        f"{'tests':>6} {'common, msgs':>13} {'scoped, msgs':>13} "
+        f"{'common, ms':>11} {'scoped, ms':>11}"
+    )
+    for tests_num in args.tests:
+        rng = random.Random(0)
+        groups = list(subscriptions(tests_num, rng))
+        sent_events = list(make_events(tests_num, rng))
+        common_msgs, common_time = asyncio.run(send(groups, sent_events, False))
+        scoped_msgs, scoped_time = asyncio.run(send(groups, sent_events, True))
+        print(
+            f"{tests_num:>6} {common_msgs:>13} {scoped_msgs:>13} "
+            f"{common_time * 1000:>11.1f} {scoped_time * 1000:>11.1f}"
+        )
+
+
+if __name__ == "__main__":
+    main()
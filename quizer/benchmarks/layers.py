@@ -0,0 +1,95 @@
+"""
+Latency of group broadcast through PostgreSQL channel layer from one process
+to sockets of several worker processes. Requires PostgreSQL database
+
+Usage: python -m benchmarks.layers [--workers 1 2 4 8] [--messages 200]
+"""
+import argparse
+import asyncio
+import multiprocessing
+import time
+
+from . import percentiles, setup
+
+GROUP = "benchmark"
+
+
+def worker(ready, results, messages: int, sockets: int) -> None:
+    """
+    Worker process with 'sockets' channels in benchmark group, reports
+    latencies of received messages
+    """
+    setup()
+    from main.layers import PostgresChannelLayer  # pylint: disable=C0415
+
+    layer = PostgresChannelLayer()
+
+    async def receive_all():
+        channels = [await layer.new_channel() for _ in range(sockets)]
+        for channel in channels:
+            await layer.group_add(GROUP, channel)
+        # Give listener thread time to LISTEN
+        await asyncio.sleep(1)
+        ready.set()
+        latencies = []
+        for _ in range(messages):
+            for channel in channels:
+                message = await layer.receive(channel)
+                latencies.append(time.time() - message["sent"])
+        return latencies
+
+    results.put(asyncio.run(receive_all()))
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--workers", type=int, nargs="+", default=[1, 2, 4, 8])
+    parser.add_argument("--sockets", type=int, default=10)
+    parser.add_argument("--messages", type=int, default=200)
+    parser.add_argument("--interval", type=float, default=0.005)
+    args = parser.parse_args()
+
+    setup()
+    from main.layers import PostgresChannelLayer  # pylint: disable=C0415
+
+    layer = PostgresChannelLayer()
+    if not layer.shared:
+        print("PostgreSQL database is required")
+        return
+
+    async def publish():
+        for _ in range(args.messages):
+            await layer.group_send(GROUP, {"type": "benchmark", "sent": time.time()})
+            await asyncio.sleep(args.interval)
+
+    context = multiprocessing.get_context("spawn")
+    print(f"{'workers':>8} {'p50, ms':>8} {'p95, ms':>8} {'p99, ms':>8} {'max, ms':>8}")
+    for workers_num in args.workers:
+        results = context.Queue()
+        events = [context.Event() for _ in range(workers_num)]
+        processes = [
+            context.Process(
+                target=worker, args=(event, results, args.messages, args.sockets)
+            )
+            for event in events
+        ]
+        for process in processes:
+            process.start()
+        for event in events:
+            event.wait()
+        asyncio.run(publish())
+
+        latencies = []
+        for _ in processes:
+            latencies += results.get()
+        for process in processes:
+            process.join()
+        summary = percentiles(latencies)
+        print(
+            f"{workers_num:>8} {summary['p50']:>8.2f} {summary['p95']:>8.2f} "
+            f"{summary['p99']:>8.2f} {max(latencies) * 1000:>8.2f}"
+        )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,269 @@
+"""
+Load of running tests websockets: N in-process clients connected to ASGI
+application 'quizer.routing.application' as lecturers watching running tests,
+students passing them and students choosing a test. Launch, stop and submit
+events are fired through main.events, delivery latency percentiles, CPU time
+and memory are reported for each channel layer backend and saved as JSON.
+Every backend and number of sockets is measured in separate process
+
+Usage: python -m benchmarks.load [--sockets 100 1000] [--backends memory postgres]
+       [--output websockets.json]
+"""
+import argparse
+import asyncio
+import gc
+import json
+import multiprocessing
+import os
+import queue
+import random
+import resource
+import subprocess
+import time
+from datetime import datetime
+from typing import Any, Dict, List
+
+from . import percentiles, rss, setup, test_database
+
+BACKENDS = {
+    "memory": "main.layers.LocalChannelLayer",
+    "postgres": "main.layers.PostgresChannelLayer",
+}
+
+
+def cpu_time() -> float:
+    usage = resource.getrusage(resource.RUSAGE_SELF)
+    return usage.ru_utime + usage.ru_stime
+
+
+def version() -> str:
+    try:
+        return subprocess.run(
+            ["git", "describe", "--always", "--dirty"],
+            capture_output=True,
+            check=True,
+            text=True,
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return ""
+
+
+def measure_load(backend: str, sockets_num: int, args, results) -> None:
+    """
+    Connect sockets, fire events and put result to 'results' queue, runs in
+    separate process so memory and CPU time are not affected by other runs
+    """
+    setup()
+    # pylint: disable=import-outside-toplevel
+    from asgiref.sync import sync_to_async
+    from channels.layers import get_channel_layer
+    from channels.testing import WebsocketCommunicator
+    from django.conf import settings
+    from django.contrib.auth.models import Group, User
+    from django.test import Client, override_settings
+    from main import events
+    from main.consumers import STUDENTS_GROUP, lecturer_group, testing_result_group
+    from main.models import Subject, Test, TestResult
+    from quizer.routing import application
+
+    def session_cookie(user: User) -> bytes:
+        client = Client()
+        client.force_login(user)
+        return (
+            f"{settings.SESSION_COOKIE_NAME}=".encode()
+            + client.cookies[settings.SESSION_COOKIE_NAME].value.encode()
+        )
+
+    def fire(event: Dict[str, Any]) -> None:
+        events.emit(
+            event["event"], event["test_id"], event["testing_result"], event["data"]
+        )
+
+    async def run(testing_results: List[TestResult], cookies):
+        rng = random.Random(0)
+        prefix = os.getenv("URL_PREFIX", "")
+
+        async def connect(cookie: bytes, query: str = "") -> WebsocketCommunicator:
+            communicator = WebsocketCommunicator(
+                application,
+                f"/{prefix}available_tests/{query}",
+                headers=[(b"origin", b"http://localhost"), (b"cookie", cookie)],
+            )
+            connected, _ = await communicator.connect(timeout=10)
+            assert connected, "socket is not connected"
+            await communicator.receive_json_from(timeout=10)
+            return communicator
+
+        gc.collect()
+        rss_before = rss()
+        sockets = {}
+        for testing_result in testing_results:
+            group = lecturer_group(testing_result.launched_lecturer_id)
+            sockets[group] = [await connect(cookies[testing_result.id])]
+        for idx in range(sockets_num - len(testing_results)):
+            if idx < sockets_num * args.choosing:
+                group, query = STUDENTS_GROUP, ""
+            else:
+                testing_result = rng.choice(testing_results)
+                group = testing_result_group(testing_result.id)
+                query = f"?testing_result={testing_result.id}"
+            sockets.setdefault(group, []).append(
+                await connect(cookies["student"], query)
+            )
+        gc.collect()
+        per_socket = (rss() - rss_before) / sockets_num
+
+        async def receive(communicator, sent: float) -> float:
+            await communicator.receive_json_from(timeout=30)
+            return time.perf_counter() - sent
+
+        kinds = [events.TEST_PASSED] * 8 + [events.TEST_LAUNCHED, events.TEST_STOPPED]
+        latencies = []
+        cpu_before = cpu_time()
+        for _ in range(args.events):
+            testing_result = rng.choice(testing_results)
+            event = {
+                "event": rng.choice(kinds),
+                "test_id": testing_result.test_id,
+                "testing_result": testing_result,
+                "data": {},
+            }
+            receivers = [
+                communicator
+                for group in events.get_groups(
+                    {
+                        "event": event["event"],
+                        "lecturer_id": testing_result.launched_lecturer_id,
+                        "testing_result_id": testing_result.id,
+                    }
+                )
+                for communicator in sockets.get(group, [])
+            ]
+            sent = time.perf_counter()
+            # Events are sent from request threads and debouncer thread
+            await sync_to_async(fire, thread_sensitive=False)(event)
+            latencies += await asyncio.gather(
+                *(receive(communicator, sent) for communicator in receivers)
+            )
+        cpu = cpu_time() - cpu_before
+        for group_sockets in sockets.values():
+            for communicator in group_sockets:
+                await communicator.disconnect()
+        return per_socket, cpu, latencies
+
+    with test_database(), override_settings(
+        CHANNEL_LAYERS={"default": {"BACKEND": BACKENDS[backend]}},
+        EVENTS_DEBOUNCE_SECONDS=0,
+        WEBSOCKET_HEARTBEAT_SECONDS=3600,
+    ):
+        lecturers = Group.objects.create(name="lecturer")
+        student = User.objects.create_user(username="student")
+        subject = Subject.objects.create(name="benchmark")
+        cookies = {"student": session_cookie(student)}
+        testing_results = []
+        for idx in range(args.tests):
+            lecturer = User.objects.create_user(username=f"lecturer_{idx}")
+            lecturer.groups.add(lecturers)
+            test = Test.objects.create(subject=subject, author=lecturer, name="test")
+            testing_result = TestResult.objects.create(
+                test=test, launched_lecturer=lecturer, subject=subject, is_running=True
+            )
+            testing_results.append(testing_result)
+            cookies[testing_result.id] = session_cookie(lecturer)
+
+        per_socket, cpu, latencies = asyncio.run(run(testing_results, cookies))
+        summary = percentiles(latencies)
+        results.put(
+            {
+                "backend": backend,
+                "sockets": sockets_num,
+                "shared": getattr(get_channel_layer(), "shared", False),
+                "messages": len(latencies),
+                "p50_ms": summary["p50"],
+                "p95_ms": summary["p95"],
+                "p99_ms": summary["p99"],
+                "max_ms": max(latencies) * 1000,
+                "cpu_seconds": cpu,
+                "rss_per_socket_kb": per_socket / 1024,
+            }
+        )
+
+
+def wait_result(
+    process: multiprocessing.Process, results: multiprocessing.Queue, timeout: float
+) -> Dict[str, Any]:
+    """
+    Wait for result of measuring process, it may crash or hang without putting
+    result to queue
+
+    :param process: started process running 'measure_load'
+    :param results: queue the process puts result to
+    :param timeout: max seconds of waiting
+    :return: result of measurement
+    """
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        try:
+            return results.get(timeout=1)
+        except queue.Empty:
+            if process.exitcode is not None:
+                raise SystemExit(
+                    f"Measuring process exited with code {process.exitcode}"
+                ) from None
+    process.terminate()
+    raise SystemExit(f"Measuring process did not finish in {timeout} seconds")
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--sockets", type=int, nargs="+", default=[100, 1000])
+    parser.add_argument("--backends", nargs="+", default=list(BACKENDS))
+    parser.add_argument("--tests", type=int, default=10)
+    parser.add_argument("--events", type=int, default=100)
+    parser.add_argument("--choosing", type=float, default=0.2)
+    parser.add_argument("--timeout", type=float, default=600)
+    parser.add_argument("--output", default="websockets.json")
+    args = parser.parse_args()
+
+    context = multiprocessing.get_context("spawn")
+    print(
+        f"{'backend':>9} {'sockets':>8} {'shared':>7} {'messages':>9} "
+        f"{'p50, ms':>8} {'p95, ms':>8} {'p99, ms':>8} {'max, ms':>8} "
+        f"{'CPU, s':>7} {'RSS/socket, KB':>15}"
+    )
+    results = []
+    for backend in args.backends:
+        for sockets_num in args.sockets:
+            results_queue = context.Queue()
+            process = context.Process(
+                target=measure_load, args=(backend, sockets_num, args, results_queue)
+            )
+            process.start()
+            result = wait_result(process, results_queue, args.timeout)
+            process.join()
+            results.append(result)
+            print(
+                f"{backend:>9} {sockets_num:>8} {str(result['shared']):>7} "
+                f"{result['messages']:>9} {result['p50_ms']:>8.1f} "
+                f"{result['p95_ms']:>8.1f} {result['p99_ms']:>8.1f} "
+                f"{result['max_ms']:>8.1f} {result['cpu_seconds']:>7.2f} "
+                f"{result['rss_per_socket_kb']:>15.1f}"
+            )
+
+    with open(args.output, "w") as output:
+        json.dump(
+            {
+                "version": version(),
+                "date": datetime.now().isoformat(timespec="seconds"),
+                "tests": args.tests,
+                "events": args.events,
+                "results": results,
+            },
+            output,
+            indent=2,
+        )
+    print(f"Results are saved to {args.output}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,92 @@
+"""
+Re-grading of saved results after fixing right option of one question
+
+Usage: python -m benchmarks.regrading [--results 10000 100000] [--tasks-num 10]
+"""
+import argparse
+import random
+
+from . import setup, test_database
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--results", type=int, nargs="+", default=[10000, 100000])
+    parser.add_argument("--tasks-num", type=int, default=10)
+    parser.add_argument("--options-num", type=int, default=4)
+    parser.add_argument("--chunk-size", type=int, default=2000)
+    args = parser.parse_args()
+
+    setup()
+    # pylint: disable=import-outside-toplevel
+    from django.contrib.auth.models import User
+    from main.grading import regrade_results
+    from main.models import Subject, Test, Question, TestResult, UserResult
+
+    with test_database():
+        user = User.objects.create_user(username="benchmark")
+        subject = Subject.objects.create(name="benchmark")
+        test = Test.objects.create(
+            subject=subject, author=user, name="benchmark", tasks_num=args.tasks_num
+        )
+        questions = Question.objects.bulk_create(
+            Question(
+                formulation=f"Question {i}",
+                multiselect=False,
+                tasks_num=args.options_num,
+                type=Question.Type.REGULAR,
+                test=test,
+                options=[
+                    {"option": f"Option {j}", "is_true": j == 0, "num": None}
+                    for j in range(args.options_num)
+                ],
+            )
+            for i in range(args.tasks_num)
+        )
+        questions = list(Question.objects.filter(test=test))
+        testing_result = TestResult.objects.create(
+            is_running=False, test=test, subject=subject
+        )
+        print(f"{'results':>8} {'updated':>8} {'time, s':>8} {'results/s':>10}")
+        rng = random.Random(0)
+        for results_num in args.results:
+            UserResult.objects.all().delete()
+            for idx in range(0, results_num, 5000):
+                UserResult.objects.bulk_create(
+                    UserResult(
+                        testing_result=testing_result,
+                        user=user,
+                        time=0,
+                        tasks_num=args.tasks_num,
+                        right_answers_count=0,
+                        questions=[
+                            {
+                                "question_id": str(question.id),
+                                "selected_options": [
+                                    f"Option {rng.randrange(args.options_num)}"
+                                ],
+                                "right_options": ["Option 0"],
+                            }
+                            for question in questions
+                        ],
+                    )
+                    for _ in range(min(5000, results_num - idx))
+                )
+            regrade_results(test_ids=[test.id], chunk_size=args.chunk_size)
+
+            question = questions[0]
+            for option in question.options:
+                option["is_true"] = option["option"] == "Option 1"
+            question.save()
+            report = regrade_results(test_ids=[test.id], chunk_size=args.chunk_size)
+            print(
+                f"{results_num:>8} {report['updated']:>8} {report['seconds']:>8.2f} "
+                f"{results_num / report['seconds']:>10.0f}"
+            )
+            for option in question.options:
+                option["is_true"] = option["option"] == "Option 0"
+            question.save()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,73 @@
+"""
+Questions sampling: loading whole questions bank into python versus
+sampling inside database (QUESTIONS_SAMPLING = 'database')
+
+Usage: python -m benchmarks.sampling [--sizes 100 1000 10000 100000] [--repeat 50]
+"""
+import argparse
+import random
+
+from . import setup, test_database, measure
+
+
+def python_sampling(test) -> None:
+    # pylint: disable=import-outside-toplevel
+    from main.models import Question
+
+    random.sample(list(Question.objects.filter(test__id=test.id)), k=test.tasks_num)
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument(
+        "--sizes", type=int, nargs="+", default=[100, 1_000, 10_000, 100_000]
+    )
+    parser.add_argument("--tasks-num", type=int, default=50)
+    parser.add_argument("--repeat", type=int, default=50)
+    args = parser.parse_args()
+
+    setup()
+    # pylint: disable=import-outside-toplevel
+    from django.contrib.auth.models import User
+    from main.models import Subject, Test, Question
+    from main.pool import questions_pool
+
+    with test_database():
+        author = User.objects.create_user(username="benchmark")
+        subject = Subject.objects.create(name="benchmark")
+        print(f"{'questions':>10} {'python, ms':>22} {'database, ms':>22}")
+        for size in args.sizes:
+            test = Test.objects.create(
+                subject=subject,
+                author=author,
+                name=f"benchmark {size}",
+                tasks_num=args.tasks_num,
+            )
+            Question.objects.bulk_create(
+                Question(
+                    formulation=f"Question {i}",
+                    multiselect=False,
+                    tasks_num=4,
+                    type=Question.Type.REGULAR,
+                    test=test,
+                    options=[
+                        {"option": f"Option {j} of question {i}", "is_true": j == 0}
+                        for j in range(4)
+                    ],
+                )
+                for i in range(size)
+            )
+            python = measure(lambda: python_sampling(test), args.repeat)
+            database = measure(
+                lambda: questions_pool.sample_from_database(test), args.repeat
+            )
+            print(
+                f"{size:>10} "
+                f"{python['p50']:>10.2f} (p95 {python['p95']:>7.2f}) "
+                f"{database['p50']:>10.2f} (p95 {database['p95']:>7.2f})"
+            )
+            test.delete()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,92 @@
+"""
+Running test session row: JSON answer key versus seed with packed layout
+
+Usage: python -m benchmarks.sessions [--tasks-num 10 50] [--repeat 200]
+"""
+import argparse
+import json
+
+from . import setup, test_database, measure
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--tasks-num", type=int, nargs="+", default=[10, 50])
+    parser.add_argument("--options-num", type=int, default=4)
+    parser.add_argument("--repeat", type=int, default=200)
+    args = parser.parse_args()
+
+    setup()
+    # pylint: disable=import-outside-toplevel
+    from django.contrib.auth.models import User
+    from main.models import Subject, Test, Question, RunningTestsAnswers
+    from main.variants import make_variant, get_right_answer
+
+    with test_database():
+        user = User.objects.create_user(username="benchmark")
+        subject = Subject.objects.create(name="benchmark")
+        print(
+            f"{'tasks':>6} {'json, B':>8} {'layout, B':>10} "
+            f"{'json write, ms':>15} {'layout write, ms':>17}"
+        )
+        for tasks_num in args.tasks_num:
+            test = Test.objects.create(
+                subject=subject, author=user, name="benchmark", tasks_num=tasks_num
+            )
+            Question.objects.bulk_create(
+                Question(
+                    formulation=f"Question {i}",
+                    multiselect=False,
+                    tasks_num=args.options_num,
+                    type=Question.Type.REGULAR,
+                    test=test,
+                    options=[
+                        {
+                            "option": f"Typical answer option {j} of question {i}",
+                            "is_true": j == 0,
+                            "num": None,
+                        }
+                        for j in range(args.options_num)
+                    ],
+                )
+                for i in range(tasks_num * 2)
+            )
+            variant = make_variant(test)
+            seed, layout = variant.seed, variant.layout
+            right_answers = [
+                get_right_answer(num, question.permuted(permutation))
+                for num, (question, permutation) in enumerate(
+                    variant.questions, start=1
+                )
+            ]
+
+            def create_json():
+                RunningTestsAnswers.objects.create(
+                    test=test,
+                    user=None,
+                    test_duration=test.duration,
+                    right_answers=right_answers,
+                )
+
+            def create_layout():
+                RunningTestsAnswers.objects.create(
+                    test=test,
+                    user=None,
+                    test_duration=test.duration,
+                    seed=seed,
+                    layout=layout,
+                )
+
+            json_write = measure(create_json, args.repeat)
+            layout_write = measure(create_layout, args.repeat)
+            print(
+                f"{tasks_num:>6} {len(json.dumps(right_answers)):>8} "
+                f"{len(layout) + 8:>10} "
+                f"{json_write['p50']:>15.3f} {layout_write['p50']:>17.3f}"
+            )
+            RunningTestsAnswers.objects.all().delete()
+            test.delete()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,133 @@
+"""
+Live aggregates of running tests results
+
+Aggregates of testing result are loaded from database by one query on first
+access and then updated by every saved result, so reading them does not
+depend on number of results. Results saved by other workers are picked up
+by reloading aggregates older than AGGREGATES_REFRESH_SECONDS.
+"""
+import heapq
+import threading
+import time
+from typing import Any, Dict, Hashable, Iterable, List, Set
+
+from django.conf import settings
+
+from .models import UserResult
+
+
+class Aggregates:
+    """
+    Number of finished students, mean score, median time and histogram of
+    scores of one testing result, each update costs O(log n)
+    """
+
+    def __init__(self):
+        self.loaded_at = time.monotonic()
+        self.finished = 0
+        self.score_sum = 0
+        self.histogram: List[int] = []
+        self._keys: Set[Hashable] = set()
+        # Max-heap (negated) of lower half and min-heap of upper half of times
+        self._lower: List[int] = []
+        self._upper: List[int] = []
+
+    def add(self, key: Hashable, time_spent: int, score: int) -> None:
+        """
+        Add result, results added before are skipped
+
+        :param key: key of <UserResult> - user id and date, known before insert
+        :param time_spent: time of passing test in seconds
+        :param score: number of right answers
+        """
+        if key in self._keys:
+            return
+        self._keys.add(key)
+        self.finished += 1
+        self.score_sum += score
+        if score >= len(self.histogram):
+            self.histogram.extend([0] * (score + 1 - len(self.histogram)))
+        self.histogram[score] += 1
+
+        if self._lower and time_spent > -self._lower[0]:
+            heapq.heappush(self._upper, time_spent)
+        else:
+            heapq.heappush(self._lower, -time_spent)
+        if len(self._lower) > len(self._upper) + 1:
+            heapq.heappush(self._upper, -heapq.heappop(self._lower))
+        elif len(self._upper) > len(self._lower):
+            heapq.heappush(self._lower, -heapq.heappop(self._upper))
+
+    @property
+    def median_time(self) -> float:
+        if not self._lower:
+            return 0
+        if len(self._lower) > len(self._upper):
+            return -self._lower[0]
+        return (self._upper[0] - self._lower[0]) / 2
+
+    def as_dict(self) -> Dict[str, Any]:
+        return {
+            "finished": self.finished,
+            "mean_score": self.score_sum / self.finished if self.finished else 0,
+            "median_time": self.median_time,
+            "histogram": list(self.histogram),
+        }
+
+
+class AggregatesCache:
+    """
+    In-process aggregates of testing results
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._aggregates: Dict[int, Aggregates] = {}
+
+    def get(self, testing_result_id: int) -> Dict[str, Any]:
+        """
+        Aggregates of testing result
+
+        :param testing_result_id: id of <TestResult>
+        :return: dict with number of finished students, mean score, median time
+        and scores histogram
+        """
+        with self._lock:
+            aggregates = self._aggregates.get(testing_result_id)
+            if (
+                aggregates is None
+                or time.monotonic() - aggregates.loaded_at
+                > settings.AGGREGATES_REFRESH_SECONDS
+            ):
+                aggregates = Aggregates()
+                for user_id, date, time_spent, score in UserResult.objects.filter(
+                    testing_result_id=testing_result_id
+                ).values_list("user_id", "date", "time", "right_answers_count"):
+                    aggregates.add((user_id, date), time_spent, score)
+                self._aggregates[testing_result_id] = aggregates
+            return aggregates.as_dict()
+
+    def add_results(self, results: Iterable[UserResult]) -> None:
+        """
+        Update loaded aggregates by saved results
+        """
+        with self._lock:
+            for result in results:
+                aggregates = self._aggregates.get(result.testing_result_id)
+                if aggregates is not None:
+                    aggregates.add(
+                        (result.user_id, result.date),
+                        result.time,
+                        result.right_answers_count,
+                    )
+
+    def discard(self, testing_result_id: int) -> None:
+        with self._lock:
+            self._aggregates.pop(testing_result_id, None)
+
+    def clear(self) -> None:
+        with self._lock:
+            self._aggregates.clear()
+
+
+aggregates_cache = AggregatesCache()
@@ -5,3 +5,6 @@ from django.apps import AppConfig
 class MainConfig(AppConfig):
     name = "main"
     verbose_name = "Quizer"
+
+    def ready(self):
+        from . import checks
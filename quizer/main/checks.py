@@ -0,0 +1,32 @@
+"""
+System checks of settings which can not work together
+"""
+from django.conf import settings
+from django.core.checks import Error, register
+
+# Cache backends keeping values in memory of each process
+LOCAL_CACHES = [
+    "django.core.cache.backends.locmem.LocMemCache",
+    "django.core.cache.backends.dummy.DummyCache",
+]
+
+
+@register()
+def check_session_store(app_configs=None, **kwargs):  # pylint: disable=unused-argument
+    """
+    Sessions cached by one process are claimed and deleted by sweeper and other
+    workers, so cache of sessions store must be shared between them
+    """
+    if settings.SESSION_STORE != "cache":
+        return []
+    backend = settings.CACHES[settings.SESSION_STORE_CACHE]["BACKEND"]
+    if backend not in LOCAL_CACHES:
+        return []
+    return [
+        Error(
+            f"SESSION_STORE=cache requires cache shared between processes, "
+            f"'{settings.SESSION_STORE_CACHE}' cache uses {backend}",
+            hint="Set CACHE_BACKEND=database",
+            id="main.E001",
+        )
+    ]
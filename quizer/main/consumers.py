@@ -1,28 +1,176 @@
+import asyncio
 import json
+import weakref
+from collections import deque
+from typing import Any, Dict, List, Optional
+from urllib.parse import parse_qs
 
-from asgiref.sync import async_to_sync
-from channels.generic.websocket import WebsocketConsumer
+from channels.db import database_sync_to_async
+from channels.generic.websocket import AsyncWebsocketConsumer
+from django.conf import settings
 
+from .eventlog import events_log
+from .metrics import metrics
+from .models import TestResult
+from .sessions import get_session_store
 
-class RunningTestsConsumer(WebsocketConsumer):
+STUDENTS_GROUP = "students"
 
-    group_name: str = "running_tests"
 
-    def connect(self):
-        async_to_sync(self.channel_layer.group_add)(self.group_name, self.channel_name)
-        self.accept()
+def lecturer_group(lecturer_id: int) -> str:
+    """
+    Group of lecturer's running tests page
+    """
+    return f"lecturer.{lecturer_id}"
 
-    def disconnect(self, code):
-        async_to_sync(self.channel_layer.group_discard)(
-            self.group_name, self.channel_name
-        )
 
-    def receive(self, text_data=None, bytes_data=None):
-        received_dict = json.loads(text_data)
-        async_to_sync(self.channel_layer.group_send)(
-            self.group_name, {"type": "action", "action": received_dict["action"]}
-        )
+def testing_result_group(testing_result_id: int) -> str:
+    """
+    Group of sockets watching running test, i.e. students passing it
+    """
+    return f"testing_result.{testing_result_id}"
 
-    def action(self, event):
-        action = event["action"]
-        self.send(text_data=json.dumps({"action": action}))
+
+class RunningTestsConsumer(AsyncWebsocketConsumer):
+    """
+    Socket receiving running tests events sent by server, see main.events.
+    Socket joins group of running test passed in 'testing_result' query
+    parameter if its user passes this test or launched it, otherwise group of
+    its user: lecturer's own group or group of all students. Messages from
+    clients are ignored.
+
+    On connect socket gets 'sync' event with sequence number of the last sent
+    event. Reconnected socket passes sequence number of the last received
+    event in 'last_seq' query parameter and gets missed events before 'sync'
+    event or 'resync' event if they are not kept anymore.
+
+    Events are sent from per-connection queue of WEBSOCKET_QUEUE_SIZE events.
+    If client does not keep up and queue is full, queued events are replaced
+    by 'resync' event. Socket gets 'ping' every WEBSOCKET_HEARTBEAT_SECONDS and
+    is closed if client sent nothing (i.e. 'pong') for WEBSOCKET_IDLE_TIMEOUT
+    seconds.
+    """
+
+    queue: Optional[deque] = None
+    # Task sending queued events, runs only while queue is not empty
+    sender: Optional[asyncio.Future] = None
+    last_seen: float = 0
+
+    # Open sockets of worker checked by one heartbeat task
+    connected: "weakref.WeakSet[RunningTestsConsumer]" = weakref.WeakSet()
+    heartbeat: Optional[asyncio.Future] = None
+
+    async def connect(self):
+        user = self.scope.get("user")
+        if user is None or not user.is_authenticated:
+            await self.close()
+            return
+        query = parse_qs(self.scope.get("query_string", b"").decode())
+        self.groups = await database_sync_to_async(self.get_groups)(user, query)
+        for group in self.groups:
+            await self.channel_layer.group_add(group, self.channel_name)
+        self.queue = deque()
+        self.last_seen = asyncio.get_running_loop().time()
+        await self.accept()
+        self.connected.add(self)
+        self.start_heartbeat()
+        metrics.incr("websocket.connections")
+
+        last_seq = query.get("last_seq", [""])[0]
+        for message in await database_sync_to_async(self.resume)(
+            int(last_seq) if last_seq.isdigit() else None
+        ):
+            self.enqueue(message)
+
+    def resume(self, last_seq: Optional[int]) -> List[Dict[str, Any]]:
+        """
+        Events missed by reconnected socket followed by 'sync' event or 'resync'
+        event if missed events are not kept
+        """
+        seq = events_log.last_seq()
+        if last_seq is None:
+            return [{"event": "sync", "seq": seq}]
+        missed = events_log.since(last_seq, self.groups)
+        if missed is None:
+            return [{"event": "resync", "seq": seq}]
+        return missed + [{"event": "sync", "seq": seq}]
+
+    @staticmethod
+    def get_groups(user, query: Dict[str, List[str]]) -> List[str]:
+        """
+        Groups of events socket of user is subscribed to
+        """
+        testing_result_id = query.get("testing_result", [""])[0]
+        if testing_result_id.isdigit():
+            testing_result = (
+                TestResult.objects.filter(id=int(testing_result_id))
+                .values("test_id", "launched_lecturer_id")
+                .first()
+            )
+            session = testing_result and get_session_store().get(user.id)
+            if testing_result and (
+                testing_result["launched_lecturer_id"] == user.id
+                or (session and session.test_id == testing_result["test_id"])
+            ):
+                return [testing_result_group(int(testing_result_id))]
+        if user.groups.filter(name="lecturer").exists():
+            return [lecturer_group(user.id)]
+        return [STUDENTS_GROUP]
+
+    async def disconnect(self, code):
+        if self.queue is not None:
+            if self.sender is not None:
+                self.sender.cancel()
+            self.connected.discard(self)
+            metrics.incr("websocket.connections", -1)
+
+    async def receive(self, text_data=None, bytes_data=None):
+        self.last_seen = asyncio.get_running_loop().time()
+
+    async def event(self, event):
+        self.enqueue({key: value for key, value in event.items() if key != "type"})
+
+    def enqueue(self, message: Dict[str, Any]) -> None:
+        """
+        Queue event for sending, if queue is full queued events are replaced
+        by 'resync' event
+        """
+        if len(self.queue) < settings.WEBSOCKET_QUEUE_SIZE:
+            self.queue.append(message)
+        else:
+            metrics.incr("websocket.dropped", len(self.queue) + 1)
+            self.queue.clear()
+            self.queue.append({"event": "resync", "seq": message.get("seq", 0)})
+        if self.sender is None or self.sender.done():
+            self.sender = asyncio.ensure_future(self.send_events())
+
+    async def send_events(self) -> None:
+        """
+        Send queued events
+        """
+        while self.queue:
+            await self.send(text_data=json.dumps(self.queue.popleft()))
+
+    @classmethod
+    def start_heartbeat(cls) -> None:
+        """
+        Start heartbeat task in event loop of consumers if it is not running
+        """
+        if cls.heartbeat is None or cls.heartbeat.done():
+            cls.heartbeat = asyncio.ensure_future(cls.send_heartbeats())
+
+    @classmethod
+    async def send_heartbeats(cls) -> None:
+        """
+        Ping open sockets and close sockets of clients which are gone
+        """
+        loop = asyncio.get_running_loop()
+        while cls.connected:
+            await asyncio.sleep(settings.WEBSOCKET_HEARTBEAT_SECONDS)
+            for consumer in list(cls.connected):
+                if loop.time() - consumer.last_seen > settings.WEBSOCKET_IDLE_TIMEOUT:
+                    metrics.incr("websocket.idle_closed")
+                    cls.connected.discard(consumer)
+                    await consumer.close()
+                else:
+                    consumer.enqueue({"event": "ping"})
@@ -0,0 +1,52 @@
+"""
+Signed deadlines of running tests
+
+Deadline of user's test is handed out once on test start as signed token, so
+left time can be checked without reading running test session from database.
+"""
+import time
+from datetime import datetime, timedelta
+from typing import Optional
+
+from django.core import signing
+
+SALT = "main.deadlines"
+
+
+def get_deadline(start_date: datetime, test_duration: int) -> float:
+    """
+    Deadline of test as unix timestamp
+    """
+    return (start_date + timedelta(seconds=test_duration)).timestamp()
+
+
+def sign_deadline(deadline: float) -> str:
+    """
+    Sign deadline of user's test
+
+    :param deadline: deadline as unix timestamp
+    :return: signed token
+    """
+    return signing.dumps({"deadline": deadline}, salt=SALT)
+
+
+def read_deadline(token: str) -> Optional[float]:
+    """
+    Check signed deadline token. Token itself proves that deadline was handed
+    out by server, so it is checked without reading session of user
+
+    :param token: token made by 'sign_deadline'
+    :return: deadline as unix timestamp or None if token is invalid
+    """
+    try:
+        data = signing.loads(token, salt=SALT)
+    except signing.BadSignature:
+        return None
+    return data.get("deadline")
+
+
+def get_time_left(deadline: float) -> float:
+    """
+    Seconds left until deadline, negative if deadline has passed
+    """
+    return deadline - time.time()
@@ -0,0 +1,89 @@
+"""
+Bounded log of sent running tests events for resuming dropped websockets
+
+Every sent event gets sequence number and is kept in ring buffer of
+EVENTS_BUFFER_SIZE slots in main_running_tests_events table, so reconnected
+socket receives only missed events of its groups from any worker. If socket
+fell out of buffer it is asked to reload snapshot. Sequence number of the last
+event is kept in row of slot -1 and incremented under its row lock, so
+numbers are unique and increase across all workers.
+"""
+from typing import Any, Dict, Iterable, List, Optional
+
+from django.conf import settings
+from django.db import transaction
+from django.db.models import F
+
+from .models import RunningTestsEvent
+
+COUNTER_SLOT = -1
+
+
+class EventsLog:
+    """
+    Ring buffer of events in database, slot of event is its sequence number
+    modulo buffer size
+    """
+
+    @property
+    def size(self) -> int:
+        return settings.EVENTS_BUFFER_SIZE
+
+    @staticmethod
+    def last_seq() -> int:
+        """
+        Sequence number of the last sent event
+        """
+        return (
+            RunningTestsEvent.objects.filter(slot=COUNTER_SLOT)
+            .values_list("seq", flat=True)
+            .first()
+            or 0
+        )
+
+    def append(self, groups: Iterable[str], message: Dict[str, Any]) -> int:
+        """
+        Add event sent to groups
+
+        :return: sequence number of event, stored event includes it in 'seq'
+        """
+        with transaction.atomic():
+            counter = RunningTestsEvent.objects.filter(slot=COUNTER_SLOT)
+            if not counter.update(seq=F("seq") + 1):
+                RunningTestsEvent.objects.get_or_create(
+                    slot=COUNTER_SLOT, defaults={"seq": 0}
+                )
+                counter.update(seq=F("seq") + 1)
+            seq = counter.values_list("seq", flat=True).get()
+            RunningTestsEvent.objects.update_or_create(
+                slot=seq % self.size,
+                defaults={
+                    "seq": seq,
+                    "groups": list(groups),
+                    "message": {**message, "seq": seq},
+                },
+            )
+        return seq
+
+    def since(self, seq: int, groups: Iterable[str]) -> Optional[List[Dict[str, Any]]]:
+        """
+        Events of groups sent after event with sequence number 'seq'
+
+        :return: list of events, None if some of them are not in buffer
+        """
+        last_seq = self.last_seq()
+        if seq > last_seq or last_seq - seq > self.size:
+            return None
+        slots = list(
+            RunningTestsEvent.objects.filter(seq__gt=seq, seq__lte=last_seq)
+            .exclude(slot=COUNTER_SLOT)
+            .order_by("seq")
+        )
+        if len(slots) != last_seq - seq:
+            # Overwritten by events sent meanwhile
+            return None
+        groups = set(groups)
+        return [slot.message for slot in slots if groups.intersection(slot.groups)]
+
+
+events_log = EventsLog()
@@ -0,0 +1,255 @@
+"""
+Running tests events sent by server to websockets clients
+
+Events of the same type about the same test emitted within
+EVENTS_DEBOUNCE_SECONDS are coalesced and sent once, so a burst of submissions
+causes a bounded number of messages.
+
+Events carry deltas applied by pages without refetching running tests: launch
+carries new testing result row, submissions carry rows of saved results with
+their ids
+(coalesced submissions are concatenated up to MAX_DELTA_RESULTS rows and
+MAX_EVENT_BYTES of encoded event, beyond that 'results' is null and page
+reloads snapshot). Sent events are numbered
+and kept for resuming dropped sockets, see main.eventlog.
+
+Events are sent only to groups of sockets affected by them: lecturer who
+launched the test gets all events, students choosing a test to pass get
+launched and stopped tests and students passing the test get only its stop.
+Results of students are never sent to other students.
+"""
+import atexit
+import json
+from typing import Any, Callable, Dict, Hashable, List, Optional
+
+from asgiref.sync import async_to_sync
+from channels.layers import get_channel_layer
+from django.conf import settings
+from django.contrib.auth.models import User
+from django.utils import timezone
+
+from .consumers import STUDENTS_GROUP, lecturer_group, testing_result_group
+from . import utils
+from .eventlog import events_log
+from .layers import NOTIFY_PAYLOAD_LIMIT
+from .metrics import metrics
+from .models import TestResult, UserResult
+from .writebehind import BatchWriter
+
+TEST_LAUNCHED = "test_launched"
+TEST_STOPPED = "test_stopped"
+TEST_PASSED = "test_passed"
+
+logger = utils.get_logger(__name__)
+
+MAX_DELTA_RESULTS = 50
+# Encoded event with envelope of channel layer message must fit into NOTIFY
+MAX_EVENT_BYTES = NOTIFY_PAYLOAD_LIMIT - 512
+DATE_FORMAT = "%H:%M:%S  %d-%m-%y"
+
+
+def get_result_row(user_result: UserResult, username: str) -> Dict[str, Any]:
+    """
+    Row of running test results table for saved result, the same as row
+    of RunningTestAPI response without answers to questions
+
+    :param user_result: saved <UserResult>
+    :param username: username of student passed test
+    :return: dict with result row
+    """
+    return {
+        "id": user_result.id,
+        "user": {"id": user_result.user_id, "username": username},
+        "right_answers_count": user_result.right_answers_count,
+        "tasks_num": user_result.tasks_num,
+        "time": user_result.time,
+        "date": timezone.localtime(user_result.date).strftime(DATE_FORMAT),
+    }
+
+
+def get_testing_result_row(testing_result: TestResult) -> Dict[str, Any]:
+    """
+    Running test row of RunningTestAPI response for just launched test, without
+    test description which size is not limited
+    """
+    test = testing_result.test
+    return {
+        "id": testing_result.id,
+        "test": {
+            "id": test.id,
+            "name": test.name,
+            "duration": test.duration,
+            "tasks_num": test.tasks_num,
+        },
+        "launched_lecturer": {"id": testing_result.launched_lecturer_id},
+        "results": [],
+    }
+
+
+def get_groups(event: Dict[str, Any]) -> List[str]:
+    """
+    Groups of sockets affected by event
+
+    :param event: dict with event type, test, testing result and lecturer ids
+    :return: list of groups names
+    """
+    groups = []
+    if event["event"] in (TEST_LAUNCHED, TEST_STOPPED):
+        groups.append(STUDENTS_GROUP)
+    if event["lecturer_id"] is not None:
+        groups.append(lecturer_group(event["lecturer_id"]))
+    if event["event"] == TEST_STOPPED:
+        groups.append(testing_result_group(event["testing_result_id"]))
+    return groups
+
+
+def resolve_testing_results(events: List[Dict[str, Any]]) -> None:
+    """
+    Fill running testing result and lecturer of events emitted only with test id
+    by one query
+    """
+    unresolved = [event for event in events if event["testing_result_id"] is None]
+    if not unresolved:
+        return
+    running = {
+        test_id: (testing_result_id, lecturer_id)
+        for test_id, testing_result_id, lecturer_id in TestResult.objects.filter(
+            is_running=True, test_id__in={event["test_id"] for event in unresolved}
+        ).values_list("test_id", "id", "launched_lecturer_id")
+    }
+    for event in unresolved:
+        event["testing_result_id"], event["lecturer_id"] = running.get(
+            event["test_id"], (None, None)
+        )
+
+
+def send_events(events: Dict[Hashable, Dict[str, Any]]) -> None:
+    """
+    Send coalesced events to groups of affected clients
+    """
+    events = [dict(event) for event in events.values()]
+    resolve_testing_results(events)
+    layer = get_channel_layer()
+    sent = 0
+    for event in events:
+        if event["testing_result_id"] is None:
+            # Test was stopped before event was sent
+            continue
+        message = {
+            "type": "event",
+            "event": event["event"],
+            "test_id": event["test_id"],
+            "testing_result_id": event["testing_result_id"],
+            **event["data"],
+        }
+        if (
+            message.get("results")
+            and len(json.dumps(message).encode()) > MAX_EVENT_BYTES
+        ):
+            message["results"] = None
+        groups = get_groups(event)
+        message["seq"] = events_log.append(groups, message)
+        try:
+            for group in groups:
+                async_to_sync(layer.group_send)(group, message)
+                sent += 1
+        except Exception:  # pylint: disable=broad-except
+            logger.exception("failed to send %s event", event["event"])
+            metrics.incr("events.errors")
+    metrics.incr("events.sent", sent)
+
+
+class EventsDebouncer(BatchWriter):
+    """
+    Buffer of events sent every EVENTS_DEBOUNCE_SECONDS. Pending events are
+    dropped on exit, sockets of exiting worker are closed anyway. Events which
+    failed to send are not retried, they may be delivered to some groups already
+    """
+
+    requeue = False
+
+    def __init__(self, name: str, apply: Callable[[Dict[Hashable, Any]], None]):
+        super().__init__(name, apply)
+        atexit.unregister(self.flush)
+
+    @property
+    def interval(self) -> float:
+        return settings.EVENTS_DEBOUNCE_SECONDS
+
+    def merge(self, pending: Dict[str, Any], value: Dict[str, Any]) -> Dict[str, Any]:
+        if value["event"] != TEST_PASSED:
+            return value
+        pending_rows = pending["data"].get("results")
+        rows = value["data"].get("results")
+        if (
+            pending_rows is None
+            or rows is None
+            or len(pending_rows) + len(rows) > MAX_DELTA_RESULTS
+        ):
+            return {**value, "data": {**value["data"], "results": None}}
+        return {**value, "data": {**value["data"], "results": pending_rows + rows}}
+
+
+events_debouncer = EventsDebouncer("events", send_events)
+
+
+def emit_results(user_results: List[UserResult]) -> None:
+    """
+    Schedule sending of saved results of passed tests
+
+    :param user_results: saved <UserResult> instances with loaded testing results
+    """
+    usernames = dict(
+        User.objects.filter(
+            id__in={user_result.user_id for user_result in user_results}
+        ).values_list("id", "username")
+    )
+    results: Dict[int, List[UserResult]] = {}
+    for user_result in user_results:
+        results.setdefault(user_result.testing_result_id, []).append(user_result)
+    for testing_result_results in results.values():
+        testing_result = testing_result_results[0].testing_result
+        emit(
+            TEST_PASSED,
+            testing_result.test_id,
+            testing_result,
+            {
+                "results": [
+                    get_result_row(user_result, usernames.get(user_result.user_id, ""))
+                    for user_result in testing_result_results
+                ]
+            },
+        )
+
+
+def emit(
+    event: str,
+    test_id: int,
+    testing_result: Optional[TestResult] = None,
+    data: Optional[Dict[str, Any]] = None,
+) -> None:
+    """
+    Schedule sending of event about test
+
+    :param event: type of event - TEST_LAUNCHED, TEST_STOPPED or TEST_PASSED
+    :param test_id: id of test
+    :param testing_result: <TestResult> of running test, if omitted it is
+    looked up when event is sent
+    :param data: delta sent to clients, 'testing_result' row for launched test
+    or 'results' rows for passed test
+    """
+    metrics.incr("events.emitted")
+    if event == TEST_PASSED:
+        data = {"results": None, **(data or {})}
+    events_debouncer.submit(
+        (event, test_id),
+        {
+            "event": event,
+            "test_id": test_id,
+            "testing_result_id": testing_result.id if testing_result else None,
+            "lecturer_id": (
+                testing_result.launched_lecturer_id if testing_result else None
+            ),
+            "data": data or {},
+        },
+    )
@@ -0,0 +1,121 @@
+"""
+Cache of rendered questions fragments for running test pages
+
+Question and each of its options are rendered once per question modification
+with placeholders instead of question number and option position, running test
+page is assembled from cached fragments in order of user's variant.
+"""
+import threading
+import uuid
+from collections import OrderedDict
+from datetime import datetime
+from typing import List, Tuple, Optional, NamedTuple
+
+from django.template.loader import render_to_string
+
+from .metrics import metrics
+from .pool import CachedQuestion
+
+MARKER = uuid.uuid4().hex
+
+
+class QuestionFragment(NamedTuple):
+    """
+    Rendered question as format strings: body with {num} and {options}
+    placeholders, options with {num} and {pos} placeholders
+    """
+
+    body: str
+    options: List[str]
+
+    def render(self, num: int, permutation: List[int]) -> str:
+        options = "".join(
+            self.options[idx].format(num=num, pos=pos)
+            for pos, idx in enumerate(permutation, start=1)
+        )
+        return self.body.format(num=num, options=options)
+
+
+def _to_format_string(html: str) -> str:
+    html = html.replace("{", "{{").replace("}", "}}")
+    for name in ("num", "pos", "options"):
+        html = html.replace(f"{name}{MARKER}", "{%s}" % name)
+    return html
+
+
+def render_fragment(question: CachedQuestion) -> QuestionFragment:
+    """
+    Render question fragment with placeholders
+    """
+    body = render_to_string(
+        "main/include/question.html",
+        {"question": question, "num": f"num{MARKER}", "options": f"options{MARKER}"},
+    )
+    options = [
+        render_to_string(
+            "main/include/questionOption.html",
+            {
+                "question": question,
+                "option": option,
+                "idx": idx,
+                "num": f"num{MARKER}",
+                "pos": f"pos{MARKER}",
+            },
+        )
+        for idx, option in enumerate(question.options)
+    ]
+    return QuestionFragment(
+        body=_to_format_string(body),
+        options=[_to_format_string(option) for option in options],
+    )
+
+
+class FragmentsCache:
+    """
+    LRU cache of rendered questions fragments keyed by question id
+    and time of its last modification
+    """
+
+    def __init__(self, max_size: int = 10_000):
+        self.max_size = max_size
+        self._lock = threading.Lock()
+        self._fragments: "OrderedDict[Tuple[int, Optional[datetime]], QuestionFragment]" = (
+            OrderedDict()
+        )
+
+    def get(self, question: CachedQuestion) -> QuestionFragment:
+        key = (question.id, question.updated_at)
+        with self._lock:
+            fragment = self._fragments.get(key)
+            if fragment is not None:
+                self._fragments.move_to_end(key)
+                metrics.incr("fragments.hits")
+                return fragment
+
+        metrics.incr("fragments.misses")
+        fragment = render_fragment(question)
+        with self._lock:
+            self._fragments[key] = fragment
+            if len(self._fragments) > self.max_size:
+                self._fragments.popitem(last=False)
+        return fragment
+
+    def clear(self) -> None:
+        with self._lock:
+            self._fragments.clear()
+
+
+fragments_cache = FragmentsCache()
+
+
+def render_questions(questions: List[Tuple[CachedQuestion, List[int]]]) -> str:
+    """
+    Assemble questions list of running test page from cached fragments
+
+    :param questions: list of (question, options permutation) in shown order
+    :return: html with questions list
+    """
+    return "".join(
+        fragments_cache.get(question).render(num, permutation)
+        for num, (question, permutation) in enumerate(questions, start=1)
+    )
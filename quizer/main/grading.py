@@ -0,0 +1,330 @@
+"""
+Grading of users answers encoded by options indices and re-grading of saved
+results after answer key changes
+
+Answers are sent and saved as indices of options in question, results saved
+before that keep options texts and are decoded by texts of current options.
+"""
+import json
+import time
+from typing import Any, Dict, Iterable, List, NamedTuple, Optional, Tuple, Union
+
+from django.db import connection
+from django.db.models import QuerySet
+
+from . import utils
+from .metrics import metrics
+from .models import Question, UserResult, RunningTestsAnswers
+from .pool import CachedQuestion
+from .variants import restore_layout
+
+logger = utils.get_logger(__name__)
+
+SEQUENCE_TYPES = (Question.Type.SEQUENCE, Question.Type.SEQUENCE_WITH_IMAGES)
+
+# Rows per UPDATE statement, 3 params per row fit into SQLite limit of 999 params
+UPDATE_BATCH_SIZE = 300
+
+
+class AnswerKey(NamedTuple):
+    """
+    Right options of question as options indices and texts. Sequences are
+    checked in order, other questions - as sets of selected options
+    """
+
+    right_indices: List[int]
+    right_options: List[str]
+    ordered: bool
+    indices: Dict[str, int]
+
+    @classmethod
+    def from_question(cls, question: Union[Question, CachedQuestion]) -> "AnswerKey":
+        options = question.options
+        if question.type in SEQUENCE_TYPES:
+            right_indices = sorted(
+                range(len(options)), key=lambda idx: int(options[idx]["num"])
+            )
+        else:
+            right_indices = [
+                idx for idx, option in enumerate(options) if option["is_true"]
+            ]
+        return cls(
+            right_indices=right_indices,
+            right_options=[options[idx]["option"] for idx in right_indices],
+            ordered=question.type in SEQUENCE_TYPES,
+            indices={option["option"]: idx for idx, option in enumerate(options)},
+        )
+
+    def check(self, selected: List[int]) -> bool:
+        if self.ordered:
+            return selected == self.right_indices
+        return len(selected) == len(self.right_indices) and set(selected) == set(
+            self.right_indices
+        )
+
+    def decode(self, selected_options: List[str]) -> Optional[List[int]]:
+        """
+        Indices of options saved as texts, None if some of them are not found
+        """
+        try:
+            return [self.indices[option] for option in selected_options]
+        except KeyError:
+            return None
+
+    def check_options(self, selected_options: List[str]) -> bool:
+        if self.ordered:
+            return selected_options == self.right_options
+        return len(selected_options) == len(self.right_options) and set(
+            selected_options
+        ) == set(self.right_options)
+
+    def encode(self, question_id: Union[int, str], selected: List[int]) -> Dict:
+        """
+        Answer in format saved in 'questions' of <UserResult>
+        """
+        return {
+            "question_id": str(question_id),
+            "selected": selected,
+            "right": self.right_indices,
+            "is_true": self.check(selected),
+        }
+
+
+# Answer keys of cached questions by question id and time of its last modification
+_answer_keys: Dict[Tuple[int, Any], AnswerKey] = {}
+ANSWER_KEYS_MAX_SIZE = 10_000
+
+
+def get_answer_key(question: CachedQuestion) -> AnswerKey:
+    """
+    Answer key of cached question, built once per question modification
+    """
+    key = (question.id, question.updated_at)
+    answer_key = _answer_keys.get(key)
+    if answer_key is None:
+        if len(_answer_keys) >= ANSWER_KEYS_MAX_SIZE:
+            _answer_keys.clear()
+        answer_key = _answer_keys[key] = AnswerKey.from_question(question)
+    return answer_key
+
+
+def parse_answers(form: Dict[str, List[str]]) -> Dict[int, List[int]]:
+    """
+    Selected options indices by questions numbers from submitted test form:
+    '{num}': [option index, ...] - for single answer and sequences (in order
+    set by user), '{num}_{option index}': ['on'] - for multiselect
+
+    :param form: submitted form data, dict of lists of values
+    :return: dict with lists of selected options indices
+    """
+    answers: Dict[int, List[int]] = {}
+    for key, values in form.items():
+        num, _, idx = key.partition("_")
+        if not num.isdigit():
+            continue
+        selected = answers.setdefault(int(num), [])
+        if idx:
+            if idx.isdigit():
+                selected.append(int(idx))
+        else:
+            selected += [int(value) for value in values if value.isdigit()]
+    return answers
+
+
+def parse_saved_answers(data: str) -> Optional[Dict[int, List[int]]]:
+    """
+    Answers sent by autosave or final submit of autosaved test as JSON object
+    {'{num}': [option index, ...]}
+
+    :param data: JSON string
+    :return: dict with lists of selected options indices or None if data
+    is invalid
+    """
+    try:
+        answers = json.loads(data)
+    except ValueError:
+        return None
+    if not isinstance(answers, dict):
+        return None
+    parsed = {}
+    for num, selected in answers.items():
+        if not (
+            str(num).isdigit()
+            and isinstance(selected, list)
+            and all(isinstance(idx, int) and idx >= 0 for idx in selected)
+        ):
+            return None
+        parsed[int(num)] = selected
+    return parsed
+
+
+def grade_session(
+    form: Dict[str, List[str]], session: RunningTestsAnswers
+) -> Dict[str, Any]:
+    """
+    Grade submitted form of running test session. Form with 'answers' field
+    commits autosaved answers of session updated by answers in the field,
+    otherwise all answers are taken from form
+
+    :param form: submitted form data, dict of lists of values
+    :param session: <RunningTestsAnswers> instance
+    :return: dict with testing result
+    """
+    if session.layout is None:
+        return utils.grade_answers(
+            form, session.right_answers or [], session.test_duration
+        )
+    if "answers" in form:
+        answers = {
+            int(num): selected for num, selected in (session.answers or {}).items()
+        }
+        answers.update(parse_saved_answers(form["answers"][0]) or {})
+    else:
+        answers = parse_answers(form)
+    questions = []
+    layout = restore_layout(session.test, session.layout) if session.test else []
+    for question_num, question, _ in layout:
+        questions.append(
+            get_answer_key(question).encode(question.id, answers.get(question_num, []))
+        )
+    return {
+        "time": session.test_duration - int(form.get("time", ["0"])[0]),
+        "tasks_num": len(questions),
+        "right_answers_count": sum(question["is_true"] for question in questions),
+        "questions": questions,
+    }
+
+
+def regrade_result(
+    questions: List[Dict[str, Any]], keys: Dict[str, AnswerKey]
+) -> Tuple[bool, int]:
+    """
+    Re-grade answers of user result with current answer keys. Answers saved as
+    options texts are converted to indices if all their options still exist.
+    Answers to deleted questions keep their grades
+
+    :param questions: 'questions' of <UserResult>, updated in place
+    :param keys: answer keys by questions ids
+    :return: (True if answers were changed, number of right answers)
+    """
+    changed = False
+    right_answers_count = 0
+    for idx, question in enumerate(questions):
+        key = keys.get(str(question["question_id"]))
+        if key is None:
+            right_answers_count += bool(question.get("is_true"))
+            continue
+        if "selected" in question:
+            selected = question["selected"]
+        else:
+            selected = key.decode(question["selected_options"])
+        if selected is None:
+            is_true = key.check_options(question["selected_options"])
+            if bool(question.get("is_true")) != is_true:
+                question["is_true"] = is_true
+                changed = True
+            if question["right_options"] != key.right_options:
+                question["right_options"] = key.right_options
+                changed = True
+        else:
+            answer = key.encode(question["question_id"], selected)
+            is_true = answer["is_true"]
+            if answer != question:
+                questions[idx] = answer
+                changed = True
+        right_answers_count += is_true
+    return changed, right_answers_count
+
+
+def update_results(results: List[Tuple[int, List[Dict[str, Any]], int]]) -> None:
+    """
+    Write re-graded results by UPDATE ... FROM VALUES statements. Unlike
+    bulk_update, no CASE WHEN expression is built for every row
+
+    :param results: list of (id, questions, right answers count)
+    """
+    if connection.vendor not in ("postgresql", "sqlite"):
+        UserResult.objects.bulk_update(
+            [
+                UserResult(id=result_id, questions=questions, right_answers_count=count)
+                for result_id, questions, count in results
+            ],
+            ["questions", "right_answers_count"],
+        )
+        return
+    table = connection.ops.quote_name(UserResult._meta.db_table)
+    questions_value = "v.questions"
+    if connection.vendor == "postgresql":
+        questions_value = "CAST(v.questions AS jsonb)"
+    with connection.cursor() as cursor:
+        for idx in range(0, len(results), UPDATE_BATCH_SIZE):
+            batch = results[idx : idx + UPDATE_BATCH_SIZE]
+            params = []
+            for result_id, questions, count in batch:
+                params += [result_id, json.dumps(questions), count]
+            cursor.execute(
+                f"WITH v(id, questions, right_answers_count) AS "
+                f"(VALUES {', '.join(['(%s, %s, %s)'] * len(batch))}) "
+                f"UPDATE {table} SET questions = {questions_value}, "
+                f"right_answers_count = v.right_answers_count "
+                f"FROM v WHERE {table}.id = v.id",
+                params,
+            )
+
+
+def regrade_results(
+    test_ids: Optional[Iterable[int]] = None,
+    subject_id: Optional[int] = None,
+    chunk_size: int = 2000,
+) -> Dict[str, Any]:
+    """
+    Re-grade saved results of tests or subject after changes of right options.
+    Results are streamed in chunks and only changed ones are written back by
+    batched UPDATE statements
+
+    :param test_ids: ids of tests whose results are re-graded
+    :param subject_id: id of subject whose results are re-graded
+    :param chunk_size: number of results loaded and updated at once
+    :return: dict with number of processed and updated results and duration
+    of re-grading in seconds
+    """
+    start = time.perf_counter()
+    results: QuerySet = UserResult.objects.all()
+    questions: QuerySet = Question.objects.all()
+    if test_ids is not None:
+        test_ids = list(test_ids)
+        results = results.filter(testing_result__test__id__in=test_ids)
+        questions = questions.filter(test__id__in=test_ids)
+    if subject_id is not None:
+        results = results.filter(testing_result__test__subject__id=subject_id)
+        questions = questions.filter(test__subject__id=subject_id)
+    keys = {
+        str(question.id): AnswerKey.from_question(question)
+        for question in questions.only("id", "type", "options")
+    }
+
+    processed = updated = 0
+    changed = []
+    for result_id, answers, count in results.values_list(
+        "id", "questions", "right_answers_count"
+    ).iterator(chunk_size=chunk_size):
+        processed += 1
+        answers_changed, right_answers_count = regrade_result(answers, keys)
+        if answers_changed or count != right_answers_count:
+            changed.append((result_id, answers, right_answers_count))
+        if len(changed) >= chunk_size:
+            update_results(changed)
+            updated += len(changed)
+            changed = []
+    if changed:
+        update_results(changed)
+        updated += len(changed)
+
+    seconds = time.perf_counter() - start
+    metrics.incr("regrading.processed", processed)
+    metrics.incr("regrading.updated", updated)
+    metrics.observe("regrading.run", seconds)
+    logger.info(
+        "re-graded %d results, updated %d in %.3f s", processed, updated, seconds
+    )
+    return {"processed": processed, "updated": updated, "seconds": seconds}
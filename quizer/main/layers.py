@@ -0,0 +1,230 @@
+"""
+Channel layer shared between worker processes through PostgreSQL LISTEN/NOTIFY
+
+Each process keeps its channels and groups in memory, like InMemoryChannelLayer.
+Messages to groups and to channels of other processes are published by NOTIFY
+to one PostgreSQL channel, every process listens to it in background thread
+and delivers received messages to its own channels. Messages must be JSON
+serializable and fit into NOTIFY payload limit of 8000 bytes.
+
+If database is not PostgreSQL, layer works in single process mode, like
+LocalChannelLayer.
+"""
+import asyncio
+import json
+import random
+import select
+import string
+import threading
+import time
+import uuid
+from typing import Any, Dict, Optional
+
+from channels.exceptions import ChannelFull
+from channels.layers import InMemoryChannelLayer
+from django.conf import settings
+
+from . import utils
+from .metrics import metrics
+
+logger = utils.get_logger(__name__)
+
+NOTIFY_PAYLOAD_LIMIT = 8000
+
+
+class LocalChannelLayer(InMemoryChannelLayer):
+    """
+    In-process channel layer accepting group messages sent from other threads,
+    i.e. by events debouncer. Such messages are put to channels in event loop
+    of consumers, queues of InMemoryChannelLayer are not thread-safe
+    """
+
+    def __init__(self, **kwargs):
+        super().__init__(**kwargs)
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+
+    def _attach(self) -> None:
+        """
+        Remember event loop of consumers
+        """
+        self._loop = asyncio.get_running_loop()
+
+    async def new_channel(self, prefix: str = "specific.") -> str:
+        self._attach()
+        return await super().new_channel(prefix)
+
+    async def receive(self, channel: str) -> Dict[str, Any]:
+        self._attach()
+        return await super().receive(channel)
+
+    async def group_add(self, group: str, channel: str) -> None:
+        self._attach()
+        await super().group_add(group, channel)
+
+    async def group_send(self, group: str, message: Dict[str, Any]) -> None:
+        loop = self._loop
+        if (
+            loop is not None
+            and loop is not asyncio.get_running_loop()
+            and not loop.is_closed()
+        ):
+            await asyncio.wrap_future(
+                asyncio.run_coroutine_threadsafe(
+                    InMemoryChannelLayer.group_send(self, group, message), loop
+                )
+            )
+        else:
+            await super().group_send(group, message)
+
+
+class PostgresChannelLayer(LocalChannelLayer):
+    """
+    In-memory channel layer with fan-out of messages between processes by
+    PostgreSQL LISTEN/NOTIFY
+    """
+
+    def __init__(
+        self,
+        database: str = "default",
+        channel: str = "quizer_channel_layer",
+        **kwargs,
+    ):
+        super().__init__(**kwargs)
+        self.database = database
+        self.channel = channel
+        self.instance = uuid.uuid4().hex[:12]
+        self._listener: Optional[threading.Thread] = None
+        self._connection = None
+        self._publish_lock = threading.Lock()
+
+    @property
+    def shared(self) -> bool:
+        """
+        True if messages are shared with other processes
+        """
+        return "postgresql" in settings.DATABASES[self.database]["ENGINE"]
+
+    def _connect(self):
+        import psycopg2  # pylint: disable=import-outside-toplevel
+
+        params = settings.DATABASES[self.database]
+        connection = psycopg2.connect(
+            dbname=params.get("NAME"),
+            host=params.get("HOST") or None,
+            port=params.get("PORT") or None,
+            user=params.get("USER") or None,
+            password=params.get("PASSWORD") or None,
+        )
+        connection.autocommit = True
+        return connection
+
+    def _attach(self) -> None:
+        """
+        Remember event loop of consumers and start listening to other processes
+        """
+        super()._attach()
+        if self.shared and self._listener is None:
+            self._listener = threading.Thread(
+                target=self._listen, name="channel-layer-listener", daemon=True
+            )
+            self._listener.start()
+
+    # Channel layer API
+
+    async def new_channel(self, prefix: str = "specific.") -> str:
+        self._attach()
+        return "%s.%s!%s" % (
+            prefix,
+            self.instance,
+            "".join(random.choice(string.ascii_letters) for _ in range(12)),
+        )
+
+    async def send(self, channel: str, message: Dict[str, Any]) -> None:
+        if self._is_local(channel) or not self.shared:
+            await super().send(channel, message)
+        else:
+            await self._publish({"channel": channel, "message": message})
+
+    async def group_send(self, group: str, message: Dict[str, Any]) -> None:
+        await super().group_send(group, message)
+        if self.shared:
+            await self._publish({"group": group, "message": message})
+
+    async def close(self) -> None:
+        if self._connection is not None:
+            self._connection.close()
+            self._connection = None
+
+    # Fan-out between processes
+
+    def _is_local(self, channel: str) -> bool:
+        return "!" not in channel or channel.split("!")[0].endswith("." + self.instance)
+
+    async def _publish(self, data: Dict[str, Any]) -> None:
+        payload = json.dumps({"origin": self.instance, **data})
+        if len(payload.encode()) >= NOTIFY_PAYLOAD_LIMIT:
+            raise ChannelFull("message is too large for NOTIFY payload")
+        await asyncio.get_running_loop().run_in_executor(None, self._notify, payload)
+
+    def _notify(self, payload: str) -> None:
+        with self._publish_lock:
+            for attempt in range(2):
+                try:
+                    if self._connection is None or self._connection.closed:
+                        self._connection = self._connect()
+                    with self._connection.cursor() as cursor:
+                        cursor.execute(
+                            "SELECT pg_notify(%s, %s)", (self.channel, payload)
+                        )
+                    metrics.incr("channel_layer.published")
+                    return
+                except Exception:  # pylint: disable=broad-except
+                    self._connection = None
+                    if attempt:
+                        logger.exception("failed to publish channel layer message")
+                        metrics.incr("channel_layer.errors")
+
+    def _listen(self) -> None:
+        from psycopg2 import sql  # pylint: disable=import-outside-toplevel
+
+        while True:
+            connection = None
+            try:
+                connection = self._connect()
+                with connection.cursor() as cursor:
+                    cursor.execute(
+                        sql.SQL("LISTEN {}").format(sql.Identifier(self.channel))
+                    )
+                while True:
+                    if select.select([connection], [], [], 5) == ([], [], []):
+                        continue
+                    connection.poll()
+                    while connection.notifies:
+                        self._dispatch(connection.notifies.pop(0).payload)
+            except Exception:  # pylint: disable=broad-except
+                logger.exception("channel layer listener failed, reconnecting")
+                metrics.incr("channel_layer.errors")
+                if connection is not None:
+                    connection.close()
+                time.sleep(1)
+
+    def _dispatch(self, payload: str) -> None:
+        """
+        Deliver message published by another process to local channels
+        """
+        data = json.loads(payload)
+        loop = self._loop
+        if data.get("origin") == self.instance or loop is None or loop.is_closed():
+            return
+        metrics.incr("channel_layer.received")
+        if "group" in data:
+            coroutine = InMemoryChannelLayer.group_send(
+                self, data["group"], data["message"]
+            )
+        elif self._is_local(data["channel"]):
+            coroutine = InMemoryChannelLayer.send(
+                self, data["channel"], data["message"]
+            )
+        else:
+            return
+        asyncio.run_coroutine_threadsafe(coroutine, loop)
@@ -0,0 +1,33 @@
+"""
+Re-grade saved users results with current right options of questions
+"""
+from django.core.management.base import BaseCommand, CommandError
+
+from main.grading import regrade_results
+
+
+class Command(BaseCommand):
+    help = "Re-grade saved users results with current right options of questions"
+
+    def add_arguments(self, parser):
+        parser.add_argument("--test", type=int, nargs="+", help="Ids of tests")
+        parser.add_argument("--subject", type=int, help="Id of subject")
+        parser.add_argument(
+            "--all", action="store_true", help="Re-grade results of all tests"
+        )
+        parser.add_argument(
+            "--chunk-size", type=int, default=2000, help="Results processed at once"
+        )
+
+    def handle(self, *args, **options):
+        if not (options["test"] or options["subject"] or options["all"]):
+            raise CommandError("Specify --test, --subject or --all")
+        report = regrade_results(
+            test_ids=options["test"],
+            subject_id=options["subject"],
+            chunk_size=options["chunk_size"],
+        )
+        self.stdout.write(
+            "Processed: %(processed)d, updated: %(updated)d, time: %(seconds).3f s"
+            % report
+        )
@@ -0,0 +1,60 @@
+"""
+Finalize expired running test sessions and delete orphaned ones
+"""
+import time
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from django.db import close_old_connections
+
+from main import utils
+from main.metrics import metrics
+from main.sweeper import sweep_sessions
+
+logger = utils.get_logger(__name__)
+
+
+class Command(BaseCommand):
+    help = "Finalize expired running test sessions and delete orphaned ones"
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--loop", action="store_true", help="Sweep sessions periodically"
+        )
+        parser.add_argument(
+            "--interval",
+            type=int,
+            default=settings.SWEEPER_INTERVAL,
+            help="Interval between sweeps in seconds",
+        )
+        parser.add_argument(
+            "--grace",
+            type=int,
+            default=settings.SESSION_GRACE_SECONDS,
+            help="Grace period after test duration in seconds",
+        )
+        parser.add_argument(
+            "--batch-size", type=int, default=500, help="Sessions finalized at once"
+        )
+
+    def handle(self, *args, **options):
+        while True:
+            try:
+                report = sweep_sessions(
+                    grace=options["grace"], batch_size=options["batch_size"]
+                )
+            except Exception:  # pylint: disable=broad-except
+                if not options["loop"]:
+                    raise
+                # Transient database error must not stop background sweeper
+                logger.exception("failed to sweep sessions")
+                metrics.incr("sweeper.errors")
+                close_old_connections()
+            else:
+                self.stdout.write(
+                    "Finalized: %(finalized)d, orphaned: %(orphans)d, "
+                    "time: %(seconds).3f s" % report
+                )
+            if not options["loop"]:
+                break
+            time.sleep(options["interval"])
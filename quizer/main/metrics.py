@@ -0,0 +1,69 @@
+"""
+In-process metrics (counters, gauges and timings) of the current worker
+"""
+import threading
+import time
+from collections import defaultdict
+from contextlib import contextmanager
+from typing import Dict, Any
+
+
+class Metrics:
+    """
+    Thread-safe registry of worker metrics, exposed through MetricsAPI
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._counters = defaultdict(int)
+        self._gauges = {}
+        self._timings = {}
+
+    def incr(self, name: str, value: int = 1) -> None:
+        with self._lock:
+            self._counters[name] += value
+
+    def gauge(self, name: str, value: float) -> None:
+        with self._lock:
+            self._gauges[name] = value
+
+    def observe(self, name: str, seconds: float) -> None:
+        with self._lock:
+            count, total, maximum = self._timings.get(name, (0, 0.0, 0.0))
+            self._timings[name] = (count + 1, total + seconds, max(maximum, seconds))
+
+    @contextmanager
+    def timer(self, name: str):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(name, time.perf_counter() - start)
+
+    def get(self, name: str) -> int:
+        with self._lock:
+            return self._counters.get(name, 0)
+
+    def snapshot(self) -> Dict[str, Any]:
+        with self._lock:
+            return {
+                "counters": dict(self._counters),
+                "gauges": dict(self._gauges),
+                "timings": {
+                    name: {
+                        "count": count,
+                        "avg": total / count if count else 0.0,
+                        "max": maximum,
+                    }
+                    for name, (count, total, maximum) in self._timings.items()
+                },
+            }
+
+    def reset(self) -> None:
+        with self._lock:
+            self._counters.clear()
+            self._gauges.clear()
+            self._timings.clear()
+
+
+metrics = Metrics()
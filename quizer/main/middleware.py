@@ -0,0 +1,167 @@
+"""
+Admission control of running test starts
+
+When test is launched all connected students start it at the same moment, so
+number of simultaneously processed starts is limited by EXAM_ADMISSION_LIMIT.
+Students beyond the limit get lightweight waiting page with their position in
+queue, which retries start automatically.
+"""
+import asyncio
+import threading
+import time
+import uuid
+from collections import OrderedDict
+from typing import Dict, Optional, Tuple
+
+from django.conf import settings
+from django.contrib.auth import SESSION_KEY
+from django.http import HttpRequest, HttpResponse
+from django.template.loader import render_to_string
+from django.urls import reverse
+from django.utils.decorators import sync_and_async_middleware
+
+from .metrics import metrics
+
+
+class AdmissionQueue:
+    """
+    FIFO queue of running test starts of the current worker
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.active = 0
+        # ticket -> (time of enqueueing, time of last retry)
+        self._waiting: "OrderedDict[str, Tuple[float, float]]" = OrderedDict()
+
+    def _expire(self, now: float) -> None:
+        ttl = settings.EXAM_ADMISSION_RETRY_SECONDS * 3
+        for ticket, (_, last_seen) in list(self._waiting.items()):
+            if now - last_seen > ttl:
+                del self._waiting[ticket]
+
+    def _update_gauges(self) -> None:
+        metrics.gauge("admission.active", self.active)
+        metrics.gauge("admission.queue_depth", len(self._waiting))
+
+    def enter(self, ticket: Optional[str] = None) -> Tuple[bool, str, int]:
+        """
+        Try to admit test start. Start is admitted if there is free slot which
+        is not reserved for students waiting ahead in queue
+
+        :param ticket: ticket received by student on previous attempt
+        :return: (is admitted, ticket, position in queue starting from 1)
+        """
+        now = time.monotonic()
+        with self._lock:
+            self._expire(now)
+            if ticket not in self._waiting:
+                ticket = None
+            tickets = list(self._waiting)
+            ahead = tickets.index(ticket) if ticket else len(tickets)
+            free = settings.EXAM_ADMISSION_LIMIT - self.active
+            if ahead < free:
+                self.active += 1
+                if ticket:
+                    enqueued, _ = self._waiting.pop(ticket)
+                    metrics.observe("admission.wait", now - enqueued)
+                metrics.incr("admission.admitted")
+                self._update_gauges()
+                return True, ticket or "", 0
+
+            if not ticket:
+                ticket = uuid.uuid4().hex
+                self._waiting[ticket] = (now, now)
+                metrics.incr("admission.queued")
+            else:
+                self._waiting[ticket] = (self._waiting[ticket][0], now)
+            self._update_gauges()
+            return False, ticket, ahead + 1
+
+    def leave(self) -> None:
+        with self._lock:
+            self.active -= 1
+            self._update_gauges()
+
+    def clear(self) -> None:
+        with self._lock:
+            self.active = 0
+            self._waiting.clear()
+            self._update_gauges()
+
+    def stats(self) -> Dict[str, int]:
+        with self._lock:
+            return {"active": self.active, "queue_depth": len(self._waiting)}
+
+
+exam_admission = AdmissionQueue()
+
+
+def waiting_response(request: HttpRequest, ticket: str, position: int) -> HttpResponse:
+    """
+    Waiting page resubmitting test start with received ticket. Rendered without
+    user, so only session is read for students in queue
+    """
+    retry_seconds = settings.EXAM_ADMISSION_RETRY_SECONDS
+    context = {
+        "position": position,
+        "ticket": ticket,
+        "test_id": request.POST.get("test_id", ""),
+        "csrf_token": request.POST.get("csrfmiddlewaretoken", ""),
+        "retry_seconds": retry_seconds,
+        "action": request.path,
+    }
+    response = HttpResponse(render_to_string("main/student/waitingRoom.html", context))
+    response["Retry-After"] = str(retry_seconds)
+    return response
+
+
+@sync_and_async_middleware
+def exam_admission_middleware(get_response):
+    """
+    Limit number of simultaneously processed POST requests to student_run_test.
+    Requests without logged in user are redirected to login by the view, so they
+    do not take admission slots. User is checked by session only, without
+    loading user from database
+    """
+
+    def admit(request: HttpRequest) -> Tuple[bool, Optional[HttpResponse]]:
+        if (
+            settings.EXAM_ADMISSION_LIMIT <= 0
+            or request.method != "POST"
+            or request.path != reverse("main:student_run_test")
+            or SESSION_KEY not in request.session
+        ):
+            return False, None
+        admitted, ticket, position = exam_admission.enter(
+            request.POST.get("admission_ticket")
+        )
+        if admitted:
+            return True, None
+        return False, waiting_response(request, ticket, position)
+
+    if asyncio.iscoroutinefunction(get_response):
+
+        async def middleware(request: HttpRequest) -> HttpResponse:
+            admitted, response = admit(request)
+            if response:
+                return response
+            try:
+                return await get_response(request)
+            finally:
+                if admitted:
+                    exam_admission.leave()
+
+    else:
+
+        def middleware(request: HttpRequest) -> HttpResponse:
+            admitted, response = admit(request)
+            if response:
+                return response
+            try:
+                return get_response(request)
+            finally:
+                if admitted:
+                    exam_admission.leave()
+
+    return middleware
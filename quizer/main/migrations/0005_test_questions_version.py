@@ -0,0 +1,18 @@
+# Generated by Django 3.1.13 on 2026-10-18 18:07
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("main", "0004_auto_20211026_2056"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="test",
+            name="questions_version",
+            field=models.IntegerField(default=0, verbose_name="Версия набора вопросов"),
+        ),
+    ]
@@ -0,0 +1,57 @@
+# Generated by Django 3.1.13 on 2026-10-18 18:08
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("main", "0005_test_questions_version"),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name="TestVariant",
+            fields=[
+                (
+                    "id",
+                    models.AutoField(
+                        auto_created=True,
+                        primary_key=True,
+                        serialize=False,
+                        verbose_name="ID",
+                    ),
+                ),
+                ("num", models.IntegerField(verbose_name="Номер варианта")),
+                (
+                    "seed",
+                    models.BigIntegerField(verbose_name="Зерно генератора варианта"),
+                ),
+                (
+                    "layout",
+                    models.BinaryField(
+                        verbose_name="Порядок вопросов и вариантов ответов"
+                    ),
+                ),
+                (
+                    "html",
+                    models.TextField(verbose_name="Сформированные вопросы варианта"),
+                ),
+                (
+                    "testing_result",
+                    models.ForeignKey(
+                        on_delete=django.db.models.deletion.CASCADE,
+                        related_name="variants",
+                        to="main.testresult",
+                        verbose_name="Результаты тестирования",
+                    ),
+                ),
+            ],
+            options={
+                "verbose_name": "Вариант теста",
+                "verbose_name_plural": "Варианты тестов",
+                "db_table": "main_test_variants",
+            },
+        ),
+    ]
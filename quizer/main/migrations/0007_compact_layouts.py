@@ -0,0 +1,32 @@
+# Generated by Django 3.1.13 on 2026-10-18 18:40
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("main", "0006_testvariant"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="runningtestsanswers",
+            name="seed",
+            field=models.BigIntegerField(
+                null=True, verbose_name="Зерно генератора варианта"
+            ),
+        ),
+        migrations.AddField(
+            model_name="runningtestsanswers",
+            name="layout",
+            field=models.BinaryField(
+                null=True, verbose_name="Порядок вопросов и вариантов ответов"
+            ),
+        ),
+        migrations.AlterField(
+            model_name="runningtestsanswers",
+            name="right_answers",
+            field=models.JSONField(blank=True, null=True),
+        ),
+    ]
@@ -0,0 +1,20 @@
+# Generated by Django 3.1.13 on 2026-10-18 18:17
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("main", "0007_compact_layouts"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="question",
+            name="updated_at",
+            field=models.DateTimeField(
+                auto_now=True, verbose_name="Время последнего изменения"
+            ),
+        ),
+    ]
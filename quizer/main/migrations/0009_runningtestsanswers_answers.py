@@ -0,0 +1,20 @@
+# Generated by Django 3.1.13 on 2026-10-18 22:05
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("main", "0008_question_updated_at"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="runningtestsanswers",
+            name="answers",
+            field=models.JSONField(
+                blank=True, null=True, verbose_name="Сохраненные ответы"
+            ),
+        ),
+    ]
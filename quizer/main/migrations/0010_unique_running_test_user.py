@@ -0,0 +1,37 @@
+# Generated by Django 3.1.13 on 2026-10-18 22:40
+
+from django.db import migrations, models
+from django.db.models import Max
+
+
+def delete_duplicate_sessions(apps, schema_editor):
+    """
+    Keep only the latest running test session of each user
+    """
+    RunningTestsAnswers = apps.get_model("main", "RunningTestsAnswers")
+    latest_ids = (
+        RunningTestsAnswers.objects.filter(user__isnull=False)
+        .values("user")
+        .annotate(latest_id=Max("id"))
+        .values_list("latest_id", flat=True)
+    )
+    RunningTestsAnswers.objects.filter(user__isnull=False).exclude(
+        id__in=list(latest_ids)
+    ).delete()
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("main", "0009_runningtestsanswers_answers"),
+    ]
+
+    operations = [
+        migrations.RunPython(delete_duplicate_sessions, migrations.RunPython.noop),
+        migrations.AddConstraint(
+            model_name="runningtestsanswers",
+            constraint=models.UniqueConstraint(
+                fields=("user",), name="unique_running_test_user"
+            ),
+        ),
+    ]
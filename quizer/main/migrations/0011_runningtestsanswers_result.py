@@ -0,0 +1,20 @@
+# Generated by Django 3.1.13 on 2026-10-19 10:12
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("main", "0010_unique_running_test_user"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="runningtestsanswers",
+            name="result",
+            field=models.JSONField(
+                blank=True, null=True, verbose_name="Результат отправленного теста"
+            ),
+        ),
+    ]
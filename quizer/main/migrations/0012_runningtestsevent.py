@@ -0,0 +1,40 @@
+# Generated by Django 3.1.13 on 2026-10-19 11:30
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("main", "0011_runningtestsanswers_result"),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name="RunningTestsEvent",
+            fields=[
+                (
+                    "slot",
+                    models.IntegerField(
+                        primary_key=True,
+                        serialize=False,
+                        verbose_name="Ячейка кольцевого буфера",
+                    ),
+                ),
+                (
+                    "seq",
+                    models.BigIntegerField(verbose_name="Порядковый номер события"),
+                ),
+                (
+                    "groups",
+                    models.JSONField(default=list, verbose_name="Группы получателей"),
+                ),
+                ("message", models.JSONField(default=dict, verbose_name="Событие")),
+            ],
+            options={
+                "verbose_name": "Событие запущенных тестов",
+                "verbose_name_plural": "События запущенных тестов",
+                "db_table": "main_running_tests_events",
+            },
+        ),
+    ]
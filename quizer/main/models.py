@@ -85,6 +85,7 @@ class Test(models.Model):
     description = models.TextField("Описание теста", default="")
     tasks_num = models.IntegerField("Количество заданий в тесте", default=0)
     duration = models.IntegerField("Длительность теста в секундах", default=300)
+    questions_version = models.IntegerField("Версия набора вопросов", default=0)
     objects = TestManager()
 
     def __str__(self):
@@ -117,6 +118,7 @@ class Question(models.Model):
     )
     options = models.JSONField()
     type = models.CharField("Тип вопроса", max_length=50)
+    updated_at = models.DateTimeField("Время последнего изменения", auto_now=True)
 
     @classmethod
     def parse_options(cls, options: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
@@ -173,7 +175,11 @@ class RunningTestsAnswers(models.Model):
         on_delete=models.SET_NULL,
         default=DEFAULT_AUTHOR_ID,
     )
-    right_answers = models.JSONField()
+    right_answers = models.JSONField(null=True, blank=True)
+    seed = models.BigIntegerField("Зерно генератора варианта", null=True)
+    layout = models.BinaryField("Порядок вопросов и вариантов ответов", null=True)
+    answers = models.JSONField("Сохраненные ответы", null=True, blank=True)
+    result = models.JSONField("Результат отправленного теста", null=True, blank=True)
 
     @property
     def time_left(self) -> float:
@@ -182,6 +188,9 @@ class RunningTestsAnswers(models.Model):
 
     class Meta:
         db_table = "main_running_tests_answers"
+        constraints = [
+            models.UniqueConstraint(fields=["user"], name="unique_running_test_user")
+        ]
         verbose_name = "Ответы за запущенные тесты"
         verbose_name_plural = "Ответы за запущенные тесты"
 
@@ -218,6 +227,24 @@ class TestResult(models.Model):
         verbose_name_plural = "Результаты тестирований"
 
 
+class TestVariant(models.Model):
+    testing_result = models.ForeignKey(
+        TestResult,
+        verbose_name="Результаты тестирования",
+        related_name="variants",
+        on_delete=models.CASCADE,
+    )
+    num = models.IntegerField("Номер варианта")
+    seed = models.BigIntegerField("Зерно генератора варианта")
+    layout = models.BinaryField("Порядок вопросов и вариантов ответов")
+    html = models.TextField("Сформированные вопросы варианта")
+
+    class Meta:
+        db_table = "main_test_variants"
+        verbose_name = "Вариант теста"
+        verbose_name_plural = "Варианты тестов"
+
+
 class UserResult(models.Model):
     user = models.ForeignKey(
         settings.AUTH_USER_MODEL,
@@ -243,3 +270,15 @@ class UserResult(models.Model):
         db_table = "main_user_results"
         verbose_name = "Персональный результат тестирования"
         verbose_name_plural = "Персональные результаты тестирований"
+
+
+class RunningTestsEvent(models.Model):
+    slot = models.IntegerField("Ячейка кольцевого буфера", primary_key=True)
+    seq = models.BigIntegerField("Порядковый номер события")
+    groups = models.JSONField("Группы получателей", default=list)
+    message = models.JSONField("Событие", default=dict)
+
+    class Meta:
+        db_table = "main_running_tests_events"
+        verbose_name = "Событие запущенных тестов"
+        verbose_name_plural = "События запущенных тестов"
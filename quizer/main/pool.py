@@ -0,0 +1,193 @@
+"""
+Versioned in-process cache of tests questions pools
+
+Each pool is tagged with Test.questions_version, which is bumped by every write
+path changing questions of the test, so a worker never serves a stale pool even
+if the change was made through another worker.
+"""
+import dataclasses
+import random
+import threading
+from datetime import datetime
+from typing import List, Dict, Tuple, Any, Optional
+
+from django.conf import settings
+from django.db.models import F
+
+from .metrics import metrics
+from .models import Test, Question
+
+
+@dataclasses.dataclass(frozen=True)
+class CachedQuestion:
+    """
+    Immutable snapshot of <Question> with all fields required for running test
+    """
+
+    id: int
+    formulation: str
+    multiselect: bool
+    type: str
+    options: List[Dict[str, Any]]
+    updated_at: Optional[datetime] = None
+
+    @classmethod
+    def from_model(cls, question: Question) -> "CachedQuestion":
+        return cls(
+            id=question.id,
+            formulation=question.formulation,
+            multiselect=question.multiselect,
+            type=question.type,
+            options=list(question.options),
+            updated_at=question.updated_at,
+        )
+
+    def permuted(self, permutation: List[int]) -> "CachedQuestion":
+        """
+        Copy of question with options in given order - cached options are never mutated
+        """
+        return dataclasses.replace(
+            self, options=[self.options[idx] for idx in permutation]
+        )
+
+
+class QuestionsPool:
+    """
+    Cache of questions pools of tests
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._pools: Dict[
+            int, Tuple[int, List[CachedQuestion], Dict[int, CachedQuestion]]
+        ] = {}
+
+    def _get_entry(
+        self, test: Test
+    ) -> Tuple[int, List[CachedQuestion], Dict[int, CachedQuestion]]:
+        entry = self._pools.get(test.id)
+        if entry and entry[0] == test.questions_version:
+            metrics.incr("questions_pool.hits")
+            return entry
+
+        metrics.incr("questions_pool.misses")
+        questions = [
+            CachedQuestion.from_model(question)
+            for question in Question.objects.filter(test__id=test.id).order_by("id")
+        ]
+        entry = (
+            test.questions_version,
+            questions,
+            {question.id: question for question in questions},
+        )
+        with self._lock:
+            self._pools[test.id] = entry
+        return entry
+
+    def get(self, test: Test) -> List[CachedQuestion]:
+        """
+        Get questions pool of test, loading it from database only if
+        cached pool is missing or outdated
+
+        :param test: <Test> instance, its questions_version is used as cache key
+        :return: list of cached questions
+        """
+        return self._get_entry(test)[1]
+
+    def get_many(self, test: Test, ids: List[int]) -> Dict[int, CachedQuestion]:
+        """
+        Get questions of test by ids. With 'database' sampling mode only
+        requested questions are loaded instead of the whole pool
+
+        :param test: <Test> instance
+        :param ids: questions ids
+        :return: dict with found questions by their ids
+        """
+        if settings.QUESTIONS_SAMPLING == "database":
+            return {
+                question.id: CachedQuestion.from_model(question)
+                for question in Question.objects.filter(test__id=test.id, id__in=ids)
+            }
+        index = self._get_entry(test)[2]
+        return {
+            question_id: index[question_id]
+            for question_id in ids
+            if question_id in index
+        }
+
+    def invalidate(self, test_id: int) -> None:
+        """
+        Mark questions pool of test as outdated for all workers
+        """
+        Test.objects.filter(id=test_id).update(
+            questions_version=F("questions_version") + 1
+        )
+        with self._lock:
+            self._pools.pop(int(test_id), None)
+        metrics.incr("questions_pool.invalidations")
+
+    def invalidate_all(self) -> None:
+        """
+        Mark all questions pools as outdated, i.e. after importing database dump
+        """
+        Test.objects.update(questions_version=F("questions_version") + 1)
+        self.clear()
+
+    def clear(self) -> None:
+        with self._lock:
+            self._pools.clear()
+
+    @staticmethod
+    def sample_from_database(test: Test) -> List[CachedQuestion]:
+        """
+        Sample questions of test inside database without loading whole pool:
+        ids of 'tasks_num' questions are selected by ORDER BY RANDOM() LIMIT,
+        which gives each subset of questions the same probability
+
+        :param test: <Test> instance
+        :return: sampled questions in random order
+        """
+        ids = list(
+            Question.objects.filter(test__id=test.id)
+            .order_by("?")
+            .values_list("id", flat=True)[: test.tasks_num]
+        )
+        questions = {
+            question.id: CachedQuestion.from_model(question)
+            for question in Question.objects.filter(id__in=ids)
+        }
+        return [
+            questions[question_id] for question_id in ids if question_id in questions
+        ]
+
+    @staticmethod
+    def stats() -> Dict[str, int]:
+        return {
+            "hits": metrics.get("questions_pool.hits"),
+            "misses": metrics.get("questions_pool.misses"),
+            "invalidations": metrics.get("questions_pool.invalidations"),
+        }
+
+
+questions_pool = QuestionsPool()
+
+
+def sample_questions(
+    test: Test, rng: Optional[random.Random] = None
+) -> Optional[List[CachedQuestion]]:
+    """
+    Sample 'tasks_num' questions of test according to QUESTIONS_SAMPLING setting:
+    'pool' - from cached questions pool, 'database' - inside database
+
+    :param test: <Test> instance
+    :param rng: random generator for 'pool' sampling, module one is used by default
+    :return: sampled questions or None if there are not enough questions in test
+    """
+    if settings.QUESTIONS_SAMPLING == "database":
+        questions = questions_pool.sample_from_database(test)
+        return questions if len(questions) >= test.tasks_num else None
+
+    questions = questions_pool.get(test)
+    if len(questions) < test.tasks_num:
+        return None
+    return (rng or random).sample(questions, k=test.tasks_num)
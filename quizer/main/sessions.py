@@ -0,0 +1,514 @@
+"""
+Storage and closing of running test sessions
+
+Each user has at most one running test session. Sessions are kept in store
+selected by SESSION_STORE setting:
+- 'database' - directly in main_running_tests_answers table
+- 'cache' - in Django cache (shared between workers if cache backend is shared),
+  table is updated asynchronously by write-behind thread and is used to reload
+  sessions missing in cache, i.e. after restart
+"""
+from abc import ABC, abstractmethod
+from typing import Any, Dict, Hashable, Iterable, List, Optional
+
+from django.conf import settings
+from django.contrib.auth.models import User
+from django.core.cache import caches
+from django.db import connection, transaction
+from django.db.models import Case, JSONField, Q, Value, When
+
+from .aggregates import aggregates_cache
+from .grading import grade_session
+from .models import Test, TestResult, UserResult, RunningTestsAnswers
+from .writebehind import BatchWriter
+
+
+class SessionStore(ABC):
+    """
+    Store of running test sessions by users ids
+    """
+
+    @abstractmethod
+    def get(self, user_id: int) -> Optional[RunningTestsAnswers]:
+        pass
+
+    @abstractmethod
+    def get_many(self, user_ids: Iterable[int]) -> List[RunningTestsAnswers]:
+        pass
+
+    @abstractmethod
+    def save(self, session: RunningTestsAnswers) -> None:
+        """
+        Save session replacing previous session of its user
+        """
+
+    @abstractmethod
+    def delete(self, user_ids: Iterable[int]) -> None:
+        pass
+
+    @abstractmethod
+    def claim(self, sessions: Iterable[RunningTestsAnswers]) -> List[int]:
+        """
+        Delete sessions for finalizing unless they were deleted or replaced by
+        new sessions of their users since they were read, so concurrent callers
+        never finalize the same session twice
+
+        :param sessions: sessions read from store
+        :return: ids of users whose sessions are claimed by caller
+        """
+
+    def save_answers(
+        self, session: RunningTestsAnswers, answers: Dict[int, List[int]]
+    ) -> None:
+        """
+        Merge autosaved answers into answers saved in session
+
+        :param session: running test session
+        :param answers: selected options indices by questions numbers
+        """
+        session.answers = {
+            **(session.answers or {}),
+            **{str(num): selected for num, selected in answers.items()},
+        }
+        self.write_answers(session)
+
+    @abstractmethod
+    def write_answers(self, session: RunningTestsAnswers) -> None:
+        pass
+
+    def persist(self, session: RunningTestsAnswers) -> None:
+        """
+        Save session and write it to database before returning
+        """
+        self.save(session)
+        self.flush()
+
+    def flush(self) -> None:
+        """
+        Write all pending changes to database
+        """
+
+
+# Rows per INSERT statement, fits into SQLite limit of 999 params
+UPSERT_BATCH_SIZE = 100
+
+
+def upsert_sessions(sessions: List[RunningTestsAnswers]) -> None:
+    """
+    Insert sessions replacing sessions of the same users by one
+    INSERT ... ON CONFLICT (user_id) DO UPDATE statement per batch, so
+    concurrent starts of test by the same user leave exactly one session.
+    Ids of saved sessions are set
+    """
+    if connection.vendor not in ("postgresql", "sqlite"):
+        with transaction.atomic():
+            RunningTestsAnswers.objects.filter(
+                user__id__in=[session.user_id for session in sessions]
+            ).delete()
+            RunningTestsAnswers.objects.bulk_create(sessions)
+        return
+
+    quote_name = connection.ops.quote_name
+    fields = [
+        field
+        for field in RunningTestsAnswers._meta.concrete_fields
+        if not field.primary_key
+    ]
+    columns = ", ".join(quote_name(field.column) for field in fields)
+    updates = ", ".join(
+        f"{quote_name(field.column)} = excluded.{quote_name(field.column)}"
+        for field in fields
+    )
+    row = f"({', '.join(['%s'] * len(fields))})"
+    table = quote_name(RunningTestsAnswers._meta.db_table)
+    with connection.cursor() as cursor:
+        for idx in range(0, len(sessions), UPSERT_BATCH_SIZE):
+            batch = sessions[idx : idx + UPSERT_BATCH_SIZE]
+            params = [
+                field.get_db_prep_save(field.pre_save(session, True), connection)
+                for session in batch
+                for field in fields
+            ]
+            cursor.execute(
+                f"INSERT INTO {table} ({columns}) "
+                f"VALUES {', '.join([row] * len(batch))} "
+                f"ON CONFLICT ({quote_name('user_id')}) DO UPDATE SET {updates} "
+                f"RETURNING {quote_name('id')}, {quote_name('user_id')}",
+                params,
+            )
+            ids = dict((user_id, session_id) for session_id, user_id in cursor)
+            for session in batch:
+                session.pk = ids.get(session.user_id)
+
+
+def delete_sessions(sessions: List[RunningTestsAnswers]) -> List[int]:
+    """
+    Delete rows of sessions by users ids and start dates by one
+    DELETE ... RETURNING statement per batch
+
+    :return: ids of users whose sessions were deleted
+    """
+    if not sessions:
+        return []
+    if connection.vendor not in ("postgresql", "sqlite"):
+        condition = Q()
+        for session in sessions:
+            condition |= Q(user__id=session.user_id, start_date=session.start_date)
+        with transaction.atomic():
+            user_ids = list(
+                RunningTestsAnswers.objects.select_for_update()
+                .filter(condition)
+                .values_list("user_id", flat=True)
+            )
+            RunningTestsAnswers.objects.filter(condition).delete()
+        return user_ids
+
+    quote_name = connection.ops.quote_name
+    start_date = RunningTestsAnswers._meta.get_field("start_date")
+    row = f"({quote_name('user_id')} = %s AND {quote_name('start_date')} = %s)"
+    table = quote_name(RunningTestsAnswers._meta.db_table)
+    user_ids = []
+    with connection.cursor() as cursor:
+        for idx in range(0, len(sessions), UPSERT_BATCH_SIZE):
+            batch = sessions[idx : idx + UPSERT_BATCH_SIZE]
+            params = []
+            for session in batch:
+                params += [
+                    session.user_id,
+                    start_date.get_db_prep_value(session.start_date, connection),
+                ]
+            cursor.execute(
+                f"DELETE FROM {table} WHERE {' OR '.join([row] * len(batch))} "
+                f"RETURNING {quote_name('user_id')}",
+                params,
+            )
+            user_ids += [user_id for user_id, in cursor]
+    return user_ids
+
+
+def write_answers(answers: Dict[Hashable, Dict[str, List[int]]]) -> None:
+    """
+    Update saved answers of sessions by (session id, start date) in one
+    statement. Session row is reused for next test of user, so start date
+    tells whether answers belong to current session
+    """
+    condition = Q()
+    for session_id, start_date in answers:
+        condition |= Q(id=session_id, start_date=start_date)
+    RunningTestsAnswers.objects.filter(condition).update(
+        answers=Case(
+            *[
+                When(
+                    id=session_id,
+                    start_date=start_date,
+                    then=Value(value, output_field=JSONField()),
+                )
+                for (session_id, start_date), value in answers.items()
+            ]
+        )
+    )
+
+
+class DatabaseSessionStore(SessionStore):
+    """
+    Sessions stored in main_running_tests_answers table. Autosaved answers
+    are written by write-behind thread
+    """
+
+    def __init__(self):
+        self.answers_writer = BatchWriter("answers", write_answers)
+
+    def _with_answers(self, session: RunningTestsAnswers) -> RunningTestsAnswers:
+        found, answers = self.answers_writer.lookup((session.pk, session.start_date))
+        if found:
+            session.answers = answers
+        return session
+
+    def get(self, user_id: int) -> Optional[RunningTestsAnswers]:
+        session = RunningTestsAnswers.objects.filter(user__id=user_id).first()
+        if session is not None:
+            self._with_answers(session)
+        return session
+
+    def get_many(self, user_ids: Iterable[int]) -> List[RunningTestsAnswers]:
+        return [
+            self._with_answers(session)
+            for session in RunningTestsAnswers.objects.filter(
+                user__id__in=list(user_ids)
+            )
+        ]
+
+    def save(self, session: RunningTestsAnswers) -> None:
+        upsert_sessions([session])
+
+    def delete(self, user_ids: Iterable[int]) -> None:
+        RunningTestsAnswers.objects.filter(user__id__in=list(user_ids)).delete()
+
+    def claim(self, sessions: Iterable[RunningTestsAnswers]) -> List[int]:
+        return delete_sessions(list(sessions))
+
+    def persist(self, session: RunningTestsAnswers) -> None:
+        RunningTestsAnswers.objects.filter(
+            user__id=session.user_id, start_date=session.start_date
+        ).update(result=session.result)
+
+    def write_answers(self, session: RunningTestsAnswers) -> None:
+        self.answers_writer.submit((session.pk, session.start_date), session.answers)
+
+    def flush(self) -> None:
+        self.answers_writer.flush()
+
+
+def write_sessions(sessions: Dict[Hashable, Optional[RunningTestsAnswers]]) -> None:
+    """
+    Replace sessions of users in database, None values delete sessions
+    """
+    with transaction.atomic():
+        RunningTestsAnswers.objects.filter(
+            user__id__in=[
+                user_id for user_id, session in sessions.items() if session is None
+            ]
+        ).delete()
+        upsert_sessions(
+            [session for session in sessions.values() if session is not None]
+        )
+
+
+class CacheSessionStore(SessionStore):
+    """
+    Sessions stored in Django cache with write-behind to database. Cache keeps
+    only ids and scalar fields of sessions, related test and user are loaded
+    from database when accessed, so they are never stale
+    """
+
+    key_prefix = "running_test_session"
+    # Claimed session is known by its key until it is surely deleted
+    claim_timeout = 24 * 60 * 60
+    fields = [
+        field.attname
+        for field in RunningTestsAnswers._meta.concrete_fields
+        if not field.primary_key
+    ]
+
+    def __init__(self):
+        self.writer = BatchWriter("sessions", write_sessions)
+
+    @property
+    def cache(self):
+        return caches[settings.SESSION_STORE_CACHE]
+
+    def _key(self, user_id: int) -> str:
+        return f"{self.key_prefix}:{user_id}"
+
+    def _dump(self, session: RunningTestsAnswers) -> Dict[str, Any]:
+        data = {name: getattr(session, name) for name in self.fields}
+        if data["layout"] is not None:
+            data["layout"] = bytes(data["layout"])
+        return data
+
+    @staticmethod
+    def _load(data: Dict[str, Any]) -> RunningTestsAnswers:
+        return RunningTestsAnswers(**data)
+
+    def get(self, user_id: int) -> Optional[RunningTestsAnswers]:
+        data = self.cache.get(self._key(user_id))
+        if data is not None:
+            return self._load(data)
+        found, session = self.writer.lookup(user_id)
+        if found:
+            return session and self._load(self._dump(session))
+
+        session = RunningTestsAnswers.objects.filter(user__id=user_id).first()
+        if session is None:
+            return None
+        data = self._dump(session)
+        self.cache.set(self._key(user_id), data, timeout=None)
+        return self._load(data)
+
+    def get_many(self, user_ids: Iterable[int]) -> List[RunningTestsAnswers]:
+        sessions = (self.get(user_id) for user_id in user_ids)
+        return [session for session in sessions if session is not None]
+
+    def save(self, session: RunningTestsAnswers) -> None:
+        session.pk = None
+        self.cache.set(self._key(session.user_id), self._dump(session), timeout=None)
+        self.writer.submit(session.user_id, session)
+
+    def delete(self, user_ids: Iterable[int]) -> None:
+        user_ids = list(user_ids)
+        self.cache.delete_many([self._key(user_id) for user_id in user_ids])
+        for user_id in user_ids:
+            self.writer.submit(user_id, None)
+
+    def claim(self, sessions: Iterable[RunningTestsAnswers]) -> List[int]:
+        user_ids = []
+        for session in sessions:
+            current = self.get(session.user_id)
+            if (
+                current is not None
+                and current.start_date == session.start_date
+                and self.cache.add(
+                    f"{self.key_prefix}:claimed:{session.user_id}:"
+                    f"{session.start_date.timestamp()}",
+                    True,
+                    timeout=self.claim_timeout,
+                )
+            ):
+                user_ids.append(session.user_id)
+        self.delete(user_ids)
+        return user_ids
+
+    def write_answers(self, session: RunningTestsAnswers) -> None:
+        self.save(session)
+
+    def flush(self) -> None:
+        self.writer.flush()
+
+
+SESSION_STORES = {
+    "database": DatabaseSessionStore,
+    "cache": CacheSessionStore,
+}
+
+_stores: Dict[str, SessionStore] = {}
+
+
+def get_session_store() -> SessionStore:
+    """
+    Session store selected by SESSION_STORE setting
+    """
+    name = settings.SESSION_STORE
+    if name not in _stores:
+        _stores[name] = SESSION_STORES[name]()
+    return _stores[name]
+
+
+def finalize_sessions(
+    sessions: Iterable[RunningTestsAnswers],
+    answers: Optional[Dict[int, Dict[str, List[str]]]] = None,
+) -> List[UserResult]:
+    """
+    Grade running test sessions, save users results and delete sessions.
+    Tests, lecturers and running <TestResult>s of all sessions are resolved in
+    three queries and results are written by one bulk insert, so number of
+    queries does not depend on number of sessions. Trial runs of lecturers and
+    sessions whose test is not running anymore are deleted without results
+
+    :param sessions: sessions to close
+    :param answers: submitted forms by users ids, sessions without submitted
+    form or stored result of submission are graded as abandoned - by autosaved
+    answers, with time spent so far
+    :return: list of saved users results in order of sessions, sessions
+    finalized by concurrent caller are skipped
+    """
+    sessions = list(sessions)
+    if not sessions:
+        return []
+    answers = answers or {}
+
+    lecturers = set(
+        User.objects.filter(
+            id__in={session.user_id for session in sessions},
+            groups__name="lecturer",
+        ).values_list("id", flat=True)
+    )
+    if lecturers:
+        get_session_store().claim(
+            [session for session in sessions if session.user_id in lecturers]
+        )
+        sessions = [session for session in sessions if session.user_id not in lecturers]
+        if not sessions:
+            return []
+
+    tests = Test.objects.in_bulk({session.test_id for session in sessions})
+    results = []
+    for session in sessions:
+        session.test = tests.get(session.test_id)
+        if session.result is not None:
+            # Submitted, but not saved yet
+            results.append(session.result)
+            continue
+        form = answers.get(session.user_id)
+        if form is None:
+            form = {"time": [str(int(max(session.time_left, 0)))], "answers": ["{}"]}
+        results.append(grade_session(form, session))
+    return save_results(sessions, results)
+
+
+def save_results(
+    sessions: List[RunningTestsAnswers], results: List[Dict[str, Any]]
+) -> List[UserResult]:
+    """
+    Claim closed running test sessions, save their graded results and delete
+    sessions. Results of sessions finalized by someone else meanwhile and of
+    sessions whose test is not running are skipped
+
+    :param sessions: closed sessions
+    :param results: testing results of sessions made by 'grade_session'
+    :return: list of saved users results in order of claimed sessions
+    """
+    if not sessions:
+        return []
+    with transaction.atomic(savepoint=False):
+        claimed = set(get_session_store().claim(sessions))
+        results = [
+            (session, result)
+            for session, result in zip(sessions, results)
+            if session.user_id in claimed
+        ]
+        if not results:
+            return []
+        testing_results = {}
+        for testing_result in TestResult.objects.filter(
+            is_running=True, test__id__in={session.test_id for session, _ in results}
+        ).order_by("-id"):
+            testing_results.setdefault(testing_result.test_id, testing_result)
+        results = [
+            (session, result)
+            for session, result in results
+            if session.test_id in testing_results
+        ]
+
+        user_results = UserResult.objects.bulk_create(
+            UserResult(
+                testing_result=testing_results[session.test_id],
+                user_id=session.user_id,
+                time=result["time"],
+                tasks_num=result["tasks_num"],
+                right_answers_count=result["right_answers_count"],
+                questions=result["questions"],
+            )
+            for session, result in results
+        )
+        transaction.on_commit(lambda: aggregates_cache.add_results(user_results))
+    return user_results
+
+
+def finalize_test_sessions(test_id: int, batch_size: int = 500) -> int:
+    """
+    Grade all running sessions of test as abandoned, i.e. when test is stopped.
+    Sessions are finalized in batches, so number of queries depends only on
+    number of batches
+
+    :param test_id: id of test
+    :param batch_size: number of sessions finalized at once
+    :return: number of finalized sessions
+    """
+    store = get_session_store()
+    store.flush()
+    session_ids = list(
+        RunningTestsAnswers.objects.filter(test__id=test_id).values_list(
+            "id", flat=True
+        )
+    )
+    finalized = 0
+    for idx in range(0, len(session_ids), batch_size):
+        finalized += len(
+            finalize_sessions(
+                RunningTestsAnswers.objects.filter(
+                    id__in=session_ids[idx : idx + batch_size]
+                )
+            )
+        )
+    store.flush()
+    return finalized
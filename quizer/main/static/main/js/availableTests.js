@@ -61,14 +61,12 @@ function launchTest(testID) {
             if (response.ok) {
                 renderInfoModalWindow("Тест запущен", response.message);
                 renderAvailableTests();
-
-                let launchData = {
-                    action: 'test was launched'
-                }
-                socket.send(JSON.stringify(launchData));
             } else {
                 renderInfoModalWindow("Ошибка", response.message);
             }
+        },
+        error: (xhr) => {
+            renderInfoModalWindow("Ошибка", xhr.responseJSON ? xhr.responseJSON.message : xhr.statusText);
         }
     });
 }
@@ -93,6 +91,51 @@ function getRunningTestsWebSocket(socketPath) {
     return new WebSocket(endpoint);
 }
 
+function watchRunningTests(socketPath, onEvent, onResync) {
+    const websocketErrorDiv = document.getElementById('websocketErrorDiv');
+    let lastSeq = null;
+
+    function connect() {
+        let path = socketPath;
+        if (lastSeq !== null) {
+            path += (path.includes('?') ? '&' : '?') + `last_seq=${lastSeq}`;
+        }
+        // Missed events are replayed before 'sync', they may be also received from groups after it
+        let replayed = new Set();
+        let synced = false;
+        const socket = getRunningTestsWebSocket(path);
+        socket.onopen = () => {
+            websocketErrorDiv.style.display = 'none';
+        };
+        socket.onmessage = (e) => {
+            const receivedData = JSON.parse(e.data);
+            if (receivedData.event === 'ping') {
+                socket.send(JSON.stringify({event: 'pong'}));
+            } else if (receivedData.event === 'sync') {
+                synced = true;
+                lastSeq = Math.max(lastSeq || 0, receivedData.seq);
+            } else if (receivedData.event === 'resync') {
+                synced = true;
+                lastSeq = receivedData.seq;
+                onResync();
+            } else if (!synced) {
+                replayed.add(receivedData.seq);
+                lastSeq = Math.max(lastSeq || 0, receivedData.seq);
+                onEvent(receivedData);
+            } else if (!replayed.delete(receivedData.seq)) {
+                lastSeq = Math.max(lastSeq || 0, receivedData.seq);
+                onEvent(receivedData);
+            }
+        };
+        socket.onclose = () => {
+            websocketErrorDiv.style.display = '';
+            setTimeout(connect, 2000);
+        };
+    }
+
+    connect();
+}
+
 function renderAvailableTests() {
     const testsContainer = document.getElementById("tests_container");
     const subject = document.getElementById("subject");
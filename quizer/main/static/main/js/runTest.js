@@ -1,20 +1,132 @@
-function runTest(timeLeft, postUrl, token) {
-    if (timeLeft < 0) {
-       document.getElementById("stop-button").click();
-       return;
+function runTest(timeLeft, postUrl, token, deadline, resyncSeconds) {
+    let deadlineTime = Date.now() + timeLeft * 1000;
+
+    function resync() {
+        $.post(postUrl, {
+            csrfmiddlewaretoken: token,
+            deadline: deadline
+        }).done(function(response) {
+            if ('time_left' in response) {
+                deadlineTime = Date.now() + response['time_left'] * 1000;
+            }
+        });
     }
-    if (timeLeft % 5 === 0) {
-    	$.post(postUrl, {
-    		csrfmiddlewaretoken: token
-		}).done(function(response) {
-			timeLeft = response['time_left'];
-			if (timeLeft < 0) {
-			   document.getElementById("stop-button").click();
-			}
-		});
+
+    function tick() {
+        const left = Math.round((deadlineTime - Date.now()) / 1000);
+        if (left < 0) {
+            document.getElementById("stop-button").click();
+            return;
+        }
+        document.getElementById("time").value = left;
+        document.getElementById("time-div").innerHTML = `Времени осталось: ${left} с`;
+        setTimeout(tick, 1000);
     }
-    document.getElementById("time").value = timeLeft;
-    document.getElementById("time-div").innerHTML = `Времени осталось: ${timeLeft} с`;
-    timeLeft--;
-    setTimeout(runTest, 1000, timeLeft, postUrl, token);
+
+    resync();
+    setInterval(resync, resyncSeconds * 1000);
+    tick();
+}
+
+function autosaveAnswers(formId, postUrl, token, intervalSeconds) {
+    const form = document.getElementById(formId);
+    const dirty = new Set();
+    let sending = new Set();
+
+    function questionNum(input) {
+        const match = /^(\d+)_/.exec(input ? input.id : '');
+        return match ? parseInt(match[1]) : null;
+    }
+
+    function markDirty(input) {
+        const num = questionNum(input);
+        if (num !== null) {
+            dirty.add(num);
+        }
+    }
+
+    function readAnswer(num) {
+        const selected = [];
+        for (const input of form.querySelectorAll(`input[id^="${num}_"]`)) {
+            if (input.type === 'hidden') {
+                selected.push(parseInt(input.value));
+            } else if (input.checked) {
+                selected.push(parseInt(input.type === 'checkbox' ? input.name.split('_')[1] : input.value));
+            }
+        }
+        return selected;
+    }
+
+    function collect(nums) {
+        const answers = {};
+        for (const num of nums) {
+            answers[num] = readAnswer(num);
+        }
+        return JSON.stringify(answers);
+    }
+
+    function save() {
+        if (dirty.size === 0 || sending.size !== 0) {
+            return;
+        }
+        sending = new Set(dirty);
+        dirty.clear();
+        $.post(postUrl, {
+            csrfmiddlewaretoken: token,
+            answers: collect(sending)
+        }).done(function(response) {
+            if (!response['ok']) {
+                sending.forEach(num => dirty.add(num));
+            }
+        }).fail(function() {
+            sending.forEach(num => dirty.add(num));
+        }).always(function() {
+            sending = new Set();
+        });
+    }
+
+    // Sequences are answered by shown order even if user does not move options
+    form.querySelectorAll('input[type="hidden"][id]').forEach(markDirty);
+
+    form.addEventListener('click', function(event) {
+        const item = event.target.closest('li, .list-group-item-action');
+        const input = event.target.matches('input[id]') ? event.target : item && item.querySelector('input[id]');
+        setTimeout(() => markDirty(input), 0);
+    });
+    $(form).on('sortupdate', function(event) {
+        markDirty(event.target.querySelector('input[id]'));
+    });
+
+    // Autosave is acknowledged before answers are written to database, so
+    // final submit sends all answers, not only ones changed since autosave
+    form.addEventListener('submit', function() {
+        const answers = document.createElement('input');
+        const nums = new Set();
+        answers.type = 'hidden';
+        answers.name = 'answers';
+        form.querySelectorAll('input[id]').forEach(function(input) {
+            const num = questionNum(input);
+            if (num !== null) {
+                nums.add(num);
+                input.disabled = true;
+            }
+        });
+        answers.value = collect(nums);
+        form.appendChild(answers);
+    });
+
+    setInterval(save, intervalSeconds * 1000);
+}
+
+function watchTestStop(socketPath, testId, redirectUrl) {
+    const wsStart = window.location.protocol === 'https:' ? 'wss://' : 'ws://';
+    const socket = new WebSocket(wsStart + window.location.host + socketPath);
+    socket.onmessage = (e) => {
+        const receivedData = JSON.parse(e.data);
+        if (receivedData.event === 'ping') {
+            socket.send(JSON.stringify({event: 'pong'}));
+        } else if (receivedData.event === 'test_stopped' && receivedData.test_id === testId) {
+            window.location = redirectUrl;
+        }
+    };
 }
@@ -1,3 +1,18 @@
+function getResultRow(result, num) {
+    const tr = document.createElement('tr');
+    tr.innerHTML = `
+        <td scope="row"><strong>${num}</strong></td>
+        <td>${result.user.username}</td>
+        <td>${result.right_answers_count}/${result.tasks_num}</td>
+        <td>${result.time} c</td>
+        <td>${result.date}</td>`;
+    return tr;
+}
+
+function getResultKey(result) {
+    return result.id;
+}
+
 function getResultsTable(finishedStudentsResults, idx) {
     const table = document.createElement('table');
     table.setAttribute('id', `table_${idx}`);
@@ -15,15 +30,7 @@ function getResultsTable(finishedStudentsResults, idx) {
 
     const tbody = document.createElement('tbody');
     for (let i = 0; i < finishedStudentsResults.length; i++) {
-        const tr = document.createElement('tr');
-        let result = finishedStudentsResults[i];
-        tr.innerHTML = `
-            <td scope="row"><strong>${i + 1}</strong></td>
-            <td>${result.user.username}</td>
-            <td>${result.right_answers_count}/${result.tasks_num}</td>
-            <td>${result.time} c</td>
-            <td>${result.date}</td>`;
-        tbody.appendChild(tr);
+        tbody.appendChild(getResultRow(finishedStudentsResults[i], i + 1));
     }
 
     table.appendChild(thead);
@@ -44,15 +51,18 @@ function getRunningTestDiv(testResult, idx) {
     nameH3.innerText = testResult.test.name;
 
     const descP = document.createElement('p');
-    descP.innerText = testResult.test.description;
+    descP.innerText = testResult.test.description || '';
 
     const infoP = document.createElement('p');
     infoP.innerHTML = `<img src='${refsDict.researchIcon}'> Количество заданий в тесте: ${testResult.test.tasks_num}<br>
         <img src='${refsDict.clockIcon}'> Время на выполнение: ${testResult.test.duration / 60} мин<br>
         <span class="pointer" onclick='hideTable("search_${idx}", "table_${idx}")' title="Нажмите, чтобы скрыть результаты">
-              <img src='${refsDict.teamIcon}'> Выполнило слушателей: ${testResult.results.length}
+              <img src='${refsDict.teamIcon}'> Выполнило слушателей: <span id="count_${idx}">${testResult.results.length}</span>
         </span>`;
 
+    const aggregatesP = document.createElement('p');
+    aggregatesP.setAttribute('id', `aggregates_${idx}`);
+
     const searchInput = document.createElement('input');
     searchInput.setAttribute('class', "form-control");
     searchInput.setAttribute('type', "text");
@@ -71,6 +81,7 @@ function getRunningTestDiv(testResult, idx) {
     label.appendChild(nameH3);
     label.appendChild(descP);
     label.appendChild(infoP);
+    label.appendChild(aggregatesP);
     label.appendChild(searchInput);
     label.appendChild(resultsTable);
     label.appendChild(form);
@@ -79,16 +90,69 @@ function getRunningTestDiv(testResult, idx) {
     return container;
 }
 
+let runningTestsResults = [];
+
+function renderAggregates(idx) {
+    const testResult = runningTestsResults[idx];
+    $.get(aggregatesAPIUrl.replace('/0/', `/${testResult.id}/`)).done((aggregates) => {
+        const aggregatesP = document.getElementById(`aggregates_${idx}`);
+        if (!aggregatesP || aggregates.finished === 0) {
+            return;
+        }
+        const histogram = aggregates.histogram
+            .map((count, score) => `${score}/${testResult.test.tasks_num}: ${count}`)
+            .join(', ');
+        aggregatesP.innerText = `Средний результат: ${aggregates.mean_score.toFixed(1)}/${testResult.test.tasks_num}, ` +
+            `медианное время: ${aggregates.median_time} c\nРаспределение результатов: ${histogram}`;
+    });
+}
+
+function drawRunningTests() {
+    runningTestsDiv.innerHTML = '';
+    for (let i = 0; i < runningTestsResults.length; i++) {
+        runningTestsDiv.appendChild(getRunningTestDiv(runningTestsResults[i], i));
+        renderAggregates(i);
+    }
+}
+
 function renderRunningTests() {
-    let runningTestsResults = [];
     $.get(runningTestsAPIUrl)
         .done(function (response) {
-            runningTestsResults = response['tests'];
-            runningTestsDiv.innerHTML = '';
-            for (let i = 0; i < runningTestsResults.length; i++) {
-                if (runningTestsResults[i].launched_lecturer.id.toString() === userID) {
-                    runningTestsDiv.appendChild(getRunningTestDiv(runningTestsResults[i], i));
-                }
-            }
+            runningTestsResults = response['tests'].filter(
+                (testResult) => testResult.launched_lecturer.id.toString() === userID
+            );
+            drawRunningTests();
         });
-}
\ No newline at end of file
+}
+
+function applyRunningTestsEvent(receivedData) {
+    const idx = runningTestsResults.findIndex((testResult) => testResult.id === receivedData.testing_result_id);
+    if (receivedData.event === 'test_launched' && receivedData.testing_result) {
+        if (idx === -1) {
+            runningTestsResults.push(receivedData.testing_result);
+            drawRunningTests();
+        }
+    } else if (receivedData.event === 'test_stopped') {
+        if (idx !== -1) {
+            runningTestsResults.splice(idx, 1);
+            drawRunningTests();
+        }
+    } else if (receivedData.event === 'test_passed' && receivedData.results && idx !== -1) {
+        const results = runningTestsResults[idx].results;
+        const tbody = document.getElementById(`table_${idx}`).tBodies[0];
+        const shown = new Set(results.map(getResultKey));
+        for (let result of receivedData.results) {
+            // Event may be received again after reconnect or be already in snapshot
+            if (shown.has(getResultKey(result))) {
+                continue;
+            }
+            shown.add(getResultKey(result));
+            results.push(result);
+            tbody.appendChild(getResultRow(result, results.length));
+        }
+        document.getElementById(`count_${idx}`).innerText = results.length;
+        renderAggregates(idx);
+    } else {
+        renderRunningTests();
+    }
+}
@@ -85,7 +85,10 @@ function fillErrorsModal(rowID) {
         const ul = document.createElement("ul");
         ul.className = "list-group list-group-flush ul-hover";
         questionLi.appendChild(ul);
-        for (let option of question.options) {
+        for (let [idx, option] of question.options.entries()) {
+            const isSelected = ('selected' in questions[i])
+                ? questions[i].selected.indexOf(idx) !== -1
+                : questions[i].selected_options.indexOf(option.option) !== -1;
             const optionLi = document.createElement("li");
             optionLi.className = "list-group-item list-group-item-action";
             optionLi.style = 'border: 2px solid #FFF; border-radius: 5px;';
@@ -100,7 +103,7 @@ function fillErrorsModal(rowID) {
                 optionLi.appendChild(imgOption);
             }
             if (option.is_true) {
-                if (questions[i].selected_options.indexOf(option.option) !== -1) {
+                if (isSelected) {
                     optionLi.classList.add('list-group-item-success');
                     optionLi.title = 'Выбран правильный ответ';
                 } else {
@@ -108,7 +111,7 @@ function fillErrorsModal(rowID) {
                     optionLi.title = 'Правильный ответ не выбран';
                 }
             } else {
-                if (questions[i].selected_options.indexOf(option.option) !== -1) {
+                if (isSelected) {
                     optionLi.classList.add('list-group-item-danger');
                     optionLi.title = 'Выбран неправильный ответ';
                 }
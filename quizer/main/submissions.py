@@ -0,0 +1,91 @@
+"""
+Write-behind pipeline of submitted tests
+
+With SUBMISSION_PIPELINE enabled submitted test is graded in memory, its result
+is stored in running test session by one UPDATE and queued, so student gets
+result page without waiting for results insert. Queued results are saved by
+one bulk insert and one bulk delete of sessions in one transaction every
+WRITE_BEHIND_INTERVAL seconds and on worker exit. If worker dies before flush,
+session is finalized by sweeper with stored result. Result of session is saved
+once, repeated submission of session (i.e. retried on another worker) shows
+stored result and sessions finalized meanwhile are skipped.
+"""
+from typing import Any, Dict, Hashable, List, NamedTuple, Optional
+
+from django.conf import settings
+from django.db import transaction
+
+from . import events
+from .grading import grade_session
+from .models import RunningTestsAnswers
+from .sessions import get_session_store, save_results
+from .writebehind import BatchWriter
+
+
+class Submission(NamedTuple):
+    """
+    Graded running test session waiting to be saved
+    """
+
+    session: RunningTestsAnswers
+    result: Dict[str, Any]
+
+
+def write_submissions(submissions: Dict[Hashable, Submission]) -> None:
+    """
+    Save queued results and delete their sessions in one transaction, sessions
+    which are already finalized are skipped
+    """
+    with transaction.atomic():
+        user_results = save_results(
+            [submission.session for submission in submissions.values()],
+            [submission.result for submission in submissions.values()],
+        )
+    events.emit_results(user_results)
+
+
+submissions_writer = BatchWriter("submissions", write_submissions)
+
+
+def submit_test(
+    session: RunningTestsAnswers, form: Dict[str, List[str]]
+) -> Dict[str, Any]:
+    """
+    Grade submitted form of running test session and save result, directly or
+    through write-behind queue if SUBMISSION_PIPELINE is enabled
+
+    :param session: <RunningTestsAnswers> instance
+    :param form: submitted form data, dict of lists of values, ignored if
+    result of session is already stored
+    :return: dict with testing result
+    """
+    if session.result is not None:
+        result = session.result
+    else:
+        result = grade_session(form, session)
+    if settings.SUBMISSION_PIPELINE:
+        if session.result is None:
+            session.result = result
+            get_session_store().persist(session)
+        submissions_writer.submit(session.user_id, Submission(session, result))
+    else:
+        events.emit_results(save_results([session], [result]))
+    return result
+
+
+def get_queued_result(user_id: int) -> Optional[Dict[str, Any]]:
+    """
+    Result of user's test which is submitted but not saved yet
+    """
+    found, submission = submissions_writer.lookup(user_id)
+    return submission.result if found else None
+
+
+def flush_submission(user_id: int) -> None:
+    """
+    Save queued result of user's test before user starts new one, so session
+    deletion of the queued result does not affect new session
+    """
+    found, _ = submissions_writer.lookup(user_id)
+    if found:
+        submissions_writer.flush()
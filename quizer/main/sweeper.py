@@ -0,0 +1,70 @@
+"""
+Sweeper of expired and orphaned running test sessions
+"""
+import time
+from datetime import timedelta
+from typing import Dict, Optional
+
+from django.conf import settings
+from django.db.models import Q
+from django.utils import timezone
+
+from . import utils
+from .metrics import metrics
+from .models import RunningTestsAnswers
+from .sessions import finalize_sessions, get_session_store
+
+logger = utils.get_logger(__name__)
+
+
+def sweep_sessions(
+    grace: Optional[int] = None, batch_size: int = 500
+) -> Dict[str, float]:
+    """
+    Grade sessions which are not finished in 'test_duration' plus grace period
+    and delete sessions of deleted tests or users
+
+    :param grace: grace period in seconds, SESSION_GRACE_SECONDS by default
+    :param batch_size: number of sessions finalized at once
+    :return: dict with number of finalized sessions, deleted orphaned sessions
+    and duration of sweep in seconds
+    """
+    start = time.perf_counter()
+    if grace is None:
+        grace = settings.SESSION_GRACE_SECONDS
+    store = get_session_store()
+    store.flush()
+
+    orphans, _ = RunningTestsAnswers.objects.filter(
+        Q(test__isnull=True) | Q(user__isnull=True)
+    ).delete()
+
+    now = timezone.now()
+    expired_ids = [
+        session["id"]
+        for session in RunningTestsAnswers.objects.filter(
+            start_date__lt=now - timedelta(seconds=grace)
+        ).values("id", "start_date", "test_duration")
+        if session["start_date"] + timedelta(seconds=session["test_duration"] + grace)
+        < now
+    ]
+    finalized = 0
+    for idx in range(0, len(expired_ids), batch_size):
+        sessions = RunningTestsAnswers.objects.filter(
+            id__in=expired_ids[idx : idx + batch_size]
+        )
+        finalized += len(finalize_sessions(sessions))
+    store.flush()
+
+    seconds = time.perf_counter() - start
+    metrics.incr("sweeper.finalized", finalized)
+    metrics.incr("sweeper.orphans", orphans)
+    metrics.observe("sweeper.sweep", seconds)
+    if finalized or orphans:
+        logger.info(
+            "sweeper finalized %d sessions, deleted %d orphaned sessions in %.3f s",
+            finalized,
+            orphans,
+            seconds,
+        )
+    return {"finalized": finalized, "orphans": orphans, "seconds": seconds}
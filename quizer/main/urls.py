@@ -32,6 +32,7 @@ urlpatterns = [
     url(r"^test_result/$", views.PassedTestView.as_view(), name="test_result"),
     url(r"^test/$", views.student_run_test, name="student_run_test"),
     url(r"^get_left_time/$", views.get_left_time, name="get_left_time"),
+    url(r"^autosave/$", views.autosave_answers, name="autosave"),
     url(
         r"^administration/$", views.AdministrationView.as_view(), name="administration"
     ),
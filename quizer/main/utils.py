@@ -320,18 +320,20 @@ def save_database_dump(file) -> pathlib.Path:
     return dump_filename
 
 
-def get_test_result(
-    request: HttpRequest, right_answers: List[Dict[str, Any]], test_duration: int
+def grade_answers(
+    response: Dict[str, List[str]],
+    right_answers: List[Dict[str, Any]],
+    test_duration: int,
 ) -> Dict[str, Any]:
     """
-    Get testing result from HttpRequest object
+    Grade submitted test form with options sent as texts - for sessions created
+    before answers were encoded by options indices
 
-    :param request: <HttpRequest>
+    :param response: submitted form data, dict of lists of values
     :param right_answers: list of dicts with right answers
     :param test_duration: <int>< duration of passed test
     :return: dict with testing result
     """
-    response = dict(request.POST)
     time = int(response.get("time", ["0"])[0])
 
     numbers = set("0123456789")
@@ -380,7 +382,6 @@ def get_test_result(
         else:
             questions[-1]["is_true"] = False
     return {
-        "user": request.user,
         "time": test_duration - time,
         "tasks_num": len(right_answers),
         "right_answers_count": right_answers_count,
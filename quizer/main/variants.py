@@ -0,0 +1,257 @@
+"""
+Randomized test variants: questions order, options permutation and answer key
+"""
+import random
+import struct
+import threading
+from typing import List, Dict, Tuple, Any, Optional, NamedTuple
+
+from . import utils
+from .fragments import render_questions
+from .models import Test, Question, TestResult, TestVariant, RunningTestsAnswers
+from .pool import CachedQuestion, questions_pool, sample_questions
+
+logger = utils.get_logger(__name__)
+
+
+def pack_layout(layout: List[Tuple[int, List[int]]]) -> bytes:
+    """
+    Pack questions order and options permutations into array of little-endian
+    unsigned ints: [question_id, options_count, *permutation] for each question
+
+    :param layout: list of (question id, options permutation)
+    :return: packed layout
+    """
+    values = []
+    for question_id, permutation in layout:
+        values += [question_id, len(permutation), *permutation]
+    return struct.pack(f"<{len(values)}I", *values)
+
+
+def unpack_layout(data: bytes) -> List[Tuple[int, List[int]]]:
+    """
+    Unpack layout packed by 'pack_layout'
+    """
+    data = bytes(data)
+    values = struct.unpack(f"<{len(data) // 4}I", data)
+    layout = []
+    idx = 0
+    while idx < len(values):
+        question_id, options_count = values[idx], values[idx + 1]
+        layout.append((question_id, list(values[idx + 2 : idx + 2 + options_count])))
+        idx += 2 + options_count
+    return layout
+
+
+def get_right_answer(question_num: int, question: CachedQuestion) -> Dict[str, Any]:
+    """
+    Answer key for question with options in order they are shown to user
+    """
+    if question.type in (Question.Type.SEQUENCE, Question.Type.SEQUENCE_WITH_IMAGES):
+        right_options = sorted(question.options, key=lambda option: int(option["num"]))
+    else:
+        right_options = [option for option in question.options if option["is_true"]]
+    return {
+        "question_num": question_num,
+        "right_options": right_options,
+        "question_id": str(question.id),
+    }
+
+
+class Variant(NamedTuple):
+    """
+    Randomized variant of test
+    """
+
+    seed: int
+    layout: bytes
+    questions: List[Tuple[CachedQuestion, List[int]]]
+
+
+def make_variant(test: Test, seed: Optional[int] = None) -> Optional[Variant]:
+    """
+    Sample questions for test and shuffle their options
+
+    :param test: <Test> instance
+    :param seed: seed of random generator, new one is used by default
+    :return: variant with sampled questions and their options permutations
+    or None if there are not enough questions in test
+    """
+    if seed is None:
+        seed = random.SystemRandom().getrandbits(63)
+    rng = random.Random(seed)
+    questions = sample_questions(test, rng)
+    if questions is None:
+        return None
+
+    variant_questions = []
+    for question in questions:
+        permutation = list(range(len(question.options)))
+        rng.shuffle(permutation)
+        variant_questions.append((question, permutation))
+    return Variant(
+        seed=seed,
+        layout=pack_layout(
+            [(question.id, permutation) for question, permutation in variant_questions]
+        ),
+        questions=variant_questions,
+    )
+
+
+def restore_layout(
+    test: Test, layout: bytes
+) -> List[Tuple[int, CachedQuestion, List[int]]]:
+    """
+    Restore questions shown to user from packed layout using cached questions pool.
+    Questions deleted since layout was made are skipped, questions with changed
+    number of options are restored in their original options order
+
+    :param test: <Test> instance
+    :param layout: packed layout
+    :return: list of (question number, question, options permutation)
+    """
+    items = unpack_layout(layout)
+    questions = questions_pool.get_many(test, [question_id for question_id, _ in items])
+    restored = []
+    for question_num, (question_id, permutation) in enumerate(items, start=1):
+        question = questions.get(question_id)
+        if question is None:
+            continue
+        if sorted(permutation) != list(range(len(question.options))):
+            permutation = list(range(len(question.options)))
+        restored.append((question_num, question, permutation))
+    return restored
+
+
+def restore_questions(test: Test, layout: bytes) -> List[Tuple[int, CachedQuestion]]:
+    """
+    Restore questions shown to user with options in shown order
+
+    :param test: <Test> instance
+    :param layout: packed layout
+    :return: list of (question number, question with options in shown order)
+    """
+    return [
+        (question_num, question.permuted(permutation))
+        for question_num, question, permutation in restore_layout(test, layout)
+    ]
+
+
+def get_right_answers(session: RunningTestsAnswers) -> List[Dict[str, Any]]:
+    """
+    Answer key of running test session. Rebuilt from packed layout, sessions
+    created before layouts were introduced store answer key as is
+
+    :param session: <RunningTestsAnswers> instance
+    :return: list of dicts with right answers
+    """
+    if session.layout is None:
+        return session.right_answers or []
+    if session.test is None:
+        return []
+    return [
+        get_right_answer(question_num, question)
+        for question_num, question in restore_questions(session.test, session.layout)
+    ]
+
+
+def generate_variants(
+    testing_result: TestResult, test: Test, count: int
+) -> List[TestVariant]:
+    """
+    Pre-generate randomized variants of launched test
+
+    :param testing_result: <TestResult> of launched test
+    :param test: launched <Test>
+    :param count: number of variants
+    :return: list of created variants, empty if there are not enough questions
+    in test
+    """
+    if count <= 0:
+        return []
+    variants = []
+    for num in range(count):
+        variant = make_variant(test)
+        if variant is None:
+            logger.warning(
+                "variants of test %s were not generated: not enough questions",
+                test.name,
+            )
+            return []
+        variants.append(
+            TestVariant(
+                testing_result=testing_result,
+                num=num,
+                seed=variant.seed,
+                layout=variant.layout,
+                html=render_questions(variant.questions),
+            )
+        )
+    return TestVariant.objects.bulk_create(variants)
+
+
+class VariantsCache:
+    """
+    In-process cache of pre-generated variants of running tests. Variants are
+    tagged with Test.questions_version, so variants deleted after editing of
+    questions by other worker are not handed out
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._variants: Dict[int, Tuple[int, List[TestVariant]]] = {}
+
+    def get(self, testing_result_id: int, questions_version: int) -> List[TestVariant]:
+        entry = self._variants.get(testing_result_id)
+        if entry and entry[0] == questions_version:
+            return entry[1]
+        variants = list(
+            TestVariant.objects.filter(testing_result__id=testing_result_id)
+        )
+        with self._lock:
+            if variants:
+                self._variants[testing_result_id] = (questions_version, variants)
+            else:
+                self._variants.pop(testing_result_id, None)
+        return variants
+
+    def pick(
+        self, testing_result_id: int, questions_version: int
+    ) -> Optional[TestVariant]:
+        """
+        Random variant of running test or None if variants were not generated
+
+        :param testing_result_id: id of running <TestResult>
+        :param questions_version: current Test.questions_version
+        """
+        variants = self.get(testing_result_id, questions_version)
+        return random.choice(variants) if variants else None
+
+    def discard(self, testing_result_id: int) -> None:
+        with self._lock:
+            self._variants.pop(testing_result_id, None)
+
+    def clear(self) -> None:
+        with self._lock:
+            self._variants.clear()
+
+
+variants_cache = VariantsCache()
+
+
+def invalidate_variants(test_id: int) -> None:
+    """
+    Delete pre-generated variants of running test after editing of its
+    questions, as their html and layouts are outdated. Students get variant
+    generated for each of them. Must be called before questions_pool.invalidate
+
+    :param test_id: id of edited <Test>
+    """
+    testing_results_ids = list(
+        TestResult.objects.filter(test__id=test_id, is_running=True).values_list(
+            "id", flat=True
+        )
+    )
+    TestVariant.objects.filter(testing_result__id__in=testing_results_ids).delete()
+    for testing_result_id in testing_results_ids:
+        variants_cache.discard(testing_result_id)
@@ -2,32 +2,51 @@
 """Quizer backend"""
 import logging
 import os
-import random
-import copy
 import pathlib
 import re
 
+from django.conf import settings
+from django.db import transaction
 from django.core.management import call_command
 from django.contrib.auth.models import User
 from django.contrib.auth import login, logout, authenticate
-from django.shortcuts import render, redirect, reverse
+from django.shortcuts import get_object_or_404, render, redirect, reverse
 from django.utils.decorators import method_decorator
-from django.http import JsonResponse, HttpResponse, HttpRequest
+from django.http import (
+    Http404,
+    JsonResponse,
+    HttpResponse,
+    HttpRequest,
+    HttpResponseForbidden,
+)
 from django.views import View
 from django.utils import timezone
 from django.utils.encoding import smart_str
 
-from . import utils
+from . import events, utils
+from .aggregates import aggregates_cache
+from .deadlines import get_deadline, sign_deadline, read_deadline, get_time_left
 from .decorators import auth_required, allowed_users, post_method
 from .models import (
     Test,
     Subject,
-    Question,
     TestResult,
     RunningTestsAnswers,
     UserResult,
 )
 from .forms import UserForm, SubjectForm, TestForm
+from .fragments import render_questions
+from .grading import grade_session, parse_saved_answers
+from .metrics import metrics
+from .pool import questions_pool
+from .sessions import finalize_sessions, finalize_test_sessions, get_session_store
+from .submissions import (
+    flush_submission,
+    get_queued_result,
+    submissions_writer,
+    submit_test,
+)
+from .variants import make_variant, restore_layout, unpack_layout, variants_cache
 
 
 logger = utils.get_logger(__name__)
@@ -117,50 +136,35 @@ def lecturer_run_test(request: HttpRequest, test_id: int) -> HttpResponse:
     if not test:
         return redirect(reverse("main:available_tests"))
 
-    test_questions = list(Question.objects.filter(test__id=test_id))
-    if len(test_questions) < test.tasks_num:
+    variant = make_variant(test)
+    if not variant:
         return redirect(reverse("main:available_tests"))
 
-    test_questions = random.sample(test_questions, k=test.tasks_num)
-    for question in test_questions:
-        random.shuffle(question.options)
-
-    right_answers = []
-    for i, question in enumerate(test_questions):
-        if (
-            question.type == Question.Type.SEQUENCE
-            or question.type == Question.Type.SEQUENCE_WITH_IMAGES
-        ):
-            right_options = copy.deepcopy(question.options)
-            right_options.sort(key=lambda option: int(option["num"]))
-        else:
-            right_options = [option for option in question.options if option["is_true"]]
-        right_answers.append(
-            {
-                "question_num": i + 1,
-                "right_options": right_options,
-                "question_id": str(question.id),
-            }
+    start_date = timezone.now()
+    get_session_store().save(
+        RunningTestsAnswers(
+            start_date=start_date,
+            seed=variant.seed,
+            layout=variant.layout,
+            test=test,
+            user=request.user,
+            test_duration=test.duration,
         )
-
-    RunningTestsAnswers.objects.filter(user__id=request.user.id).delete()
-    RunningTestsAnswers.objects.create(
-        start_date=timezone.now(),
-        right_answers=right_answers,
-        test=test,
-        user=request.user,
-        test_duration=test.duration,
     )
-    questions_list = utils.split_questions(test_questions)
-    context = {
-        "title": "Тест",
-        "questions": test_questions,
-        "questions_list": questions_list,
-        "test_duration": test.duration,
-        "test_name": test.name,
-        "right_answers": right_answers,
-    }
-    return render(request, "main/lecturer/runTest.html", context)
+    deadline = get_deadline(start_date, test.duration)
+    with metrics.timer("run_test.render"):
+        questions_list = utils.split_questions(variant.questions)
+        context = {
+            "title": "Тест",
+            "questions_html": render_questions(variant.questions),
+            "questions_count": len(variant.questions),
+            "questions_list": questions_list,
+            "test_name": test.name,
+            "time_left": int(get_time_left(deadline)),
+            "deadline": sign_deadline(deadline),
+            "timer_resync_seconds": settings.TIMER_RESYNC_SECONDS,
+        }
+        return render(request, "main/lecturer/runTest.html", context)
 
 
 @auth_required
@@ -197,6 +201,7 @@ class AdministrationView(View):
         dump_path = utils.save_database_dump(file=request.FILES["dumpfile"])
         call_command("loaddata", dump_path)
         os.remove(dump_path)
+        questions_pool.invalidate_all()
         self.context = {
             "info": {
                 "title": "Данные импортированы",
@@ -252,15 +257,10 @@ class AvailableTestsView(View):
 
     def lecturer_passed_test_result(self, request: HttpRequest) -> HttpResponse:
         """Test results"""
-        passed_test_answers = RunningTestsAnswers.objects.filter(
-            user__id=request.user.id
-        ).first()
-        result = utils.get_test_result(
-            request=request,
-            right_answers=passed_test_answers.right_answers,
-            test_duration=passed_test_answers.test_duration,
-        )
-        passed_test_answers.delete()
+        session_store = get_session_store()
+        passed_test_answers = session_store.get(request.user.id)
+        result = grade_session(dict(request.POST), passed_test_answers)
+        session_store.delete([request.user.id])
 
         self.context = {
             "title": "Доступные тесты",
@@ -337,37 +337,25 @@ class PassedTestView(View):
 
     def get_passed_test_results(self, request: HttpRequest) -> HttpResponse:
         """Test results"""
-        passed_test_answers = RunningTestsAnswers.objects.filter(
-            user__id=request.user.id
-        ).first()
-        if not passed_test_answers:
-            return redirect(reverse("main:available_tests"))
-        result = utils.get_test_result(
-            request=request,
-            right_answers=passed_test_answers.right_answers,
-            test_duration=passed_test_answers.test_duration,
-        )
-        test_results = TestResult.objects.get(
-            is_running=True, test__id=passed_test_answers.test.id
-        )
-        UserResult.objects.create(
-            testing_result=test_results,
-            user=result["user"],
-            time=result["time"],
-            tasks_num=result["tasks_num"],
-            right_answers_count=result["right_answers_count"],
-            questions=result["questions"],
-        )
-        passed_test_answers.delete()
+        result = get_queued_result(request.user.id)
+        if result is None:
+            passed_test_answers = get_session_store().get(request.user.id)
+            if not passed_test_answers:
+                return redirect(reverse("main:available_tests"))
+            submitted = passed_test_answers.result is not None
+            result = submit_test(passed_test_answers, dict(request.POST))
+            if not submitted:
+                logger.info(
+                    "student %s passed test %s",
+                    request.user.username,
+                    passed_test_answers.test.name,
+                )
         self.context = {
             "title": "Результаты тестирования",
             "message_title": "Результат",
             "message": "Число правильных ответов: %d/%d"
             % (result["right_answers_count"], result["tasks_num"]),
         }
-        logger.info(
-            "student %s passed test %s", request.user.username, test_results.test.name
-        )
         return render(request, self.template, self.context)
 
 
@@ -450,13 +438,26 @@ def get_running_tests(request: HttpRequest) -> HttpResponse:
 @allowed_users(allowed_roles=["lecturer"])
 def stop_running_test(request: HttpRequest) -> HttpResponse:
     """Displays page with results of passing stopped test"""
-    test = Test.objects.get(id=int(request.POST["test_id"]))
-
-    test_results = TestResult.objects.filter(
-        test__id=test.id, launched_lecturer__id=request.user.id, is_running=True
-    ).first()
-    test_results.is_running = False
-    test_results.save()
+    test_id = request.POST.get("test_id", "")
+    if not test_id.isdigit():
+        raise Http404
+    test_results = get_object_or_404(
+        TestResult.objects.select_related("test"), test__id=test_id, is_running=True
+    )
+    if test_results.launched_lecturer_id != request.user.id:
+        return HttpResponseForbidden()
+    test = test_results.test
+
+    # Queued submissions must be saved as they are, not graded as abandoned
+    submissions_writer.flush()
+    with transaction.atomic(), metrics.timer("stop_test.finalize"):
+        finalized = finalize_test_sessions(test.id)
+        test_results.is_running = False
+        test_results.save()
+        test_results.variants.all().delete()
+    variants_cache.discard(test_results.id)
+    aggregates_cache.discard(test_results.id)
+    events.emit(events.TEST_STOPPED, test.id, test_results)
 
     context = {
         "title": "Результаты тестирования",
@@ -464,9 +465,14 @@ def stop_running_test(request: HttpRequest) -> HttpResponse:
         "start_date": test_results.date,
         "end_date": timezone.now(),
         "test_results_id": str(test_results.id),
-        "results": test_results.results.all(),
+        "results": test_results.results.select_related("user"),
     }
-    logger.info("lecturer %s stop running test %s", request.user.username, test.name)
+    logger.info(
+        "lecturer %s stop running test %s, finalized %d sessions",
+        request.user.username,
+        test.name,
+        finalized,
+    )
     return render(request, "main/lecturer/testingResults.html", context)
 
 
@@ -484,7 +490,7 @@ def lecturer_current_test_results(
         "test": test_results.test,
         "start_date": test_results.date,
         "test_results_id": test_results_id,
-        "results": test_results.results.all(),
+        "results": test_results.results.select_related("user"),
     }
     return render(request, "main/lecturer/testingResults.html", context)
 
@@ -513,66 +519,76 @@ def student_run_test(request: HttpRequest) -> HttpResponse:
     if not test:
         return redirect(reverse("main:available_tests"))
 
-    test_questions = list(Question.objects.filter(test__id=test_id))
-    if len(test_questions) < test.tasks_num:
-        return redirect(reverse("main:available_tests"))
-
-    test_questions = random.sample(test_questions, k=test.tasks_num)
-    for question in test_questions:
-        random.shuffle(question.options)
-
-    right_answers = []
-    for i, question in enumerate(test_questions):
-        if (
-            question.type == Question.Type.SEQUENCE
-            or question.type == Question.Type.SEQUENCE_WITH_IMAGES
-        ):
-            right_options = copy.deepcopy(question.options)
-            right_options.sort(key=lambda option: int(option["num"]))
-        else:
-            right_options = [option for option in question.options if option["is_true"]]
-        right_answers.append(
-            {
-                "question_num": i + 1,
-                "right_options": right_options,
-                "question_id": str(question.id),
-            }
-        )
-    docs = RunningTestsAnswers.objects.filter(user__id=request.user.id)
-    for test_answers in docs:
-        result = utils.get_test_result(
-            request=request,
-            right_answers=test_answers.right_answers,
-            test_duration=test_answers.test_duration,
-        )
-        test_results = TestResult.objects.get(is_running=True, test__id=test.id)
-        UserResult.objects.create(
-            testing_result=test_results,
-            user=result["user"],
-            time=result["time"],
-            tasks_num=result["tasks_num"],
-            right_answers_count=result["right_answers_count"],
-            questions=result["questions"],
-        )
-    docs.delete()
-    RunningTestsAnswers.objects.create(
-        start_date=timezone.now(),
-        right_answers=right_answers,
-        test=test,
-        user=request.user,
-        test_duration=test.duration,
+    testing_result = TestResult.objects.filter(
+        is_running=True, test__id=test_id
+    ).first()
+    variant = (
+        variants_cache.pick(testing_result.id, test.questions_version)
+        if testing_result
+        else None
     )
-    questions_list = utils.split_questions(test_questions)
-    context = {
-        "title": "Тест",
-        "questions": test_questions,
-        "questions_list": questions_list,
-        "test_duration": test.duration,
-        "test_name": test.name,
-        "right_answers": right_answers,
-    }
-    logger.info("student %s start test %s", request.user.username, test.name)
-    return render(request, "main/student/runTest.html", context)
+    if variant:
+        test_questions = unpack_layout(variant.layout)
+        questions_html = variant.html
+    else:
+        variant = make_variant(test)
+        if not variant:
+            return redirect(reverse("main:available_tests"))
+        test_questions = variant.questions
+        questions_html = None
+
+    flush_submission(request.user.id)
+    session_store = get_session_store()
+    session = session_store.get(request.user.id)
+    if (
+        session is not None
+        and session.test_id == test.id
+        and session.layout is not None
+        and not session.answers
+        and session.time_left > 0
+    ):
+        # Repeated start of the same test, i.e. double click - continue session
+        test_questions = [
+            (question, permutation)
+            for _, question, permutation in restore_layout(test, session.layout)
+        ]
+        questions_html = None
+        start_date = session.start_date
+    else:
+        start_date = timezone.now()
+        with transaction.atomic():
+            if session is not None:
+                finalize_sessions([session])
+            session_store.save(
+                RunningTestsAnswers(
+                    start_date=start_date,
+                    seed=variant.seed,
+                    layout=variant.layout,
+                    test=test,
+                    user=request.user,
+                    test_duration=test.duration,
+                )
+            )
+    deadline = get_deadline(start_date, test.duration)
+    with metrics.timer("run_test.render"):
+        if questions_html is None:
+            questions_html = render_questions(test_questions)
+        questions_list = utils.split_questions(test_questions)
+        context = {
+            "title": "Тест",
+            "questions_html": questions_html,
+            "questions_count": len(test_questions),
+            "questions_list": questions_list,
+            "test_id": test.id,
+            "testing_result_id": testing_result.id if testing_result else "",
+            "test_name": test.name,
+            "time_left": int(get_time_left(deadline)),
+            "deadline": sign_deadline(deadline),
+            "timer_resync_seconds": settings.TIMER_RESYNC_SECONDS,
+            "autosave_seconds": settings.AUTOSAVE_SECONDS,
+        }
+        logger.info("student %s start test %s", request.user.username, test.name)
+        return render(request, "main/student/runTest.html", context)
 
 
 @auth_required
@@ -602,10 +618,29 @@ def game(request: HttpRequest) -> HttpResponse:
 
 def get_left_time(request: HttpRequest) -> JsonResponse:
     """Return time that left for passing test"""
+    if request.method == "POST" and "deadline" in request.POST:
+        deadline = read_deadline(request.POST["deadline"])
+        if deadline is None:
+            return JsonResponse({})
+        return JsonResponse({"time_left": get_time_left(deadline)})
     if request.user.is_authenticated or request.method != "POST":
-        user_launched_test = RunningTestsAnswers.objects.filter(
-            user__id=request.user.id
-        ).first()
+        user_launched_test = get_session_store().get(request.user.id)
         if user_launched_test:
             return JsonResponse({"time_left": user_launched_test.time_left})
     return JsonResponse({})
+
+
+@auth_required
+@allowed_users(allowed_roles=["student"])
+@post_method
+def autosave_answers(request: HttpRequest) -> JsonResponse:
+    """Save answers changed since last autosave of running test"""
+    answers = parse_saved_answers(request.POST.get("answers", ""))
+    if answers is None:
+        return JsonResponse({"ok": False, "message": "Неверный формат ответов."})
+    session_store = get_session_store()
+    session = session_store.get(request.user.id)
+    if session is None or session.time_left < 0:
+        return JsonResponse({"ok": False, "message": "Тест не запущен."})
+    session_store.save_answers(session, answers)
+    return JsonResponse({"ok": True})
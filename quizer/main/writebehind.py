@@ -0,0 +1,129 @@
+"""
+Write-behind buffer applying writes to database in batches from background thread
+"""
+import atexit
+import threading
+import time
+from typing import Any, Callable, Dict, Hashable, Optional, Tuple
+
+from django.conf import settings
+from django.db import close_old_connections
+
+from . import utils
+from .metrics import metrics
+
+logger = utils.get_logger(__name__)
+
+
+class BatchWriter:
+    """
+    Values submitted by key are coalesced (the last one wins unless 'merge' is
+    overridden) and applied by 'apply' function in batches every
+    WRITE_BEHIND_INTERVAL seconds. With
+    non-positive interval values are applied immediately in calling thread
+    """
+
+    # Return failed batch to pending values to retry it on next flush
+    requeue = True
+
+    def __init__(
+        self,
+        name: str,
+        apply: Callable[[Dict[Hashable, Any]], None],
+        interval: Optional[float] = None,
+    ):
+        self.name = name
+        self.apply = apply
+        self._interval = interval
+        self._lock = threading.Lock()
+        self._flush_lock = threading.Lock()
+        self._pending: Dict[Hashable, Any] = {}
+        self._inflight: Dict[Hashable, Any] = {}
+        self._thread: Optional[threading.Thread] = None
+        atexit.register(self.flush)
+
+    @property
+    def interval(self) -> float:
+        if self._interval is None:
+            return settings.WRITE_BEHIND_INTERVAL
+        return self._interval
+
+    def submit(self, key: Hashable, value: Any) -> None:
+        """
+        Schedule write of value by key
+        """
+        with self._lock:
+            if key in self._pending:
+                value = self.merge(self._pending[key], value)
+            self._pending[key] = value
+            metrics.gauge(f"{self.name}.pending", len(self._pending))
+        if self.interval <= 0:
+            self.flush()
+        else:
+            self._ensure_thread()
+
+    def merge(self, pending: Any, value: Any) -> Any:  # pylint: disable=no-self-use
+        """
+        Coalesce value submitted by key which is still pending
+        """
+        return value
+
+    def lookup(self, key: Hashable) -> Tuple[bool, Any]:
+        """
+        Value by key which is not written yet
+
+        :return: (is found, value)
+        """
+        with self._lock:
+            for values in (self._pending, self._inflight):
+                if key in values:
+                    return True, values[key]
+        return False, None
+
+    def flush(self) -> int:
+        """
+        Apply all pending writes. Failed batch is returned to pending values
+        unless they were overwritten since or 'requeue' is disabled
+
+        :return: number of written values
+        """
+        with self._flush_lock:
+            with self._lock:
+                batch, self._pending = self._pending, {}
+                self._inflight = batch
+            if not batch:
+                return 0
+            try:
+                with metrics.timer(f"{self.name}.flush"):
+                    self.apply(batch)
+            except Exception:  # pylint: disable=broad-except
+                logger.exception("%s: failed to write %d values", self.name, len(batch))
+                metrics.incr(f"{self.name}.errors")
+                if self.requeue:
+                    with self._lock:
+                        for key, value in batch.items():
+                            self._pending.setdefault(key, value)
+                return 0
+            finally:
+                with self._lock:
+                    self._inflight = {}
+                    metrics.gauge(f"{self.name}.pending", len(self._pending))
+            metrics.incr(f"{self.name}.written", len(batch))
+            return len(batch)
+
+    def _ensure_thread(self) -> None:
+        if self._thread and self._thread.is_alive():
+            return
+        with self._lock:
+            if self._thread and self._thread.is_alive():
+                return
+            self._thread = threading.Thread(
+                target=self._run, name=f"{self.name}-writer", daemon=True
+            )
+            self._thread.start()
+
+    def _run(self) -> None:
+        while True:
+            time.sleep(self.interval)
+            if self.flush():
+                close_old_connections()
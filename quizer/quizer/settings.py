@@ -34,6 +34,7 @@ MIDDLEWARE = [
     "django.middleware.common.CommonMiddleware",
     "django.middleware.csrf.CsrfViewMiddleware",
     "django.contrib.auth.middleware.AuthenticationMiddleware",
+    "main.middleware.exam_admission_middleware",
     "django.contrib.messages.middleware.MessageMiddleware",
     "django.middleware.clickjacking.XFrameOptionsMiddleware",
     "whitenoise.middleware.WhiteNoiseMiddleware",
@@ -42,7 +43,24 @@ MIDDLEWARE = [
 ROOT_URLCONF = "quizer.urls"
 ASGI_APPLICATION = "quizer.routing.application"
 
-CHANNEL_LAYERS = {"default": {"BACKEND": "channels.layers.InMemoryChannelLayer"}}
+# Channel layer: 'postgres' - shared between workers by PostgreSQL LISTEN/NOTIFY,
+# 'memory' - in-process, for single worker
+CHANNEL_LAYERS = {
+    "default": {"BACKEND": "main.layers.PostgresChannelLayer"}
+    if os.getenv("CHANNEL_LAYER", "postgres") == "postgres"
+    else {"BACKEND": "main.layers.LocalChannelLayer"}
+}
+
+# Cache: 'memory' - in-process, for single worker, 'database' - quizer_cache table
+# shared between workers and sweeper
+CACHES = {
+    "default": {
+        "BACKEND": "django.core.cache.backends.db.DatabaseCache",
+        "LOCATION": "quizer_cache",
+    }
+    if os.getenv("CACHE_BACKEND", "memory") == "database"
+    else {"BACKEND": "django.core.cache.backends.locmem.LocMemCache"}
+}
 
 TEMPLATES = [
     {
@@ -115,6 +133,64 @@ MEDIA_URL = os.getenv("URL_PREFIX", " ")[:-1] + "/media/"
 
 DATABASE_DUMP_ROOT = os.path.join(BASE_DIR, "dumps")
 
+# Number of randomized variants generated on test launch (0 - generate per student)
+TEST_VARIANTS_NUM = int(os.getenv("TEST_VARIANTS_NUM", 30))
+
+# Max number of variants lecturer can request on test launch
+TEST_VARIANTS_MAX_NUM = int(os.getenv("TEST_VARIANTS_MAX_NUM", 200))
+
+# Questions sampling mode: 'pool' - from cached questions pool, 'database' - inside
+# database, for large questions banks
+QUESTIONS_SAMPLING = os.getenv("QUESTIONS_SAMPLING", "pool")
+
+# Max number of simultaneously processed test starts per worker (0 - unlimited),
+# students beyond the limit wait in queue and retry every N seconds
+EXAM_ADMISSION_LIMIT = int(os.getenv("EXAM_ADMISSION_LIMIT", 8))
+EXAM_ADMISSION_RETRY_SECONDS = int(os.getenv("EXAM_ADMISSION_RETRY_SECONDS", 3))
+
+# Interval of running test timer re-sync with server clock
+TIMER_RESYNC_SECONDS = int(os.getenv("TIMER_RESYNC_SECONDS", 60))
+
+# Debounce interval of running test answers autosave
+AUTOSAVE_SECONDS = int(os.getenv("AUTOSAVE_SECONDS", 3))
+
+# Window in which running tests events of the same type about the same test are
+# coalesced and sent to websockets clients once
+EVENTS_DEBOUNCE_SECONDS = float(os.getenv("EVENTS_DEBOUNCE_SECONDS", 1))
+
+# Number of the last sent running tests events kept in database for resuming
+# dropped websockets
+EVENTS_BUFFER_SIZE = int(os.getenv("EVENTS_BUFFER_SIZE", 1000))
+
+# Running tests websockets are pinged every N seconds without events and closed
+# if client sent nothing for WEBSOCKET_IDLE_TIMEOUT seconds. Events queued for
+# slow client beyond WEBSOCKET_QUEUE_SIZE are replaced by request to resync
+WEBSOCKET_HEARTBEAT_SECONDS = float(os.getenv("WEBSOCKET_HEARTBEAT_SECONDS", 20))
+WEBSOCKET_IDLE_TIMEOUT = float(os.getenv("WEBSOCKET_IDLE_TIMEOUT", 60))
+WEBSOCKET_QUEUE_SIZE = int(os.getenv("WEBSOCKET_QUEUE_SIZE", 100))
+
+# Live aggregates of running tests are reloaded from database after N seconds
+# to pick up results saved by other workers
+AGGREGATES_REFRESH_SECONDS = float(os.getenv("AGGREGATES_REFRESH_SECONDS", 30))
+
+# Running test sessions store: 'database' - main_running_tests_answers table,
+# 'cache' - Django cache with asynchronous write-behind to the table. Cache backend
+# must be shared between workers and sweeper, which is checked on start
+SESSION_STORE = os.getenv("SESSION_STORE", "database")
+SESSION_STORE_CACHE = "default"
+
+# Interval of write-behind flushes in seconds (0 - write immediately)
+WRITE_BEHIND_INTERVAL = float(os.getenv("WRITE_BEHIND_INTERVAL", 0.05))
+
+# Save submitted tests results in batches by write-behind queue, result page is
+# shown before result is written to database
+SUBMISSION_PIPELINE = bool(os.getenv("SUBMISSION_PIPELINE"))
+
+# Sessions not finished in test duration plus grace period are finalized by
+# 'sweep_sessions' command every SWEEPER_INTERVAL seconds
+SESSION_GRACE_SECONDS = int(os.getenv("SESSION_GRACE_SECONDS", 60))
+SWEEPER_INTERVAL = int(os.getenv("SWEEPER_INTERVAL", 60))
+
 AUTH_URL = "http://sms.gitwork.ru/auth/public_key/"
 PROFILE_URL = AUTH_URL.replace("public_key/", "profile")
 
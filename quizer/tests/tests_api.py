@@ -2,16 +2,70 @@
 """
 Main app tests, covered views.py, models.py and mongo.py
 """
+import asyncio
 import json
-
-from django.test import TestCase, Client
+from collections import deque
+from typing import Dict, List
+from unittest.mock import patch
+from datetime import timedelta
+from io import StringIO
+
+from asgiref.sync import async_to_sync
+from channels.exceptions import ChannelFull
+from channels.layers import get_channel_layer
+from channels.testing import WebsocketCommunicator
+from django.core.cache import cache
+from django.core.management import call_command
+from django.db import connection, OperationalError
+from django.db.models import F
+from django.http import HttpResponse
+from django.test import TestCase, Client, override_settings
+from django.test.utils import CaptureQueriesContext
 from django.urls import reverse
+from django.utils import timezone
 from django.contrib.auth.models import User, Group
 from rest_framework.response import Response
 
 from rest_framework.test import APIRequestFactory, APIClient, force_authenticate
 
-from main.models import Subject, Test, Question, TestResult, RunningTestsAnswers
+from main.models import (
+    Subject,
+    Test,
+    Question,
+    TestResult,
+    TestVariant,
+    UserResult,
+    RunningTestsAnswers,
+    RunningTestsEvent,
+)
+from main import events
+from main.aggregates import aggregates_cache
+from main.consumers import (
+    STUDENTS_GROUP,
+    RunningTestsConsumer,
+    lecturer_group,
+    testing_result_group,
+)
+from main.eventlog import events_log
+from main.checks import check_session_store
+from main.deadlines import read_deadline, sign_deadline
+from main.fragments import fragments_cache, render_questions
+from main.grading import AnswerKey, grade_session, parse_answers
+from main.layers import PostgresChannelLayer
+from main.metrics import metrics
+from main.middleware import exam_admission
+from main.pool import CachedQuestion, questions_pool
+from main.sessions import CacheSessionStore, finalize_sessions, get_session_store
+from main.submissions import submissions_writer, submit_test
+from main.sweeper import sweep_sessions
+from main.variants import (
+    generate_variants,
+    get_right_answers,
+    pack_layout,
+    unpack_layout,
+    variants_cache,
+)
+from main.writebehind import BatchWriter
 from api.serializers import (
     SubjectSerializer,
     TestSerializer,
@@ -51,6 +105,14 @@ class MainTest(TestCase):
         - Subject 'Subject' test 'Hard test'
         - 2 questions for 'Hard test'
         """
+        # Events left by previous test, so debouncer thread does not write
+        # them concurrently with this test
+        events.events_debouncer.flush()
+        questions_pool.clear()
+        variants_cache.clear()
+        fragments_cache.clear()
+        exam_admission.clear()
+        aggregates_cache.clear()
         self.lecturer = User.objects.create_user(username="lecturer", password="")
         Group.objects.create(id=1, name="lecturer")
         self.lecturer.groups.add(1)
@@ -102,6 +164,24 @@ class MainTest(TestCase):
             ),
         )
 
+    @staticmethod
+    def get_answers(session: RunningTestsAnswers) -> Dict[str, str]:
+        """
+        Test form with the first right option selected for each question
+        """
+        answers = {}
+        for right_answer in get_right_answers(session):
+            question_num = right_answer["question_num"]
+            question = Question.objects.get(id=right_answer["question_id"])
+            right_indices = [
+                idx for idx, option in enumerate(question.options) if option["is_true"]
+            ]
+            if len(right_indices) == 1:
+                answers[str(question_num)] = str(right_indices[0])
+            else:
+                answers[f"{question_num}_{right_indices[0]}"] = "on"
+        return answers
+
 
 class SubjectAPITest(MainTest):
     """
@@ -282,6 +362,53 @@ class TestAPITest(MainTest):
         running_tests = json.loads(response.content)["tests"]
         self.assertEqual([], running_tests)
 
+    def test_get_queries(self):
+        """
+        Test that listing tests costs the same number of queries for any
+        number of tests and keeps response of serializer
+        """
+        client = APIClient()
+        client.login(username=self.lecturer.username, password="")
+        client.get(reverse("api:tests_api"))
+
+        def list_tests():
+            with CaptureQueriesContext(connection) as queries:
+                response = client.get(reverse("api:tests_api"))
+            self.assertEqual(response.status_code, 200)
+            return len(queries), json.loads(response.content)["tests"]
+
+        queries_num, _ = list_tests()
+        for idx in range(20):
+            test = Test.objects.create(
+                subject=self.subject if idx % 2 else self.another_subject,
+                author=self.lecturer,
+                name=f"Test {idx}",
+                tasks_num=1,
+            )
+            Question.objects.create(
+                formulation="Question",
+                multiselect=False,
+                tasks_num=1,
+                type=Question.Type.REGULAR,
+                test=test,
+                options=Question.parse_options([{"option": "Option", "is_true": True}]),
+            )
+            if idx % 3 == 0:
+                TestResult.objects.create(
+                    test=test,
+                    launched_lecturer=self.lecturer,
+                    subject=test.subject,
+                    is_running=True,
+                )
+
+        many_queries_num, tests = list_tests()
+        self.assertEqual(queries_num, many_queries_num)
+        self.assertEqual(
+            json.loads(json.dumps(TestSerializer(Test.objects.all(), many=True).data)),
+            tests,
+        )
+        self.assertEqual(7, sum(1 for test in tests if "launched_lecturer" in test))
+
     def test_post(self):
         """
         Test post method for user from lecturer group
@@ -557,16 +684,7 @@ class TestPassingTest(MainTest):
         )
         running_tests_answers = RunningTestsAnswers.objects.all()
         self.assertEqual(1, running_tests_answers.count())
-        right_answers = running_tests_answers.first().right_answers
-
-        answers = {}
-        for right_answer in right_answers:
-            question_num = right_answer["question_num"]
-            if len(right_answer["right_options"]) == 1:
-                answers[question_num] = right_answer["right_options"][0]["option"]
-            else:
-                key = f'{question_num}_{right_answer["right_options"][0]["option"]}'
-                answers[key] = "on"
+        answers = self.get_answers(running_tests_answers.first())
 
         response = student_client.post(
             reverse("main:test_result"),
@@ -586,6 +704,13 @@ class TestPassingTest(MainTest):
         self.assertEqual(len(test_results), 1)
         self.assertEqual(len(test_results.first().results.all()), 1)
 
+        # Only questions with single right option are answered right
+        result = test_results.first().results.first()
+        self.assertEqual(
+            sum(len(question["right"]) == 1 for question in result.questions),
+            result.right_answers_count,
+        )
+
 
 class TestResultAPITest(MainTest):
     """
@@ -610,15 +735,7 @@ class TestResultAPITest(MainTest):
             reverse("main:student_run_test"), {"test_id": self.test.id}, follow=True
         )
         running_tests_answers = RunningTestsAnswers.objects.all()
-        right_answers = running_tests_answers.first().right_answers
-        answers = {}
-        for right_answer in right_answers:
-            question_num = right_answer["question_num"]
-            if len(right_answer["right_options"]) == 1:
-                answers[question_num] = right_answer["right_options"][0]["option"]
-            else:
-                key = f'{question_num}_{right_answer["right_options"][0]["option"]}'
-                answers[key] = "on"
+        answers = self.get_answers(running_tests_answers.first())
         response = self.student_client.post(
             reverse("main:test_result"),
             {
@@ -650,6 +767,1783 @@ class TestResultAPITest(MainTest):
         self.assertEqual(1, len(results))
 
 
+class QuestionsPoolTest(MainTest):
+    """
+    Tests for questions pool cache
+    """
+
+    def setUp(self) -> None:
+        super().setUp()
+        metrics.reset()
+        self.lecturer_client = APIClient()
+        self.lecturer_client.login(username=self.lecturer.username, password="")
+        self.lecturer_client.put(
+            reverse("api:launch_test", kwargs={"test_id": self.test.id}),
+            json.dumps({"variants_num": 0}),
+            content_type="application/json",
+        )
+        self.student_client = APIClient()
+        self.student_client.login(username=self.student.username, password="")
+
+    def test_warm_pool_does_not_touch_questions(self):
+        """
+        Test that starting test with warm cache does not query questions table
+        """
+        self.student_client.post(
+            reverse("main:student_run_test"), {"test_id": self.test.id}
+        )
+        with CaptureQueriesContext(connection) as context:
+            response = self.student_client.post(
+                reverse("main:student_run_test"), {"test_id": self.test.id}
+            )
+        self.assertEqual(response.status_code, 200)
+        self.assertFalse(
+            any(
+                'FROM "questions"' in query["sql"] for query in context.captured_queries
+            )
+        )
+        self.assertEqual(1, questions_pool.stats()["misses"])
+
+    def test_invalidation(self):
+        """
+        Test that editing question through QuestionAPI invalidates pool
+        """
+        test = Test.objects.get(id=self.test.id)
+        questions = questions_pool.get(test)
+        self.assertEqual(2, len(questions))
+
+        self.lecturer_client.put(
+            reverse(
+                "api:edit_questions_api",
+                kwargs={"test_id": self.test.id, "question_id": self.question.id},
+            ),
+            json.dumps({"formulation": "Updated formulation"}),
+            content_type="application/json",
+        )
+        test = Test.objects.get(id=self.test.id)
+        self.assertEqual(1, test.questions_version)
+        formulations = [question.formulation for question in questions_pool.get(test)]
+        self.assertIn("Updated formulation", formulations)
+        self.assertEqual(2, questions_pool.stats()["misses"])
+
+    def test_moved_question(self):
+        """
+        Test that moving question to another test invalidates pools of both
+        tests
+        """
+        other_test = Test.objects.create(
+            name="Other test",
+            tasks_num=1,
+            duration=60,
+            subject=self.subject,
+            author=self.lecturer,
+        )
+        test = Test.objects.get(id=self.test.id)
+        self.assertEqual(2, len(questions_pool.get(test)))
+        self.assertEqual(0, len(questions_pool.get(other_test)))
+
+        self.lecturer_client.put(
+            reverse(
+                "api:edit_questions_api",
+                kwargs={"test_id": self.test.id, "question_id": self.question.id},
+            ),
+            json.dumps({"test_id": other_test.id}),
+            content_type="application/json",
+        )
+        test = Test.objects.get(id=self.test.id)
+        other_test = Test.objects.get(id=other_test.id)
+        self.assertEqual(
+            [self.another_question.id], [q.id for q in questions_pool.get(test)]
+        )
+        self.assertEqual(
+            [self.question.id], [q.id for q in questions_pool.get(other_test)]
+        )
+
+    @override_settings(QUESTIONS_SAMPLING="database")
+    def test_database_sampling(self):
+        """
+        Test sampling questions inside database
+        """
+        test = Test.objects.get(id=self.test.id)
+        questions = questions_pool.sample_from_database(test)
+        self.assertEqual(
+            {self.question.id, self.another_question.id},
+            {question.id for question in questions},
+        )
+
+        response = self.student_client.post(
+            reverse("main:student_run_test"), {"test_id": self.test.id}
+        )
+        self.assertEqual(response.status_code, 200)
+        right_answers = get_right_answers(
+            RunningTestsAnswers.objects.get(user__id=self.student.id)
+        )
+        self.assertEqual(2, len(right_answers))
+        self.assertEqual(0, questions_pool.stats()["misses"])
+
+
+class TestVariantsTest(MainTest):
+    """
+    Tests for variants pre-generated on test launch
+    """
+
+    def test_variants(self):
+        """
+        Test that student gets one of pre-generated variants
+        """
+        lecturer_client = APIClient()
+        lecturer_client.login(username=self.lecturer.username, password="")
+        lecturer_client.put(
+            reverse("api:launch_test", kwargs={"test_id": self.test.id}),
+            json.dumps({"variants_num": 3}),
+            content_type="application/json",
+        )
+        testing_result = TestResult.objects.get(is_running=True)
+        variants = list(TestVariant.objects.filter(testing_result=testing_result))
+        self.assertEqual(3, len(variants))
+
+        student_client = APIClient()
+        student_client.login(username=self.student.username, password="")
+        response = student_client.post(
+            reverse("main:student_run_test"), {"test_id": self.test.id}
+        )
+        self.assertEqual(response.status_code, 200)
+        session = RunningTestsAnswers.objects.get(user__id=self.student.id)
+        self.assertIn(
+            bytes(session.layout), [bytes(variant.layout) for variant in variants]
+        )
+        self.assertContains(response, self.question.formulation)
+
+        lecturer_client.post(
+            reverse("main:stop_running_test"), {"test_id": self.test.id}
+        )
+        self.assertEqual(0, TestVariant.objects.count())
+
+    def test_question_edited(self):
+        """
+        Test that variants are not handed out after editing of questions
+        """
+        lecturer_client = APIClient()
+        lecturer_client.login(username=self.lecturer.username, password="")
+        lecturer_client.put(
+            reverse("api:launch_test", kwargs={"test_id": self.test.id}),
+            json.dumps({"variants_num": 3}),
+            content_type="application/json",
+        )
+        testing_result = TestResult.objects.get(is_running=True)
+        test = Test.objects.get(id=self.test.id)
+        self.assertIsNotNone(
+            variants_cache.pick(testing_result.id, test.questions_version)
+        )
+
+        lecturer_client.put(
+            reverse(
+                "api:edit_questions_api",
+                kwargs={"test_id": self.test.id, "question_id": self.question.id},
+            ),
+            json.dumps({"formulation": "Updated formulation"}),
+            content_type="application/json",
+        )
+        self.assertEqual(0, TestVariant.objects.count())
+        test = Test.objects.get(id=self.test.id)
+        self.assertIsNone(
+            variants_cache.pick(testing_result.id, test.questions_version)
+        )
+
+        student_client = APIClient()
+        student_client.login(username=self.student.username, password="")
+        response = student_client.post(
+            reverse("main:student_run_test"), {"test_id": self.test.id}
+        )
+        self.assertContains(response, "Updated formulation")
+
+    def test_not_enough_questions(self):
+        """
+        Test that variants are not generated if there are not enough questions
+        """
+        testing_result = TestResult.objects.create(
+            test=self.test,
+            launched_lecturer=self.lecturer,
+            subject=self.subject,
+            is_running=True,
+        )
+        Test.objects.filter(id=self.test.id).update(tasks_num=3)
+        test = Test.objects.get(id=self.test.id)
+        self.assertEqual([], generate_variants(testing_result, test, 3))
+        self.assertEqual(0, TestVariant.objects.count())
+
+    def test_invalid_variants_num(self):
+        """
+        Test that test is not launched with invalid number of variants
+        """
+        client = APIClient()
+        client.login(username=self.lecturer.username, password="")
+        for variants_num in ["x", None, -1, 10**6]:
+            response = client.put(
+                reverse("api:launch_test", kwargs={"test_id": self.test.id}),
+                json.dumps({"variants_num": variants_num}),
+                content_type="application/json",
+            )
+            self.assertEqual(400, response.status_code)
+            self.assertFalse(response.data["ok"])
+        self.assertFalse(TestResult.objects.exists())
+
+
+class RunningTestsAnswersLayoutTest(MainTest):
+    """
+    Tests for compact layout of running tests sessions
+    """
+
+    def test_pack_layout(self):
+        """
+        Test packing and unpacking of layout
+        """
+        layout = [(self.question.id, [2, 0, 1]), (self.another_question.id, [1, 0])]
+        packed = pack_layout(layout)
+        self.assertEqual(4 * 9, len(packed))
+        self.assertEqual(layout, unpack_layout(packed))
+
+    def test_right_answers(self):
+        """
+        Test rebuilding answer key from layout
+        """
+        session = RunningTestsAnswers.objects.create(
+            test=self.test,
+            user=self.student,
+            test_duration=self.test.duration,
+            seed=0,
+            layout=pack_layout(
+                [(self.question.id, [2, 0, 1]), (self.another_question.id, [1, 0])]
+            ),
+        )
+        session = RunningTestsAnswers.objects.get(id=session.id)
+        right_answers = get_right_answers(session)
+        self.assertEqual(
+            ["Third true option", "First true option"],
+            [option["option"] for option in right_answers[0]["right_options"]],
+        )
+        self.assertEqual(str(self.another_question.id), right_answers[1]["question_id"])
+        self.assertEqual(2, right_answers[1]["question_num"])
+
+
+class FragmentsCacheTest(MainTest):
+    """
+    Tests for cache of rendered questions fragments
+    """
+
+    def setUp(self) -> None:
+        super().setUp()
+        metrics.reset()
+
+    def test_render_questions(self):
+        """
+        Test that fragments are rendered once and reused for any options order
+        """
+        question = CachedQuestion.from_model(Question.objects.get(id=self.question.id))
+        html = render_questions([(question, [0, 1, 2])])
+        shuffled_html = render_questions([(question, [2, 0, 1])])
+        self.assertEqual(1, metrics.get("fragments.misses"))
+        self.assertEqual(1, metrics.get("fragments.hits"))
+        self.assertIn(self.question.formulation, html)
+        self.assertIn("id='1_1'", html)
+        self.assertLess(
+            shuffled_html.index("Third true option"),
+            shuffled_html.index("First true option"),
+        )
+
+    def test_question_update(self):
+        """
+        Test that updated question is rendered again
+        """
+        question = Question.objects.get(id=self.question.id)
+        render_questions([(CachedQuestion.from_model(question), [0, 1, 2])])
+        question.formulation = "Updated formulation"
+        question.save()
+        html = render_questions([(CachedQuestion.from_model(question), [0, 1, 2])])
+        self.assertEqual(2, metrics.get("fragments.misses"))
+        self.assertIn("Updated formulation", html)
+
+    def test_render_time(self):
+        """
+        Test that running test page render time is measured
+        """
+        client = Client()
+        client.login(username=self.lecturer.username, password="")
+        response = client.get(
+            reverse("main:lecturer_run_test", kwargs={"test_id": self.test.id})
+        )
+        self.assertContains(response, self.question.formulation)
+        self.assertEqual(1, metrics.snapshot()["timings"]["run_test.render"]["count"])
+
+
+@override_settings(EXAM_ADMISSION_LIMIT=1)
+class ExamAdmissionTest(MainTest):
+    """
+    Tests for admission control of test starts
+    """
+
+    def setUp(self) -> None:
+        super().setUp()
+        metrics.reset()
+        lecturer_client = APIClient()
+        lecturer_client.login(username=self.lecturer.username, password="")
+        lecturer_client.put(
+            reverse("api:launch_test", kwargs={"test_id": self.test.id}),
+            json.dumps({"variants_num": 1}),
+            content_type="application/json",
+        )
+        self.client = Client()
+        self.client.login(username=self.student.username, password="")
+
+    def test_admission_queue(self):
+        """
+        Test that start beyond the limit waits in queue and is admitted on retry
+        """
+        self.assertTrue(exam_admission.enter()[0])
+        response = self.client.post(
+            reverse("main:student_run_test"), {"test_id": self.test.id}
+        )
+        self.assertEqual(response.status_code, 200)
+        self.assertContains(response, 'id="position">1<')
+        self.assertEqual(0, RunningTestsAnswers.objects.count())
+        self.assertEqual({"active": 1, "queue_depth": 1}, exam_admission.stats())
+        ticket = (
+            response.content.decode()
+            .split('name="admission_ticket" value="')[1]
+            .split('"')[0]
+        )
+
+        response = self.client.post(
+            reverse("main:student_run_test"),
+            {"test_id": self.test.id, "admission_ticket": ticket},
+        )
+        self.assertContains(response, 'id="position">1<')
+
+        exam_admission.leave()
+        response = self.client.post(
+            reverse("main:student_run_test"),
+            {"test_id": self.test.id, "admission_ticket": ticket},
+        )
+        self.assertContains(response, self.question.formulation)
+        self.assertEqual(1, RunningTestsAnswers.objects.count())
+        self.assertEqual({"active": 0, "queue_depth": 0}, exam_admission.stats())
+        self.assertEqual(1, metrics.snapshot()["timings"]["admission.wait"]["count"])
+
+    def test_queue_order(self):
+        """
+        Test that new start does not overtake students waiting in queue
+        """
+        exam_admission.enter()
+        _, first_ticket, first_position = exam_admission.enter()
+        _, _, second_position = exam_admission.enter()
+        self.assertEqual((1, 2), (first_position, second_position))
+
+        exam_admission.leave()
+        self.assertFalse(exam_admission.enter()[0])
+        self.assertTrue(exam_admission.enter(first_ticket)[0])
+
+    def test_anonymous_not_admitted(self):
+        """
+        Test that start without logged in user does not take admission slot
+        """
+        self.assertTrue(exam_admission.enter()[0])
+        response = Client().post(
+            reverse("main:student_run_test"), {"test_id": self.test.id}
+        )
+        self.assertEqual(302, response.status_code)
+        self.assertEqual({"active": 1, "queue_depth": 0}, exam_admission.stats())
+
+
+class FinalizeSessionsTest(MainTest):
+    """
+    Tests for closing leftover running test sessions
+    """
+
+    def setUp(self) -> None:
+        super().setUp()
+        lecturer_client = APIClient()
+        lecturer_client.login(username=self.lecturer.username, password="")
+        lecturer_client.put(
+            reverse("api:launch_test", kwargs={"test_id": self.test.id}),
+            json.dumps({"variants_num": 1}),
+            content_type="application/json",
+        )
+        self.client = Client()
+        self.client.login(username=self.student.username, password="")
+
+    def create_sessions(self, count: int) -> List[RunningTestsAnswers]:
+        users = [
+            User.objects.create_user(username=f"student{count}_{idx}", password="")
+            for idx in range(count)
+        ]
+        RunningTestsAnswers.objects.bulk_create(
+            RunningTestsAnswers(
+                test=self.test,
+                user=user,
+                test_duration=self.test.duration,
+                seed=0,
+                layout=pack_layout(
+                    [(self.question.id, [0, 1, 2]), (self.another_question.id, [0, 1])]
+                ),
+            )
+            for user in users
+        )
+        return list(RunningTestsAnswers.objects.filter(user__in=users))
+
+    def finalize(self, sessions: List[RunningTestsAnswers]) -> int:
+        with CaptureQueriesContext(connection) as context:
+            finalize_sessions(sessions)
+        return len(context.captured_queries)
+
+    def run_test(self) -> int:
+        with CaptureQueriesContext(connection) as context:
+            response = self.client.post(
+                reverse("main:student_run_test"), {"test_id": self.test.id}
+            )
+        self.assertEqual(response.status_code, 200)
+        return len(context.captured_queries)
+
+    def test_constant_queries(self):
+        """
+        Test that number of queries does not depend on number of sessions
+        """
+        one_session_queries = self.finalize(self.create_sessions(1))
+        self.assertEqual(one_session_queries, self.finalize(self.create_sessions(5)))
+
+        testing_result = TestResult.objects.get(is_running=True)
+        results = UserResult.objects.filter(testing_result=testing_result)
+        self.assertEqual(6, results.count())
+        self.assertEqual({0}, {result.right_answers_count for result in results})
+        self.assertEqual(0, RunningTestsAnswers.objects.count())
+
+    def test_upsert(self):
+        """
+        Test that starting test replaces session of user by one statement
+        """
+        self.run_test()
+        session = RunningTestsAnswers.objects.get()
+        restarted = RunningTestsAnswers(
+            test=self.test,
+            user=self.student,
+            test_duration=self.test.duration,
+            seed=1,
+            layout=session.layout,
+        )
+        with self.assertNumQueries(1):
+            get_session_store().save(restarted)
+        self.assertEqual(session.id, restarted.id)
+        self.assertEqual(1, RunningTestsAnswers.objects.get().seed)
+
+        self.run_test()
+        self.assertEqual(1, RunningTestsAnswers.objects.get().seed)
+        self.assertEqual(0, UserResult.objects.count())
+
+        RunningTestsAnswers.objects.update(answers={"1": [0]})
+        self.run_test()
+        self.assertEqual(1, RunningTestsAnswers.objects.count())
+        self.assertEqual(1, UserResult.objects.count())
+
+    def test_claimed_once(self):
+        """
+        Test that session read by concurrent requests is finalized once
+        """
+        sessions = self.create_sessions(3)
+        stale = [RunningTestsAnswers.objects.get(id=session.id) for session in sessions]
+        self.assertEqual(3, len(finalize_sessions(sessions)))
+        self.assertEqual([], finalize_sessions(stale))
+        self.assertEqual(3, UserResult.objects.count())
+
+    def test_double_click(self):
+        """
+        Test that repeated start of the same test continues session
+        """
+        self.run_test()
+        session = RunningTestsAnswers.objects.get()
+        self.run_test()
+        self.assertEqual(0, UserResult.objects.count())
+        restarted = RunningTestsAnswers.objects.get()
+        self.assertEqual(session.start_date, restarted.start_date)
+        self.assertEqual(bytes(session.layout), bytes(restarted.layout))
+
+
+@override_settings(EVENTS_DEBOUNCE_SECONDS=0)
+class StopTestTest(MainTest):
+    """
+    Tests for finalizing running sessions when test is stopped
+    """
+
+    def setUp(self) -> None:
+        super().setUp()
+        self.lecturer_client = Client()
+        self.lecturer_client.login(username=self.lecturer.username, password="")
+        User.objects.bulk_create(User(username=f"student_{idx}") for idx in range(100))
+        self.users = list(User.objects.filter(username__startswith="student_"))
+
+    def stop_test(self, sessions_num: int) -> int:
+        self.lecturer_client.put(
+            reverse("api:launch_test", kwargs={"test_id": self.test.id}),
+            json.dumps({"variants_num": 1}),
+            content_type="application/json",
+        )
+        RunningTestsAnswers.objects.bulk_create(
+            RunningTestsAnswers(
+                test=self.test,
+                user=user,
+                test_duration=self.test.duration,
+                seed=0,
+                layout=pack_layout(
+                    [(self.question.id, [0, 1, 2]), (self.another_question.id, [0, 1])]
+                ),
+                answers={"2": [1]},
+            )
+            for user in self.users[:sessions_num]
+        )
+        with CaptureQueriesContext(connection) as context:
+            response = self.lecturer_client.post(
+                reverse("main:stop_running_test"), {"test_id": self.test.id}
+            )
+        self.assertEqual(response.status_code, 200)
+        return len(context.captured_queries)
+
+    def test_stop_test(self):
+        """
+        Test that sessions are finalized in fixed number of queries and
+        stop is broadcasted
+        """
+        layer = get_channel_layer()
+        channel = async_to_sync(layer.new_channel)()
+        async_to_sync(layer.group_add)(lecturer_group(self.lecturer.id), channel)
+
+        self.assertEqual(self.stop_test(3), self.stop_test(100))
+        self.assertEqual(0, RunningTestsAnswers.objects.count())
+        for testing_result in TestResult.objects.all():
+            self.assertFalse(testing_result.is_running)
+            self.assertEqual(
+                {1},
+                {result.right_answers_count for result in testing_result.results.all()},
+            )
+        self.assertEqual(
+            [3, 100],
+            [
+                testing_result.results.count()
+                for testing_result in TestResult.objects.order_by("id")
+            ],
+        )
+        self.assertEqual(
+            ["test_launched", "test_stopped"] * 2,
+            [async_to_sync(layer.receive)(channel)["event"] for _ in range(4)],
+        )
+
+    def test_lecturer_trial_run(self):
+        """
+        Test that trial run of lecturer is not stored as result of running test
+        """
+        lecturer_client = Client()
+        lecturer_client.login(username=self.lecturer.username, password="")
+        lecturer_client.get(
+            reverse("main:lecturer_run_test", kwargs={"test_id": self.test.id})
+        )
+        self.stop_test(1)
+        self.assertEqual(0, RunningTestsAnswers.objects.count())
+        self.assertEqual(0, UserResult.objects.filter(user=self.lecturer).count())
+        self.assertEqual(1, UserResult.objects.count())
+
+    def test_stop_not_owned(self):
+        """
+        Test that lecturer can not stop test launched by another lecturer and
+        its sessions are kept
+        """
+        self.lecturer_client.put(
+            reverse("api:launch_test", kwargs={"test_id": self.test.id}),
+            json.dumps({"variants_num": 1}),
+            content_type="application/json",
+        )
+        RunningTestsAnswers.objects.create(
+            test=self.test, user=self.users[0], test_duration=self.test.duration
+        )
+        another_lecturer = User.objects.create_user(username="another", password="")
+        another_lecturer.groups.add(1)
+        client = Client()
+        client.login(username=another_lecturer.username, password="")
+
+        response = client.post(
+            reverse("main:stop_running_test"), {"test_id": self.test.id}
+        )
+        self.assertEqual(response.status_code, 403)
+        self.assertEqual(1, RunningTestsAnswers.objects.count())
+        self.assertTrue(TestResult.objects.get().is_running)
+
+        response = client.post(
+            reverse("main:stop_running_test"), {"test_id": self.test.id + 1}
+        )
+        self.assertEqual(response.status_code, 404)
+        response = client.post(reverse("main:stop_running_test"), {"test_id": "x"})
+        self.assertEqual(response.status_code, 404)
+
+
+class ChannelLayerTest(TestCase):
+    """
+    Tests for channel layer shared between processes
+    """
+
+    def test_dispatch(self):
+        """
+        Test delivery of messages published by other processes to local
+        channels and skipping of own messages
+        """
+        layer = PostgresChannelLayer()
+        self.assertFalse(layer.shared)
+
+        async def receive_published():
+            channel = await layer.new_channel()
+            await layer.group_add("running_tests", channel)
+            for origin, text in ((layer.instance, "own"), ("other", "published")):
+                layer._dispatch(
+                    json.dumps(
+                        {
+                            "origin": origin,
+                            "group": "running_tests",
+                            "message": {"type": "action", "action": text},
+                        }
+                    )
+                )
+            layer._dispatch(
+                json.dumps(
+                    {
+                        "origin": "other",
+                        "channel": channel,
+                        "message": {"type": "action", "action": "direct"},
+                    }
+                )
+            )
+            return [await layer.receive(channel), await layer.receive(channel)]
+
+        self.assertEqual(
+            [
+                {"type": "action", "action": "published"},
+                {"type": "action", "action": "direct"},
+            ],
+            async_to_sync(receive_published)(),
+        )
+
+
+@override_settings(EVENTS_DEBOUNCE_SECONDS=60)
+class EventsTest(MainTest):
+    """
+    Tests for running tests events sent by server
+    """
+
+    def setUp(self) -> None:
+        super().setUp()
+        self.testing_result = TestResult.objects.create(
+            test=self.test,
+            launched_lecturer=self.lecturer,
+            subject=self.subject,
+            is_running=True,
+        )
+        self.layer = get_channel_layer()
+        # Events of other tests written by debouncer thread outside of test
+        # transaction
+        RunningTestsEvent.objects.all().delete()
+        cache.clear()
+
+    async def connect(self, user, path: str) -> WebsocketCommunicator:
+        communicator = WebsocketCommunicator(RunningTestsConsumer.as_asgi(), path)
+        communicator.scope["user"] = user
+        connected, _ = await communicator.connect()
+        self.assertTrue(connected)
+        return communicator
+
+    def subscribe(self, group: str) -> str:
+        channel = async_to_sync(self.layer.new_channel)()
+        async_to_sync(self.layer.group_add)(group, channel)
+        return channel
+
+    def receive_all(self, channel: str) -> List[str]:
+        received = []
+        while (
+            channel in self.layer.channels and not self.layer.channels[channel].empty()
+        ):
+            received.append(async_to_sync(self.layer.receive)(channel)["event"])
+        return received
+
+    def test_coalescing(self):
+        """
+        Test that burst of events about the same test is sent once
+        """
+        channel = self.subscribe(lecturer_group(self.lecturer.id))
+
+        for _ in range(300):
+            events.emit(events.TEST_PASSED, self.test.id)
+        events.emit(events.TEST_STOPPED, self.test.id, self.testing_result)
+        self.assertEqual(2, events.events_debouncer.flush())
+        self.assertEqual(
+            [
+                {
+                    "type": "event",
+                    "event": event,
+                    "test_id": self.test.id,
+                    "testing_result_id": self.testing_result.id,
+                    "seq": seq,
+                    **data,
+                }
+                for seq, (event, data) in enumerate(
+                    (("test_passed", {"results": None}), ("test_stopped", {})),
+                    start=1,
+                )
+            ],
+            [async_to_sync(self.layer.receive)(channel) for _ in range(2)],
+        )
+
+    def test_result_deltas(self):
+        """
+        Test that submissions send rows of new results, coalesced up to
+        MAX_DELTA_RESULTS rows
+        """
+        channel = self.subscribe(lecturer_group(self.lecturer.id))
+        client = Client()
+        client.login(username=self.student.username, password="")
+        client.post(reverse("main:student_run_test"), {"test_id": self.test.id})
+        answers = self.get_answers(RunningTestsAnswers.objects.get())
+        client.post(
+            reverse("main:test_result"), {"test-passed": "", "time": 30, **answers}
+        )
+        events.emit(
+            events.TEST_PASSED,
+            self.test.id,
+            data={"results": [{"user": {"id": 0, "username": "another"}}]},
+        )
+        events.events_debouncer.flush()
+        message = async_to_sync(self.layer.receive)(channel)
+        self.assertEqual(self.testing_result.id, message["testing_result_id"])
+        self.assertEqual(
+            [self.student.username, "another"],
+            [row["user"]["username"] for row in message["results"]],
+        )
+        self.assertEqual(
+            {"right_answers_count": 1, "tasks_num": 2, "time": 30},
+            {
+                key: message["results"][0][key]
+                for key in ("right_answers_count", "tasks_num", "time")
+            },
+        )
+
+        for _ in range(events.MAX_DELTA_RESULTS + 1):
+            events.emit(events.TEST_PASSED, self.test.id, data={"results": [{}]})
+        events.events_debouncer.flush()
+        self.assertIsNone(async_to_sync(self.layer.receive)(channel)["results"])
+
+    def test_result_rows(self):
+        """
+        Test that rows of saved results carry ids, so retakes with the same
+        score and time are different rows
+        """
+        channel = self.subscribe(lecturer_group(self.lecturer.id))
+        user_results = [
+            UserResult.objects.create(
+                user=self.student,
+                testing_result=self.testing_result,
+                time=30,
+                tasks_num=2,
+                right_answers_count=1,
+                questions=[],
+            )
+            for _ in range(2)
+        ]
+        events.emit_results(user_results)
+        events.events_debouncer.flush()
+        rows = async_to_sync(self.layer.receive)(channel)["results"]
+        self.assertEqual(
+            [user_result.id for user_result in user_results],
+            [row["id"] for row in rows],
+        )
+        self.assertEqual(
+            {"id": self.student.id, "username": self.student.username},
+            rows[0]["user"],
+        )
+
+    def test_delta_size(self):
+        """
+        Test that delta which does not fit into NOTIFY payload is not sent and
+        event failed to send is not sent again
+        """
+        channel = self.subscribe(lecturer_group(self.lecturer.id))
+        row = {
+            "user": {"id": self.student.id, "username": "Студент" * 10},
+            "right_answers_count": 1,
+            "tasks_num": 2,
+            "time": 30,
+            "date": "12:00:00  01-09-26",
+        }
+        for _ in range(2):
+            events.emit(events.TEST_PASSED, self.test.id, data={"results": [row]})
+        events.events_debouncer.flush()
+        self.assertEqual(2, len(async_to_sync(self.layer.receive)(channel)["results"]))
+
+        for _ in range(events.MAX_DELTA_RESULTS):
+            events.emit(events.TEST_PASSED, self.test.id, data={"results": [row]})
+        events.events_debouncer.flush()
+        self.assertIsNone(async_to_sync(self.layer.receive)(channel)["results"])
+
+        events.emit(events.TEST_LAUNCHED, self.test.id, self.testing_result)
+        with patch.object(self.layer, "group_send", side_effect=ChannelFull):
+            events.events_debouncer.flush()
+        self.assertEqual(0, events.events_debouncer.flush())
+        self.assertEqual([], self.receive_all(channel))
+
+    def test_routing(self):
+        """
+        Test that events are sent only to affected groups
+        """
+        another_lecturer = User.objects.create_user(username="another_lecturer")
+        channels = {
+            "lecturer": self.subscribe(lecturer_group(self.lecturer.id)),
+            "another_lecturer": self.subscribe(lecturer_group(another_lecturer.id)),
+            "students": self.subscribe(STUDENTS_GROUP),
+            "passing": self.subscribe(testing_result_group(self.testing_result.id)),
+            "another_test": self.subscribe(
+                testing_result_group(self.testing_result.id + 1)
+            ),
+        }
+
+        for event in (events.TEST_LAUNCHED, events.TEST_PASSED, events.TEST_STOPPED):
+            events.emit(event, self.test.id, self.testing_result)
+        events.events_debouncer.flush()
+        self.assertEqual(
+            {
+                "lecturer": ["test_launched", "test_passed", "test_stopped"],
+                "another_lecturer": [],
+                "students": ["test_launched", "test_stopped"],
+                "passing": ["test_stopped"],
+                "another_test": [],
+            },
+            {name: self.receive_all(channel) for name, channel in channels.items()},
+        )
+
+    def test_consumer_groups(self):
+        """
+        Test that socket joins group of its user or of watched running test
+        """
+        RunningTestsAnswers.objects.create(
+            test=self.test, user=self.student, test_duration=self.test.duration
+        )
+
+        async def receive_events():
+            sockets = {
+                "lecturer": await self.connect(self.lecturer, "/available_tests/"),
+                "student": await self.connect(self.student, "/available_tests/"),
+                "passing": await self.connect(
+                    self.student,
+                    f"/available_tests/?testing_result={self.testing_result.id}",
+                ),
+            }
+            for communicator in sockets.values():
+                self.assertEqual(
+                    {"event": "sync", "seq": 0}, await communicator.receive_json_from()
+                )
+            await self.layer.group_send(
+                lecturer_group(self.lecturer.id), {"type": "event", "event": "lecturer"}
+            )
+            await self.layer.group_send(
+                STUDENTS_GROUP, {"type": "event", "event": "students"}
+            )
+            await self.layer.group_send(
+                testing_result_group(self.testing_result.id),
+                {"type": "event", "event": "passing"},
+            )
+            received = {}
+            for name, communicator in sockets.items():
+                received[name] = (await communicator.receive_json_from())["event"]
+                self.assertTrue(await communicator.receive_nothing())
+                await communicator.disconnect()
+            return received
+
+        self.assertEqual(
+            {"lecturer": "lecturer", "student": "students", "passing": "passing"},
+            async_to_sync(receive_events)(),
+        )
+
+    def test_testing_result_group_rejected(self):
+        """
+        Test that socket of user which does not pass running test and did not
+        launch it does not join group of the test
+        """
+        other_lecturer = User.objects.create_user(username="other", password="")
+        other_lecturer.groups.add(1)
+        path = f"/available_tests/?testing_result={self.testing_result.id}"
+
+        async def receive_events():
+            sockets = {
+                "student": await self.connect(self.student, path),
+                "other": await self.connect(other_lecturer, path),
+            }
+            for communicator in sockets.values():
+                await communicator.receive_json_from()
+            await self.layer.group_send(
+                testing_result_group(self.testing_result.id),
+                {"type": "event", "event": "passing"},
+            )
+            await self.layer.group_send(
+                STUDENTS_GROUP, {"type": "event", "event": "students"}
+            )
+            await self.layer.group_send(
+                lecturer_group(other_lecturer.id),
+                {"type": "event", "event": "lecturer"},
+            )
+            received = {}
+            for name, communicator in sockets.items():
+                received[name] = (await communicator.receive_json_from())["event"]
+                self.assertTrue(await communicator.receive_nothing())
+                await communicator.disconnect()
+            return received
+
+        self.assertEqual(
+            {"student": "students", "other": "lecturer"},
+            async_to_sync(receive_events)(),
+        )
+
+    def test_anonymous_socket_rejected(self):
+        """
+        Test that socket of anonymous user is closed
+        """
+
+        async def connect():
+            communicator = WebsocketCommunicator(
+                RunningTestsConsumer.as_asgi(), "/available_tests/"
+            )
+            connected, _ = await communicator.connect()
+            return connected
+
+        self.assertFalse(async_to_sync(connect)())
+
+    def test_client_messages_ignored(self):
+        """
+        Test that clients can not broadcast events
+        """
+
+        async def send_action():
+            communicator = await self.connect(self.student, "/available_tests/")
+            await communicator.receive_json_from()
+            await communicator.send_json_to({"action": "test was stopped"})
+            nothing = await communicator.receive_nothing()
+            await communicator.disconnect()
+            return nothing
+
+        self.assertTrue(async_to_sync(send_action)())
+
+    def emit_all(self, *emitted: str) -> None:
+        for event in emitted:
+            events.emit(event, self.test.id, self.testing_result)
+            events.events_debouncer.flush()
+
+    def test_since(self):
+        """
+        Test that only missed events of socket groups are returned while they
+        are in buffer
+        """
+        self.emit_all(events.TEST_LAUNCHED, events.TEST_PASSED, events.TEST_STOPPED)
+        self.assertEqual(3, events_log.last_seq())
+        self.assertEqual(
+            [("test_stopped", 3)],
+            [
+                (event["event"], event["seq"])
+                for event in events_log.since(
+                    0, [testing_result_group(self.testing_result.id)]
+                )
+            ],
+        )
+        self.assertEqual([], events_log.since(3, [STUDENTS_GROUP]))
+        self.assertIsNone(events_log.since(4, [STUDENTS_GROUP]))
+
+        RunningTestsEvent.objects.all().delete()
+        with override_settings(EVENTS_BUFFER_SIZE=2):
+            self.emit_all(
+                events.TEST_LAUNCHED,
+                events.TEST_PASSED,
+                events.TEST_STOPPED,
+                events.TEST_LAUNCHED,
+            )
+            self.assertIsNone(events_log.since(1, [STUDENTS_GROUP]))
+            self.assertEqual(
+                [("test_stopped", 3), ("test_launched", 4)],
+                [
+                    (event["event"], event["seq"])
+                    for event in events_log.since(2, [STUDENTS_GROUP])
+                ],
+            )
+
+    def test_resume(self):
+        """
+        Test that reconnected socket gets missed events or is asked to reload
+        snapshot
+        """
+        self.emit_all(events.TEST_LAUNCHED, events.TEST_PASSED, events.TEST_STOPPED)
+
+        async def receive_all(path: str) -> List[tuple]:
+            communicator = await self.connect(self.lecturer, path)
+            received = []
+            while await communicator.receive_nothing() is False:
+                message = await communicator.receive_json_from()
+                received.append((message["event"], message["seq"]))
+            await communicator.disconnect()
+            return received
+
+        self.assertEqual(
+            [("test_passed", 2), ("test_stopped", 3), ("sync", 3)],
+            async_to_sync(receive_all)("/available_tests/?last_seq=1"),
+        )
+        with override_settings(EVENTS_BUFFER_SIZE=1):
+            self.assertEqual(
+                [("resync", 3)],
+                async_to_sync(receive_all)("/available_tests/?last_seq=1"),
+            )
+
+    @override_settings(WEBSOCKET_HEARTBEAT_SECONDS=0.05, WEBSOCKET_IDLE_TIMEOUT=0.12)
+    def test_heartbeat(self):
+        """
+        Test that socket answering pings stays open and silent socket is closed
+        """
+
+        async def heartbeat():
+            communicator = await self.connect(self.student, "/available_tests/")
+            await communicator.receive_json_from()
+            for _ in range(5):
+                self.assertEqual(
+                    {"event": "ping"}, await communicator.receive_json_from(timeout=1)
+                )
+                await communicator.send_json_to({"event": "pong"})
+            received = []
+            while True:
+                output = await communicator.receive_output(timeout=1)
+                if output["type"] == "websocket.close":
+                    return received
+                received.append(json.loads(output["text"])["event"])
+
+        self.assertLessEqual(set(async_to_sync(heartbeat)()), {"ping"})
+
+    @override_settings(WEBSOCKET_QUEUE_SIZE=2)
+    def test_backpressure(self):
+        """
+        Test that events queued for slow client are replaced by resync request
+        """
+        consumer = RunningTestsConsumer()
+        consumer.queue = deque()
+
+        async def send_events():
+            # Sending to client is in progress
+            consumer.sender = asyncio.get_running_loop().create_future()
+            for seq in range(1, 4):
+                await consumer.event(
+                    {"type": "event", "event": "test_passed", "seq": seq}
+                )
+
+        async_to_sync(send_events)()
+        self.assertEqual([{"event": "resync", "seq": 3}], list(consumer.queue))
+
+
+class AggregatesTest(MainTest):
+    """
+    Tests for live aggregates of running tests
+    """
+
+    def setUp(self) -> None:
+        super().setUp()
+        self.testing_result = TestResult.objects.create(
+            test=self.test,
+            launched_lecturer=self.lecturer,
+            subject=self.subject,
+            is_running=True,
+        )
+        self.add_results([(10, 0), (40, 1), (20, 2), (30, 2)])
+        self.client = APIClient()
+        self.client.login(username=self.lecturer.username, password="")
+
+    def add_results(self, results) -> List[UserResult]:
+        return UserResult.objects.bulk_create(
+            UserResult(
+                user=self.student,
+                testing_result=self.testing_result,
+                time=time,
+                tasks_num=2,
+                right_answers_count=score,
+                questions=[],
+            )
+            for time, score in results
+        )
+
+    def get_aggregates(self) -> Dict:
+        return self.client.get(
+            reverse(
+                "api:running_test_aggregates",
+                kwargs={"testing_result_id": self.testing_result.id},
+            )
+        ).data
+
+    def test_aggregates(self):
+        """
+        Test that aggregates are loaded from database once and then updated
+        by saved results
+        """
+        self.assertEqual(
+            {
+                "finished": 4,
+                "mean_score": 1.25,
+                "median_time": 25,
+                "histogram": [1, 1, 2],
+            },
+            self.get_aggregates(),
+        )
+        results = self.add_results([(50, 2)])
+        aggregates_cache.add_results(results)
+        aggregates_cache.add_results(results)
+        with self.assertNumQueries(0):
+            aggregates = aggregates_cache.get(self.testing_result.id)
+        self.assertEqual(
+            {
+                "finished": 5,
+                "mean_score": 1.4,
+                "median_time": 30,
+                "histogram": [1, 1, 3],
+            },
+            aggregates,
+        )
+
+    def test_refresh(self):
+        """
+        Test that aggregates are reloaded to pick up results saved by other
+        workers without counting results twice
+        """
+        self.get_aggregates()
+        results = self.add_results([(50, 2)])
+        with override_settings(AGGREGATES_REFRESH_SECONDS=0):
+            self.assertEqual(5, self.get_aggregates()["finished"])
+        aggregates_cache.add_results(results)
+        with self.assertNumQueries(0):
+            self.assertEqual(
+                5, aggregates_cache.get(self.testing_result.id)["finished"]
+            )
+
+    def test_invalid_id(self):
+        """
+        Test that non-numeric testing result id is not routed
+        """
+        url = reverse("api:running_test_aggregates", kwargs={"testing_result_id": 0})
+        response = self.client.get(url.replace("/0/", "/x/"))
+        self.assertEqual(404, response.status_code)
+
+
+class DeadlineTest(MainTest):
+    """
+    Tests for signed deadlines of running tests
+    """
+
+    def test_sign_deadline(self):
+        """
+        Test checking of signed deadline
+        """
+        token = sign_deadline(1234567890.5)
+        self.assertEqual(1234567890.5, read_deadline(token))
+        self.assertIsNone(read_deadline(token[:-1]))
+
+    def test_get_left_time(self):
+        """
+        Test that left time is checked by deadline handed out on test start
+        without database queries
+        """
+        client = Client()
+        client.login(username=self.lecturer.username, password="")
+        response = client.get(
+            reverse("main:lecturer_run_test", kwargs={"test_id": self.test.id})
+        )
+        token = response.context["deadline"]
+
+        with self.assertNumQueries(0):
+            response = client.post(reverse("main:get_left_time"), {"deadline": token})
+        time_left = response.json()["time_left"]
+        self.assertTrue(self.test.duration - 5 < time_left <= self.test.duration)
+
+        response = client.post(reverse("main:get_left_time"), {"deadline": "bad"})
+        self.assertEqual({}, response.json())
+
+    def test_resumed_time_left(self):
+        """
+        Test that timer of resumed test starts from time left, not from test
+        duration
+        """
+        client = Client()
+        client.login(username=self.student.username, password="")
+        client.post(reverse("main:student_run_test"), {"test_id": self.test.id})
+        RunningTestsAnswers.objects.update(
+            start_date=F("start_date") - timedelta(seconds=30)
+        )
+
+        response = client.post(
+            reverse("main:student_run_test"), {"test_id": self.test.id}
+        )
+        time_left = response.context["time_left"]
+        self.assertTrue(self.test.duration - 35 < time_left <= self.test.duration - 30)
+
+
+class BatchWriterTest(TestCase):
+    """
+    Tests for write-behind buffer
+    """
+
+    def test_coalescing(self):
+        """
+        Test that only the last value by key is written
+        """
+        batches = []
+        writer = BatchWriter("test", batches.append, interval=3600)
+        writer.submit("a", 1)
+        writer.submit("a", 2)
+        writer.submit("b", 3)
+        self.assertEqual((True, 2), writer.lookup("a"))
+        self.assertEqual(2, writer.flush())
+        self.assertEqual([{"a": 2, "b": 3}], batches)
+        self.assertEqual((False, None), writer.lookup("a"))
+        self.assertEqual(0, writer.flush())
+
+    def test_failed_write(self):
+        """
+        Test that failed batch is written on next flush
+        """
+        batches = []
+
+        def apply(batch):
+            if not batches:
+                batches.append(None)
+                raise ValueError("Database is unavailable")
+            batches.append(batch)
+
+        writer = BatchWriter("test", apply, interval=3600)
+        writer.submit("a", 1)
+        self.assertEqual(0, writer.flush())
+        writer.submit("b", 2)
+        self.assertEqual(2, writer.flush())
+        self.assertEqual({"a": 1, "b": 2}, batches[-1])
+
+
+@override_settings(SESSION_STORE="cache", WRITE_BEHIND_INTERVAL=3600)
+class CacheSessionStoreTest(MainTest):
+    """
+    Tests for running test sessions stored in cache
+    """
+
+    def setUp(self) -> None:
+        super().setUp()
+        cache.clear()
+        lecturer_client = APIClient()
+        lecturer_client.login(username=self.lecturer.username, password="")
+        lecturer_client.put(
+            reverse("api:launch_test", kwargs={"test_id": self.test.id}),
+            json.dumps({"variants_num": 1}),
+            content_type="application/json",
+        )
+        self.client = Client()
+        self.client.login(username=self.student.username, password="")
+
+    def tearDown(self) -> None:
+        get_session_store().flush()
+
+    def test_check_shared_cache(self):
+        """
+        Test that cache store is refused with cache in memory of worker
+        """
+        self.assertEqual(["main.E001"], [error.id for error in check_session_store()])
+        database_cache = {
+            "default": {
+                "BACKEND": "django.core.cache.backends.db.DatabaseCache",
+                "LOCATION": "quizer_cache",
+            }
+        }
+        with override_settings(CACHES=database_cache):
+            self.assertEqual([], check_session_store())
+
+    def test_write_behind(self):
+        """
+        Test that session is read from cache and written to database on flush
+        """
+        self.client.post(reverse("main:student_run_test"), {"test_id": self.test.id})
+        self.assertEqual(0, RunningTestsAnswers.objects.count())
+        store = get_session_store()
+        with self.assertNumQueries(0):
+            session = store.get(self.student.id)
+        self.assertEqual(self.test.id, session.test_id)
+
+        store.flush()
+        self.assertEqual(1, RunningTestsAnswers.objects.count())
+
+        cache.clear()
+        restored = CacheSessionStore().get(self.student.id)
+        self.assertEqual(bytes(session.layout), restored.layout)
+
+        response = self.client.post(reverse("main:test_result"), {"test-passed": ""})
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(1, UserResult.objects.count())
+        self.assertIsNone(store.get(self.student.id))
+        store.flush()
+        self.assertEqual(0, RunningTestsAnswers.objects.count())
+
+    def test_related_not_cached(self):
+        """
+        Test that cached session keeps only ids, so test of session is current
+        """
+        self.client.post(reverse("main:student_run_test"), {"test_id": self.test.id})
+        store = get_session_store()
+        store.flush()
+        cache.clear()
+        store.get(self.student.id)
+        Test.objects.filter(id=self.test.id).update(questions_version=5)
+
+        session = store.get(self.student.id)
+        self.assertEqual(5, session.test.questions_version)
+        self.assertEqual(self.student.id, session.user_id)
+
+
+@override_settings(SUBMISSION_PIPELINE=True, WRITE_BEHIND_INTERVAL=60)
+class SubmissionPipelineTest(MainTest):
+    """
+    Tests for write-behind saving of submitted tests
+    """
+
+    def setUp(self) -> None:
+        super().setUp()
+        lecturer_client = APIClient()
+        lecturer_client.login(username=self.lecturer.username, password="")
+        lecturer_client.put(
+            reverse("api:launch_test", kwargs={"test_id": self.test.id}),
+            json.dumps({"variants_num": 1}),
+            content_type="application/json",
+        )
+        self.client = Client()
+        self.client.login(username=self.student.username, password="")
+        self.client.post(reverse("main:student_run_test"), {"test_id": self.test.id})
+
+    def tearDown(self) -> None:
+        submissions_writer.flush()
+
+    def submit(self) -> HttpResponse:
+        answers = self.get_answers(RunningTestsAnswers.objects.get())
+        return self.client.post(
+            reverse("main:test_result"), {"test-passed": "", "time": 30, **answers}
+        )
+
+    def test_queued_submission(self):
+        """
+        Test that result is shown before it is saved and repeated submission
+        shows the same result
+        """
+        response = self.submit()
+        self.assertContains(response, "Число правильных ответов: 1/2")
+        self.assertEqual(0, UserResult.objects.count())
+        self.assertContains(self.submit(), "Число правильных ответов: 1/2")
+
+        # Claim, running tests, insert, delete of sessions, users of results
+        with self.assertNumQueries(6):
+            submissions_writer.flush()
+        self.assertEqual(0, RunningTestsAnswers.objects.count())
+        result = UserResult.objects.get()
+        self.assertEqual(1, result.right_answers_count)
+        self.assertEqual(TestResult.objects.get(), result.testing_result)
+
+    def test_stored_submission(self):
+        """
+        Test that submission is stored in session before it is acknowledged,
+        so it is saved once with its score if worker dies or request is retried
+        """
+        self.submit()
+        session = RunningTestsAnswers.objects.get()
+        self.assertEqual(1, session.result["right_answers_count"])
+
+        result = submit_test(get_session_store().get(self.student.id), {})
+        self.assertEqual(1, result["right_answers_count"])
+        finalize_sessions([session])
+        submissions_writer.flush()
+        result = UserResult.objects.get()
+        self.assertEqual(1, result.right_answers_count)
+
+    def test_stop_after_submission(self):
+        """
+        Test that queued submission is saved with its score when test is stopped
+        """
+        self.submit()
+        lecturer_client = Client()
+        lecturer_client.login(username=self.lecturer.username, password="")
+        lecturer_client.post(
+            reverse("main:stop_running_test"), {"test_id": self.test.id}
+        )
+        result = UserResult.objects.get()
+        self.assertEqual(1, result.right_answers_count)
+        self.assertEqual(TestResult.objects.get(), result.testing_result)
+
+    def test_new_test_after_submission(self):
+        """
+        Test that queued result is saved before user starts new test
+        """
+        self.submit()
+        self.client.post(reverse("main:student_run_test"), {"test_id": self.test.id})
+        self.assertEqual(1, UserResult.objects.count())
+        self.assertEqual(1, RunningTestsAnswers.objects.count())
+
+
+@override_settings(WRITE_BEHIND_INTERVAL=60)
+class AutosaveTest(MainTest):
+    """
+    Tests for autosave of running test answers
+    """
+
+    def setUp(self) -> None:
+        super().setUp()
+        lecturer_client = APIClient()
+        lecturer_client.login(username=self.lecturer.username, password="")
+        lecturer_client.put(
+            reverse("api:launch_test", kwargs={"test_id": self.test.id}),
+            json.dumps({"variants_num": 1}),
+            content_type="application/json",
+        )
+        self.client = Client()
+        self.client.login(username=self.student.username, password="")
+        self.client.post(reverse("main:student_run_test"), {"test_id": self.test.id})
+        self.answers = {}
+        for key, value in self.get_answers(RunningTestsAnswers.objects.get()).items():
+            num, _, idx = key.partition("_")
+            self.answers[num] = [int(idx or value)]
+
+    def tearDown(self) -> None:
+        get_session_store().flush()
+
+    def autosave(self, answers: Dict[str, List[int]]) -> Dict:
+        return self.client.post(
+            reverse("main:autosave"), {"answers": json.dumps(answers)}
+        ).json()
+
+    def test_autosave(self):
+        """
+        Test that answers deltas are merged and written on flush
+        """
+        first, second = sorted(self.answers)
+        self.assertEqual({"ok": True}, self.autosave({first: [5]}))
+        self.assertEqual({"ok": True}, self.autosave({first: self.answers[first]}))
+        self.assertEqual({"ok": True}, self.autosave({second: self.answers[second]}))
+        self.assertIsNone(RunningTestsAnswers.objects.get().answers)
+
+        get_session_store().flush()
+        self.assertEqual(self.answers, RunningTestsAnswers.objects.get().answers)
+        self.assertFalse(self.autosave({"1": "0"})["ok"])
+
+    def test_commit(self):
+        """
+        Test that final submit grades autosaved answers updated by sent ones
+        """
+        first, second = sorted(self.answers)
+        self.autosave({first: self.answers[first], second: [5]})
+        response = self.client.post(
+            reverse("main:test_result"),
+            {
+                "test-passed": "",
+                "time": 30,
+                "answers": json.dumps({second: self.answers[second]}),
+            },
+        )
+        self.assertEqual(response.status_code, 200)
+        result = UserResult.objects.get()
+        self.assertEqual(
+            [self.answers[first], self.answers[second]],
+            [question["selected"] for question in result.questions],
+        )
+
+    def test_abandoned_session(self):
+        """
+        Test that abandoned session is graded by autosaved answers
+        """
+        self.autosave(self.answers)
+        self.client.post(reverse("main:student_run_test"), {"test_id": self.test.id})
+        result = UserResult.objects.get()
+        self.assertEqual(
+            list(self.answers.values()),
+            [question["selected"] for question in result.questions],
+        )
+
+
+class SweeperTest(MainTest):
+    """
+    Tests for sweeper of expired running test sessions
+    """
+
+    def create_session(self, user: User, started_ago: int) -> RunningTestsAnswers:
+        return RunningTestsAnswers.objects.create(
+            test=self.test,
+            user=user,
+            test_duration=self.test.duration,
+            start_date=timezone.now() - timedelta(seconds=started_ago),
+            seed=0,
+            layout=pack_layout(
+                [(self.question.id, [0, 1, 2]), (self.another_question.id, [0, 1])]
+            ),
+        )
+
+    def test_sweep_sessions(self):
+        """
+        Test that expired sessions are graded and orphaned ones are deleted
+        """
+        testing_result = TestResult.objects.create(
+            is_running=True, test=self.test, subject=self.subject
+        )
+        self.create_session(self.student, started_ago=self.test.duration + 120)
+        active = self.create_session(self.lecturer, started_ago=self.test.duration)
+        self.create_session(None, started_ago=0)
+
+        report = sweep_sessions(grace=60)
+        self.assertEqual(1, report["finalized"])
+        self.assertEqual(1, report["orphans"])
+        self.assertEqual([active.id], [s.id for s in RunningTestsAnswers.objects.all()])
+        result = UserResult.objects.get(user=self.student)
+        self.assertEqual(testing_result.id, result.testing_result_id)
+        self.assertEqual(self.test.duration, result.time)
+        self.assertEqual(2, result.tasks_num)
+
+    def test_command(self):
+        """
+        Test sweep_sessions management command
+        """
+        TestResult.objects.create(is_running=True, test=self.test, subject=self.subject)
+        self.create_session(self.student, started_ago=self.test.duration + 120)
+        out = StringIO()
+        call_command("sweep_sessions", grace=60, stdout=out)
+        self.assertIn("Finalized: 1, orphaned: 0", out.getvalue())
+        self.assertEqual(0, RunningTestsAnswers.objects.count())
+
+    def test_loop_error(self):
+        """
+        Test that error in one sweep does not stop sweeping loop
+        """
+        TestResult.objects.create(is_running=True, test=self.test, subject=self.subject)
+        self.create_session(self.student, started_ago=self.test.duration + 120)
+        errors = [OperationalError("connection reset")]
+
+        def sweep(**kwargs):
+            if errors:
+                raise errors.pop()
+            return sweep_sessions(**kwargs)
+
+        out = StringIO()
+        with patch(
+            "main.management.commands.sweep_sessions.sweep_sessions", sweep
+        ), patch(
+            "main.management.commands.sweep_sessions.time.sleep",
+            side_effect=[None, KeyboardInterrupt],
+        ), patch(
+            "main.management.commands.sweep_sessions.close_old_connections"
+        ) as close_old_connections:
+            with self.assertRaises(KeyboardInterrupt):
+                call_command("sweep_sessions", loop=True, grace=60, stdout=out)
+        close_old_connections.assert_called_once()
+        self.assertIn("Finalized: 1, orphaned: 0", out.getvalue())
+
+    def test_no_results_stored(self):
+        """
+        Test that expired trial runs of lecturers and sessions of tests which are
+        not running are deleted without results
+        """
+        self.create_session(self.lecturer, started_ago=self.test.duration + 120)
+        self.create_session(self.student, started_ago=self.test.duration + 120)
+
+        report = sweep_sessions(grace=60)
+        self.assertEqual(0, report["finalized"])
+        self.assertEqual(0, RunningTestsAnswers.objects.count())
+        self.assertEqual(0, UserResult.objects.count())
+
+
+class RegradingTest(MainTest):
+    """
+    Tests for re-grading of saved results
+    """
+
+    def setUp(self) -> None:
+        super().setUp()
+        testing_result = TestResult.objects.create(
+            is_running=False, test=self.test, subject=self.subject
+        )
+        self.result = UserResult.objects.create(
+            testing_result=testing_result,
+            user=self.student,
+            time=10,
+            tasks_num=2,
+            right_answers_count=2,
+            questions=[
+                {
+                    "question_id": str(self.question.id),
+                    "selected_options": ["Third true option", "First true option"],
+                    "right_options": ["Third true option", "First true option"],
+                    "is_true": True,
+                },
+                {
+                    "question_id": str(self.another_question.id),
+                    "selected_options": ["True option"],
+                    "right_options": ["True option"],
+                    "is_true": True,
+                },
+            ],
+        )
+        self.client = APIClient()
+        self.client.login(username=self.lecturer.username, password="")
+
+    def test_regrade(self):
+        """
+        Test re-grading after fixing right option through API
+        """
+        response = self.client.post(
+            reverse("api:regrade_api"),
+            json.dumps({"test_id": self.test.id}),
+            content_type="application/json",
+        )
+        self.assertEqual(
+            {"ok": True, "processed": 1, "updated": 1},
+            {key: value for key, value in response.json().items() if key != "seconds"},
+        )
+        result = UserResult.objects.get(id=self.result.id)
+        self.assertEqual(2, result.right_answers_count)
+        self.assertEqual(
+            {
+                "question_id": str(self.another_question.id),
+                "selected": [1],
+                "right": [1],
+                "is_true": True,
+            },
+            result.questions[1],
+        )
+
+        question = Question.objects.get(id=self.another_question.id)
+        question.options = Question.parse_options(
+            [
+                {"option": "False option", "is_true": True},
+                {"option": "True option", "is_true": False},
+            ]
+        )
+        question.save()
+        response = self.client.post(
+            reverse("api:regrade_api"),
+            json.dumps({"subject_id": self.subject.id}),
+            content_type="application/json",
+        )
+        self.assertEqual(1, response.json()["updated"])
+        result = UserResult.objects.get(id=self.result.id)
+        self.assertEqual(1, result.right_answers_count)
+        self.assertTrue(result.questions[0]["is_true"])
+        self.assertFalse(result.questions[1]["is_true"])
+        self.assertEqual([0], result.questions[1]["right"])
+
+    def test_invalid_ids(self):
+        """
+        Test that re-grading is not started with missing or invalid ids
+        """
+        for data in [{}, {"test_id": "x"}, {"subject_id": [1]}]:
+            response = self.client.post(
+                reverse("api:regrade_api"),
+                json.dumps(data),
+                content_type="application/json",
+            )
+            self.assertEqual(400, response.status_code)
+            self.assertFalse(response.data["ok"])
+
+    def test_command(self):
+        """
+        Test regrade_results management command
+        """
+        out = StringIO()
+        call_command("regrade_results", test=[self.test.id], stdout=out)
+        self.assertIn("Processed: 1, updated: 1", out.getvalue())
+        call_command("regrade_results", test=[self.test.id], stdout=out)
+        self.assertIn("Processed: 1, updated: 0", out.getvalue())
+
+
+class GradingTest(MainTest):
+    """
+    Tests for grading of answers encoded by options indices
+    """
+
+    def setUp(self) -> None:
+        super().setUp()
+        self.session = RunningTestsAnswers(
+            test=self.test,
+            user=self.student,
+            test_duration=self.test.duration,
+            seed=0,
+            layout=pack_layout(
+                [(self.question.id, [2, 0, 1]), (self.another_question.id, [1, 0])]
+            ),
+        )
+
+    def test_parse_answers(self):
+        """
+        Test parsing of single, multiselect and sequence answers
+        """
+        self.assertEqual(
+            {1: [1], 2: [0, 2], 3: [2, 0, 1]},
+            parse_answers(
+                {
+                    "1": ["1"],
+                    "2_0": ["on"],
+                    "2_2": ["on"],
+                    "3": ["2", "0", "1"],
+                    "time": ["10"],
+                    "csrfmiddlewaretoken": ["token"],
+                }
+            ),
+        )
+
+    def test_grade_session(self):
+        """
+        Test that answers are graded and saved by canonical options indices
+        regardless of options order shown to user
+        """
+        result = grade_session(
+            {"1_0": ["on"], "1_2": ["on"], "2": ["0"], "time": ["40"]}, self.session
+        )
+        self.assertEqual(self.test.duration - 40, result["time"])
+        self.assertEqual(2, result["tasks_num"])
+        self.assertEqual(1, result["right_answers_count"])
+        self.assertEqual(
+            [
+                {
+                    "question_id": str(self.question.id),
+                    "selected": [0, 2],
+                    "right": [0, 2],
+                    "is_true": True,
+                },
+                {
+                    "question_id": str(self.another_question.id),
+                    "selected": [0],
+                    "right": [1],
+                    "is_true": False,
+                },
+            ],
+            result["questions"],
+        )
+
+    def test_answer_key(self):
+        """
+        Test checking of sequences in order and of other questions as sets
+        """
+        key = AnswerKey.from_question(self.question)
+        self.assertTrue(key.check([2, 0]))
+        self.assertFalse(key.check([0]))
+        self.assertEqual([2, 0], key.decode(["Third true option", "First true option"]))
+        self.assertIsNone(key.decode(["Deleted option"]))
+
+        sequence = Question(
+            type=Question.Type.SEQUENCE,
+            options=[
+                {"option": "Second", "num": 2},
+                {"option": "First", "num": 1},
+            ],
+        )
+        key = AnswerKey.from_question(sequence)
+        self.assertTrue(key.check([1, 0]))
+        self.assertFalse(key.check([0, 1]))
+
+
 #
 # class AuthorizationTest(MainTest):
 #     """